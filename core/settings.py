@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,20 +42,23 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'main.instrumentation.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'main.staticfiles.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'main.routers.PrimaryStickinessMiddleware',
 ]
 
 ROOT_URLCONF = 'core.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'main.instrumentation.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -70,17 +74,117 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'core.wsgi.application'
 
+# Serve the async versions of read views, set by core.asgi
+ASYNC_READ_VIEWS = os.environ.get('DEVBOARD_ASYNC_READ_VIEWS') == '1'
+
 
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
+# Set DEVBOARD_DATABASE_PROFILE=production to keep connections open between
+# requests and tune every new SQLite connection for concurrent access
+
+DATABASE_PROFILE = os.environ.get('DEVBOARD_DATABASE_PROFILE', 'development')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('DEVBOARD_DATABASE_NAME', BASE_DIR / 'db.sqlite3'),
     }
 }
 
+# PRAGMA statements executed on every new SQLite connection
+SQLITE_PRAGMAS = {}
+
+if DATABASE_PROFILE == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 600,
+        # honoured from Django 4.1, SQLite connections do not go stale anyway
+        'CONN_HEALTH_CHECKS': True,
+    })
+    SQLITE_PRAGMAS = {
+        # readers do not block the writer and vice versa
+        'journal_mode': 'WAL',
+        # wait for the write lock instead of failing with "database is locked"
+        'busy_timeout': 5000,
+        # in WAL mode, only fsync at checkpoints
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        # negative values are KiB
+        'cache_size': -64 * 1024,
+        'temp_store': 'MEMORY',
+    }
+
+# DEVBOARD_DATABASE_REPLICAS=<n> adds n read replicas, SQLite copies of the
+# primary kept fresh by `python manage.py sync_replicas`. Safe requests of the
+# list and detail views read from them, unless the client wrote something in
+# the last REPLICA_STICKY_SECONDS.
+
+DATABASE_REPLICAS = []
+
+for number in range(1, int(os.environ.get('DEVBOARD_DATABASE_REPLICAS', 0)) + 1):
+    alias = f'replica_{number}'
+    DATABASES[alias] = dict(
+        DATABASES['default'],
+        NAME=f"{DATABASES['default']['NAME']}.{alias}",
+        TEST={'MIRROR': 'default'}
+    )
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['main.routers.ReplicaRouter']
+
+REPLICA_STICKY_SECONDS = 10
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+# The local-memory cache is per process, use the file-based backend to share
+# fragments between workers without an outside service:
+#     'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+#     'LOCATION': BASE_DIR / 'cache',
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fragments',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+    'auth': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'auth',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+}
+
+# Sessions and logged users are read from the auth cache (see main.auth). In
+# production, workers share it through files, so a logout or a password change
+# in one worker is seen by the others.
+
+if DATABASE_PROFILE == 'production':
+    CACHES['auth'].update({
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'auth',
+    })
+
+AUTH_CACHE_ALIAS = 'auth'
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+SESSION_CACHE_ALIAS = AUTH_CACHE_ALIAS
+
+AUTHENTICATION_BACKENDS = ['main.auth.CachedModelBackend']
+
+USER_CACHE_VERSION = 1
+
+USER_CACHE_TIMEOUT = 60 * 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -118,7 +222,100 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Filled by collectstatic and served by main.staticfiles.StaticFilesMiddleware.
+# Without DEBUG, files are collected under hashed names, with gzip and brotli
+# copies, and cached by browsers for a year.
+
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+if not DEBUG:
+    STATICFILES_STORAGE = 'main.staticfiles.CompressedManifestStaticFilesStorage'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Comment threads
+# Replies nest up to COMMENT_MAX_DEPTH levels. Each level adds a step of
+# COMMENT_PATH_STEP_WIDTH base 36 digits to the comment path, which bounds the
+# replies of a comment to 36 ** width - 1. Changing the width requires
+# rewriting the paths of existing comments.
+
+COMMENT_MAX_DEPTH = 8
+
+COMMENT_PATH_STEP_WIDTH = 4
+
+
+# Follow suggestions
+# Users see who to follow on their own page, ranked by the follow graph held
+# in memory by every process (see main.graph), which is loaded again every
+# FOLLOW_GRAPH_MAX_AGE seconds to see the follows of other processes.
+
+FOLLOW_GRAPH_MAX_AGE = 60 * 10
+
+FOLLOW_SUGGESTION_LIMIT = 5
+
+
+# Home timeline
+# Posts are copied to the timeline of every follower when created, unless the
+# author has at least TIMELINE_FANOUT_MAX_FOLLOWERS followers: those posts are
+# merged in when the timeline is read.
+
+TIMELINE_FANOUT_MAX_FOLLOWERS = 1000
+
+TIMELINE_FANOUT_BATCH_SIZE = 500
+
+TIMELINE_BACKFILL_SIZE = 20
+
+TIMELINE_PAGE_SIZE = 20
+
+
+# Fragment cache
+# Rendered post and comment blocks, bump FRAGMENT_CACHE_VERSION when their
+# templates change.
+
+FRAGMENT_CACHE_ALIAS = 'fragments'
+
+FRAGMENT_CACHE_VERSION = 1
+
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+# Batch vote ingestion
+
+VOTE_BATCH_MAX_SIZE = 50000
+
+VOTE_BATCH_CHUNK_SIZE = 1000
+
+
+# Write-behind votes
+# When enabled, vote views append to a local journal instead of writing to
+# the database, and `python manage.py flush_votes` commits the journal in
+# batches every VOTE_FLUSH_INTERVAL seconds.
+
+VOTE_WRITE_BEHIND = False
+
+VOTE_JOURNAL_PATH = BASE_DIR / 'journal' / 'votes.jsonl'
+
+VOTE_JOURNAL_FSYNC = True
+
+VOTE_FLUSH_INTERVAL = 1.0
+
+VOTE_FLUSH_BATCH_SIZE = 1000
+
+
+# Request timing
+# A share of REQUEST_TIMING_SAMPLE_RATE requests (0 disables, 1 times every
+# request) get a Server-Timing header with their view, SQL and template times.
+# Those slower than REQUEST_TIMING_SLOW_MS are logged with their slowest
+# queries and the queries repeated REQUEST_TIMING_DUPLICATE_QUERIES times.
+
+REQUEST_TIMING_SAMPLE_RATE = float(os.environ.get('DEVBOARD_REQUEST_TIMING_SAMPLE_RATE', 0))
+
+REQUEST_TIMING_SLOW_MS = 500
+
+REQUEST_TIMING_SLOWEST_QUERIES = 5
+
+REQUEST_TIMING_DUPLICATE_QUERIES = 3
@@ -0,0 +1,298 @@
+"""
+Read-only JSON API.
+
+Lists are keyset paginated newest first: they take ?limit= (up to
+API_MAX_PAGE_SIZE) and ?after=, the "next" cursor of the previous page.
+Sparse fieldsets choose the fields of each type of object returned, e.g.
+?fields[post]=id,title,comments&fields[comment]=body, and only the columns of
+the chosen fields are read.
+
+Responses are streamed: rows are read with .values() in chunks of
+API_CHUNK_SIZE and serialized as they come, so memory does not grow with the
+response and the first bytes are sent before the last rows are read. The
+ASGI handler of Django iterates streamed responses on its event loop, where
+queries are not allowed, so under ASGI the content is read in the thread of
+the view and sent whole.
+"""
+import json
+from itertools import islice
+from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from main.conditional import (
+    conditional,
+    post_detail_validators,
+    post_list_validators,
+    user_detail_validators
+)
+from main.models import (
+    Post,
+    Comment,
+    Follow
+)
+from main.pagination import (
+    InvalidCursor,
+    decode_cursor,
+    encode_cursor,
+    keyset_filter
+)
+from main.routers import read_from_replica
+
+
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+API_CHUNK_SIZE = 500
+
+# type -> field -> the column or expression read for it
+FIELDS = {
+    'post': {
+        'id': 'id',
+        'title': 'title',
+        'body': 'body',
+        'created_at': 'created_at',
+        'user': 'user_id',
+        'upvote_count': 'upvote_count',
+        'downvote_count': 'downvote_count',
+        'comment_count': 'comment_count',
+    },
+    'comment': {
+        'id': 'id',
+        'body': 'body',
+        'created_at': 'created_at',
+        'post': 'post_id',
+        'parent': 'parent_id',
+        'user': 'user_id',
+        'upvote_count': 'upvote_count',
+        'downvote_count': 'downvote_count',
+    },
+    'user': {
+        'id': 'id',
+        'username': 'username',
+        'date_joined': 'date_joined',
+        'follower_count': Coalesce(F('stats__follower_count'), 0),
+        'followed_count': Coalesce(F('stats__followed_count'), 0),
+    },
+    'follow': {
+        'follower': 'follower_id',
+        'followed': 'followed_id',
+        'created_at': 'created_at',
+    },
+}
+
+# type -> field holding a list of objects of another type
+NESTED_FIELDS = {
+    'post': {'comments': 'comment'},
+}
+
+
+class InvalidParameter(Exception):
+    pass
+
+
+def chosen_fields(request, type):
+    """
+    Returns the fields of type chosen by ?fields[type]=, every field when it
+    is missing. Raises InvalidParameter on unknown fields.
+    """
+    available = list(FIELDS[type]) + list(NESTED_FIELDS.get(type, {}))
+    value = request.GET.get(f'fields[{type}]')
+    if value is None:
+        return available
+    fields = [field for field in value.split(',') if field]
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise InvalidParameter(f'Unknown fields of {type}: {", ".join(unknown)}')
+    if not fields:
+        raise InvalidParameter(f'No fields of {type} chosen')
+    return fields
+
+
+def page_limit(request):
+    try:
+        limit = int(request.GET.get('limit', API_PAGE_SIZE))
+    except ValueError:
+        raise InvalidParameter('Invalid limit')
+    return min(max(limit, 1), API_MAX_PAGE_SIZE)
+
+
+def select(queryset, type, fields, extra=()):
+    """
+    Returns queryset as dicts holding the columns of fields of type, plus the
+    extra columns, read from the database chosen for the request.
+    """
+    columns = [FIELDS[type][field] for field in fields if field in FIELDS[type]]
+    names = [column for column in columns if isinstance(column, str)]
+    names += [column for column in extra if column not in names]
+    expressions = {
+        field: FIELDS[type][field] for field in fields
+        if field in FIELDS[type] and not isinstance(FIELDS[type][field], str)
+    }
+    # responses are streamed after the view returns, when the database chosen
+    # by read_from_replica is no longer set, so it is pinned here
+    return queryset.using(queryset.db).values(*names, **expressions)
+
+
+def serialize(row, type, fields):
+    return {
+        field: row[column] if isinstance(column, str) else row[field]
+        for field, column in FIELDS[type].items() if field in fields
+    }
+
+
+def dumps(value):
+    return json.dumps(value, cls=DjangoJSONEncoder)
+
+
+def stream_array(objects):
+    # one piece per chunk of objects, not per object
+    yield '['
+    separator = ''
+    objects = iter(objects)
+    while chunk := list(islice(objects, API_CHUNK_SIZE)):
+        yield separator + ','.join(dumps(value) for value in chunk)
+        separator = ','
+    yield ']'
+
+
+def stream_object(row, type, fields, nested):
+    """
+    Streams row as a JSON object, its nested lists (field -> (queryset, type,
+    fields)) last, read in chunks.
+    """
+    plain = dumps(serialize(row, type, fields))
+    if not nested:
+        yield plain
+        return
+    yield plain[:-1]
+    separator = ',' if plain != '{}' else ''
+    for field, (queryset, nested_type, nested_fields) in nested.items():
+        yield f'{separator}{dumps(field)}:'
+        yield from stream_array(
+            serialize(nested_row, nested_type, nested_fields)
+            for nested_row in queryset.iterator(chunk_size=API_CHUNK_SIZE)
+        )
+        separator = ','
+    yield '}'
+
+
+def stream_page(queryset, type, fields, limit, keys):
+    """
+    Streams {"data": [...], "next": cursor} from queryset, ordered newest
+    first on keys and holding one more row than limit when there is a next
+    page. The cursor is written last, once the rows are read.
+    """
+    next_cursor = None
+
+    def objects():
+        nonlocal next_cursor
+        last = None
+        for position, row in enumerate(queryset.iterator(chunk_size=API_CHUNK_SIZE)):
+            if position == limit:
+                next_cursor = encode_cursor(last[key] for key in keys)
+                return
+            last = row
+            yield serialize(row, type, fields)
+
+    yield '{"data":'
+    yield from stream_array(objects())
+    yield f',"next":{dumps(next_cursor)}}}'
+
+
+def json_response(request, content):
+    """
+    Returns the JSON pieces of content, streamed but under ASGI.
+    """
+    if isinstance(request, ASGIRequest):
+        return HttpResponse(''.join(content), content_type='application/json')
+    return StreamingHttpResponse(content, content_type='application/json')
+
+
+def error_response(message):
+    return JsonResponse({'error': message}, status=400)
+
+
+def list_response(request, queryset, type, keys):
+    try:
+        fields = chosen_fields(request, type)
+        limit = page_limit(request)
+        after = request.GET.get('after')
+        if after is not None:
+            values = decode_cursor(after, queryset.model, keys)
+            queryset = queryset.filter(keyset_filter(keys, values, 'lt'))
+    except InvalidParameter as error:
+        return error_response(str(error))
+    except InvalidCursor:
+        return error_response('Invalid cursor')
+    queryset = queryset.order_by(*[f'-{key}' for key in keys])[:limit + 1]
+    return json_response(
+        request,
+        stream_page(select(queryset, type, fields, extra=keys), type, fields, limit, keys)
+    )
+
+
+@read_from_replica
+@conditional(post_list_validators)
+def post_list_view(request):
+    return list_response(request, Post.objects.all(), 'post', ['created_at', 'id'])
+
+
+@read_from_replica
+@conditional(post_detail_validators)
+def post_detail_view(request, id):
+    # the post with all of its comments, in thread order as on the post page
+    try:
+        fields = chosen_fields(request, 'post')
+        comment_fields = chosen_fields(request, 'comment') if 'comments' in fields else None
+    except InvalidParameter as error:
+        return error_response(str(error))
+    post = get_object_or_404(select(Post.objects.all(), 'post', fields), id=id)
+    nested = {}
+    if comment_fields is not None:
+        comments = Comment.objects.filter(post_id=id).order_by('path')
+        nested['comments'] = (select(comments, 'comment', comment_fields), 'comment', comment_fields)
+    return json_response(request, stream_object(post, 'post', fields, nested))
+
+
+@read_from_replica
+def post_comment_list_view(request, id):
+    get_object_or_404(Post.objects.only('id'), id=id)
+    return list_response(request, Comment.objects.filter(post_id=id), 'comment', ['created_at', 'id'])
+
+
+@read_from_replica
+def user_list_view(request):
+    return list_response(request, User.objects.all(), 'user', ['id'])
+
+
+@read_from_replica
+@conditional(user_detail_validators)
+def user_detail_view(request, id):
+    try:
+        fields = chosen_fields(request, 'user')
+    except InvalidParameter as error:
+        return error_response(str(error))
+    user = get_object_or_404(select(User.objects.all(), 'user', fields), id=id)
+    return JsonResponse(serialize(user, 'user', fields), encoder=DjangoJSONEncoder)
+
+
+# relation -> the column holding the user of the url, as in the user detail
+USER_FOLLOWS = {
+    'followers': 'followed_id',
+    'followeds': 'follower_id',
+}
+
+
+def user_follow_list_validators(request, id, relation):
+    return user_detail_validators(request, id)
+
+
+@read_from_replica
+@conditional(user_follow_list_validators)
+def user_follow_list_view(request, id, relation):
+    get_object_or_404(User.objects.only('id'), id=id)
+    follows = Follow.objects.filter(**{USER_FOLLOWS[relation]: id})
+    return list_response(request, follows, 'follow', ['created_at', 'id'])
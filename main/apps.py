@@ -1,6 +1,20 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save
 
 
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        from django.contrib.auth.models import User
+        from main.auth import evict_user
+        from main.database import configure_connection
+        from main.instrumentation import install_query_recorder
+        from main.search import create_triggers
+        connection_created.connect(configure_connection)
+        connection_created.connect(install_query_recorder)
+        post_migrate.connect(create_triggers, sender=self)
+        post_save.connect(evict_user, sender=User)
+        post_delete.connect(evict_user, sender=User)
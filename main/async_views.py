@@ -0,0 +1,34 @@
+"""
+Async versions of the read views with independent queries, served instead
+of the sync ones by the ASGI application (see ASYNC_READ_VIEWS). Queries run
+concurrently in worker threads, and templates render with everything loaded.
+"""
+from asgiref.sync import sync_to_async
+from django.shortcuts import render
+from main.conditional import (
+    conditional,
+    post_detail_validators,
+    user_detail_validators
+)
+from main.loading import aload
+from main.routers import read_from_replica
+from main.views import (
+    post_detail_queries,
+    render_post_detail,
+    user_detail_queries
+)
+
+
+@read_from_replica
+@conditional(user_detail_validators)
+async def user_detail_view(request, id):
+    # the user was resolved by the validators
+    context = await aload(user_detail_queries(id, request.user.id))
+    return await sync_to_async(render)(request, 'main/user/detail.html', context)
+
+
+@read_from_replica
+@conditional(post_detail_validators)
+async def post_detail_view(request, id):
+    context = await aload(post_detail_queries(id))
+    return await sync_to_async(render_post_detail)(request, **context)
@@ -0,0 +1,39 @@
+"""
+Resolution of the logged user without queries.
+
+Sessions are stored by the cached_db engine in the AUTH_CACHE_ALIAS cache and
+CachedModelBackend reads users from the same cache, so once both are cached a
+request of a logged user makes no query before the view runs. Cached users
+are evicted whenever they are saved or deleted, which covers password changes
+and the last_login update of every login; users changed with
+QuerySet.update() are served stale for up to USER_CACHE_TIMEOUT. Bump
+USER_CACHE_VERSION when the User model changes.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+
+
+def user_cache_key(user_id):
+    return f'user:{user_id}'
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    The model backend, reading users of sessions from the auth cache.
+    """
+
+    def get_user(self, user_id):
+        cache = caches[settings.AUTH_CACHE_ALIAS]
+        key = user_cache_key(user_id)
+        user = cache.get(key, version=settings.USER_CACHE_VERSION)
+        if user is None:
+            # inactive and missing users are not cached, they are rare
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, settings.USER_CACHE_TIMEOUT, version=settings.USER_CACHE_VERSION)
+        return user
+
+
+def evict_user(sender, instance, **kwargs):
+    caches[settings.AUTH_CACHE_ALIAS].delete(user_cache_key(instance.pk), version=settings.USER_CACHE_VERSION)
@@ -0,0 +1,49 @@
+"""
+NDJSON dumps of a board, written by export_board and read by import_board.
+
+Every line is one row, {"type": "post", "id": 1, "user_id": 1, ...}, holding
+the columns of its model with foreign keys as ids. Types come in the order of
+BOARD_TYPES, so rows only point to rows written above them. Files ending in
+.gz are gzip compressed.
+"""
+import gzip
+from datetime import datetime
+from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from main.models import (
+    Post,
+    Comment,
+    Vote,
+    Follow
+)
+
+
+BOARD_TYPES = {
+    'user': User,
+    'post': Post,
+    'comment': Comment,
+    'vote': Vote,
+    'follow': Follow,
+}
+
+
+def open_board(path, mode):
+    if str(path).endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def board_fields(model):
+    return model._meta.concrete_fields
+
+
+class BoardEncoder(DjangoJSONEncoder):
+    """
+    Encodes datetimes with their microseconds, which DjangoJSONEncoder drops,
+    so rows come back unchanged.
+    """
+
+    def default(self, value):
+        if isinstance(value, datetime):
+            return value.isoformat()
+        return super().default(value)
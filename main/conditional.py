@@ -0,0 +1,107 @@
+import asyncio
+import hashlib
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.db.models import Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from main.graph import follow_graph
+from main.models import Post
+
+
+def conditional(validators):
+    """
+    Answers GET and HEAD requests with 304 Not Modified when the ETag or the
+    Last-Modified computed by validators(request, *args, **kwargs) match the
+    request, without calling the view. validators returns a tuple
+    (etag, last_modified), or None to always call the view (e.g. to 404).
+    Works on sync and async views.
+    """
+    def decorator(view):
+        def get_validators(request, *args, **kwargs):
+            etag, last_modified = validators(request, *args, **kwargs) or (None, None)
+            etag = quote_etag(etag) if etag is not None else None
+            last_modified = int(last_modified.timestamp()) if last_modified is not None else None
+            return etag, last_modified
+
+        def add_validators(response, etag, last_modified):
+            if last_modified is not None and not response.has_header('Last-Modified'):
+                response.headers['Last-Modified'] = http_date(last_modified)
+            if etag is not None:
+                response.headers.setdefault('ETag', etag)
+            return response
+
+        if asyncio.iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return await view(request, *args, **kwargs)
+                etag, last_modified = await sync_to_async(get_validators)(request, *args, **kwargs)
+                response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return add_validators(response, etag, last_modified)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            etag, last_modified = get_validators(request, *args, **kwargs)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            return add_validators(response, etag, last_modified)
+        return wrapper
+    return decorator
+
+
+def make_etag(request, *parts):
+    """
+    Hashes the parts of a page version, with the url and what the page shows
+    of the request: the logged user (navbar) and the CSRF token of its forms,
+    so the ETag is never shared between users, nor kept after a login rotates
+    the token.
+    """
+    parts = (request.user.id, request.META.get('CSRF_COOKIE'), request.get_full_path()) + parts
+    return hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def post_list_validators(request):
+    # every new post, vote and comment bumps some post changed_at, and the
+    # latest one is read from the changed_at index
+    last_modified = Post.objects.aggregate(last_modified=Max('changed_at'))['last_modified']
+    return make_etag(request, last_modified), last_modified
+
+
+def post_detail_validators(request, id):
+    try:
+        post = Post.objects.values('changed_at', 'upvote_count', 'downvote_count', 'comment_count').get(id=id)
+    except (Post.DoesNotExist, ValueError):
+        return None
+    etag = make_etag(
+        request,
+        post['changed_at'],
+        post['upvote_count'],
+        post['downvote_count'],
+        post['comment_count']
+    )
+    return etag, post['changed_at']
+
+
+def user_detail_validators(request, id, section=None):
+    try:
+        user = User.objects.values('date_joined', 'last_login', 'stats__changed_at').get(id=id)
+    except (User.DoesNotExist, ValueError):
+        return None
+    last_modified = max(
+        moment for moment in (user['date_joined'], user['last_login'], user['stats__changed_at'])
+        if moment is not None
+    )
+    # follow suggestions on their own page change with the follows of others
+    graph_version = None
+    if section is None and str(request.user.id) == str(id):
+        graph = follow_graph()
+        graph_version = (graph.loaded_at, graph.version)
+    return make_etag(request, last_modified, graph_version), last_modified
@@ -0,0 +1,12 @@
+from django.conf import settings
+
+
+def configure_connection(sender, connection, **kwargs):
+    """
+    Applies SQLITE_PRAGMAS to every new SQLite connection.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
@@ -28,4 +28,6 @@ class PostCommentCreateForm(forms.ModelForm):
 
     class Meta:
         model = Comment
-        fields = ['body']
+        fields = ['body', 'parent']
+        # hidden, so rendering the form does not list every comment
+        widgets = {'parent': forms.HiddenInput}
@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+
+class Fragment:
+    """
+    A template rendered once and then served from the fragment cache.
+
+    Posts and comments can not change after creation, so their content is
+    keyed by id and creation time alone; vote tallies are keyed by the
+    counter values, which are bumped in the same transaction as every vote.
+    """
+
+    def __init__(self, key, template_name, context):
+        self.key = key
+        self.template_name = template_name
+        self.context = context
+
+
+def post_body_fragment(post):
+    return Fragment(f'post:{post.id}:{post.created_at.timestamp()}:body', 'main/post/fragments/post_body.html', {'post': post})
+
+
+def post_votes_fragment(post):
+    return Fragment(
+        f'post:{post.id}:votes:{post.upvote_count}:{post.downvote_count}',
+        'main/post/fragments/votes.html',
+        {'upvote_count': post.upvote_count, 'downvote_count': post.downvote_count}
+    )
+
+
+def comment_body_fragment(comment):
+    return Fragment(f'comment:{comment.id}:{comment.created_at.timestamp()}:body', 'main/post/fragments/comment_body.html', {'comment': comment})
+
+
+def comment_votes_fragment(comment):
+    return Fragment(
+        f'comment:{comment.id}:votes:{comment.upvote_count}:{comment.downvote_count}',
+        'main/post/fragments/votes.html',
+        {'upvote_count': comment.upvote_count, 'downvote_count': comment.downvote_count}
+    )
+
+
+def render_fragments(fragments):
+    """
+    Returns the html of fragments in order, fetching all of them from the
+    cache in one call and rendering only the missing ones.
+    """
+    cache = caches[settings.FRAGMENT_CACHE_ALIAS]
+    version = settings.FRAGMENT_CACHE_VERSION
+    cached = cache.get_many([fragment.key for fragment in fragments], version=version)
+    missing = {}
+    for fragment in fragments:
+        if fragment.key not in cached and fragment.key not in missing:
+            missing[fragment.key] = render_to_string(fragment.template_name, fragment.context)
+    if missing:
+        cache.set_many(missing, settings.FRAGMENT_CACHE_TIMEOUT, version=version)
+    return [
+        mark_safe(cached[fragment.key] if fragment.key in cached else missing[fragment.key])
+        for fragment in fragments
+    ]
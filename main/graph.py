@@ -0,0 +1,169 @@
+"""
+The follow graph held in memory, for "who to follow" suggestions.
+
+FollowGraph stores follows as compressed sparse rows: sources holds the ids
+of the users following someone, sorted, and the i-th of them follows the ids
+targets[offsets[i]:offsets[i + 1]], sorted too. Ids are packed in arrays of
+8 byte integers instead of Python objects. Follows created or deleted after
+loading are kept aside, in added and removed, and merged in when reading.
+
+The graph is loaded from the primary once per process, on first use, and
+updated by the follow views of the process. Every FOLLOW_GRAPH_MAX_AGE
+seconds it is loaded again, which brings in the follows made by other
+processes and commands: one request builds the new graph while the others
+keep reading the old one, and the changes made meanwhile are applied to the
+new graph before it replaces the old one.
+"""
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from main.models import Follow
+
+
+class FollowGraph:
+
+    def __init__(self, sources, offsets, targets):
+        self.sources = sources
+        self.offsets = offsets
+        self.targets = targets
+        # follower id -> followed ids, since loading
+        self.added = {}
+        self.removed = {}
+        self.loaded_at = time.monotonic()
+        # bumped by every change, for the validators of pages showing it
+        self.version = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, chunk_size=10000):
+        sources, offsets, targets = array('q'), array('q', [0]), array('q')
+        # read in the order of the (follower, followed) unique index, from
+        # the primary, as the changes applied after loading are committed there
+        rows = Follow.objects.using(DEFAULT_DB_ALIAS).order_by('follower_id', 'followed_id') \
+            .values_list('follower_id', 'followed_id') \
+            .iterator(chunk_size=chunk_size)
+        for follower_id, followed_id in rows:
+            if not sources or sources[-1] != follower_id:
+                if sources:
+                    offsets.append(len(targets))
+                sources.append(follower_id)
+            targets.append(followed_id)
+        if sources:
+            offsets.append(len(targets))
+        return cls(sources, offsets, targets)
+
+    def loaded_followeds(self, user_id):
+        position = bisect_left(self.sources, user_id)
+        if position == len(self.sources) or self.sources[position] != user_id:
+            return array('q')
+        return self.targets[self.offsets[position]:self.offsets[position + 1]]
+
+    def followeds(self, user_id):
+        followeds = self.loaded_followeds(user_id)
+        removed = self.removed.get(user_id)
+        added = self.added.get(user_id)
+        if not removed and not added:
+            return followeds
+        return [id for id in followeds if id not in (removed or ())] + list(added or ())
+
+    def change(self, follower_id, followed_id, following):
+        followeds = self.loaded_followeds(follower_id)
+        position = bisect_left(followeds, followed_id)
+        loaded = position < len(followeds) and followeds[position] == followed_id
+        with self.lock:
+            # a change undoing the other set only needs removing from it
+            undone, done = (self.removed, self.added) if following else (self.added, self.removed)
+            if followed_id in undone.get(follower_id, ()):
+                undone[follower_id].discard(followed_id)
+            elif loaded != following:
+                done.setdefault(follower_id, set()).add(followed_id)
+            self.version += 1
+
+    def suggestions(self, user_id, limit):
+        """
+        Returns up to limit (id, count) of the users followed by the most users
+        user_id follows, counting them, without the users user_id follows.
+        Ties go to the lowest ids.
+        """
+        with self.lock:
+            followeds = self.followeds(user_id)
+            counts = Counter()
+            for followed_id in followeds:
+                counts.update(self.followeds(followed_id))
+        counts.pop(user_id, None)
+        for followed_id in followeds:
+            counts.pop(followed_id, None)
+        return heapq.nsmallest(limit, counts.items(), key=lambda item: (-item[1], item[0]))
+
+
+_graph = None
+# follow changes made while the graph is reloaded, None when it is not
+_pending_changes = None
+# guards the two above, never held while loading
+_graph_lock = threading.Lock()
+# held by the thread loading the graph
+_load_lock = threading.Lock()
+
+
+def expired(graph):
+    return graph is None or time.monotonic() - graph.loaded_at > settings.FOLLOW_GRAPH_MAX_AGE
+
+
+def follow_graph():
+    graph = _graph
+    if not expired(graph):
+        return graph
+    # while another thread reloads, the expired graph is still served; only
+    # the first load is waited for
+    if not _load_lock.acquire(blocking=graph is None):
+        return graph
+    try:
+        graph = _graph
+        if expired(graph):
+            graph = reload_follow_graph()
+        return graph
+    finally:
+        _load_lock.release()
+
+
+def reload_follow_graph():
+    global _graph, _pending_changes
+    with _graph_lock:
+        _pending_changes = []
+    try:
+        graph = FollowGraph.load()
+    except BaseException:
+        with _graph_lock:
+            _pending_changes = None
+        raise
+    with _graph_lock:
+        # changes already loaded leave the graph as it is
+        for change in _pending_changes:
+            graph.change(*change)
+        _pending_changes = None
+        _graph = graph
+    return graph
+
+
+def follow_changed(follower_id, followed_id, following):
+    """
+    Applies a committed follow, or unfollow if not following, to the graph of
+    this process. A graph not loaded yet will read it from the database.
+    """
+    with _graph_lock:
+        if _pending_changes is not None:
+            _pending_changes.append((follower_id, followed_id, following))
+        graph = _graph
+    if graph is not None:
+        graph.change(follower_id, followed_id, following)
+
+
+def clear_follow_graph():
+    global _graph
+    with _graph_lock:
+        _graph = None
@@ -0,0 +1,224 @@
+"""
+Per-request timing.
+
+RequestTimingMiddleware times a sample of requests (REQUEST_TIMING_SAMPLE_RATE)
+and reports, in a Server-Timing header, the time spent in the view, in SQL
+queries and in template rendering. Requests slower than REQUEST_TIMING_SLOW_MS
+are logged with their slowest queries and the queries repeated at least
+REQUEST_TIMING_DUPLICATE_QUERIES times, the usual sign of an N+1 pattern.
+
+Queries are recorded by an execute wrapper installed on every connection, and
+templates are timed by the TimedDjangoTemplates backend. On requests that are
+not sampled, both only read a context variable, so the middleware can stay
+installed in production. The middleware runs sync or async, and async views
+may run queries in several threads at once, so the recorder is locked.
+
+Streamed responses are timed until the view returns them: the time spent and
+the queries run while their content is sent come after the headers and are
+not counted.
+"""
+import asyncio
+import heapq
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates
+
+
+logger = logging.getLogger(__name__)
+
+# recorder of the request being timed, None when the request is not sampled
+current_timing = ContextVar('current_timing', default=None)
+
+
+class RequestTiming:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # set by process_view, so the view time includes the response phase
+        # of inner middleware, and nothing when a middleware answers early
+        self.view_started = None
+        self.query_count = 0
+        self.query_time = 0.0
+        # sql -> [count, total time], sql keeps its placeholders, so queries
+        # differing only by parameters are grouped
+        self.queries = {}
+        self.slowest = []
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.lock = threading.Lock()
+
+    def record_query(self, sql, duration):
+        with self.lock:
+            self.query_count += 1
+            self.query_time += duration
+            stats = self.queries.setdefault(sql, [0, 0.0])
+            stats[0] += 1
+            stats[1] += duration
+            entry = (duration, self.query_count, sql)
+            if len(self.slowest) < settings.REQUEST_TIMING_SLOWEST_QUERIES:
+                heapq.heappush(self.slowest, entry)
+            else:
+                heapq.heappushpop(self.slowest, entry)
+
+    def template_started(self):
+        with self.lock:
+            self.template_depth += 1
+
+    def template_finished(self, duration):
+        with self.lock:
+            self.template_depth -= 1
+            if self.template_depth == 0:
+                self.template_time += duration
+
+    def slowest_queries(self):
+        return [(sql, duration) for duration, _, sql in sorted(self.slowest, reverse=True)]
+
+    def duplicate_queries(self):
+        return sorted(
+            ((sql, count, total) for sql, (count, total) in self.queries.items()
+             if count >= settings.REQUEST_TIMING_DUPLICATE_QUERIES),
+            key=lambda duplicate: duplicate[1],
+            reverse=True
+        )
+
+    def server_timing(self, finished):
+        metrics = [
+            f'db;dur={self.query_time * 1000:.1f};desc="{self.query_count} queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+        ]
+        if self.view_started is not None:
+            metrics.append(f'view;dur={(finished - self.view_started) * 1000:.1f}')
+        metrics.append(f'total;dur={(finished - self.started) * 1000:.1f}')
+        return ', '.join(metrics)
+
+
+def record_query(execute, sql, params, many, context):
+    timing = current_timing.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timing.record_query(sql, time.perf_counter() - started)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """
+    Adds record_query to the execute wrappers of every new connection.
+    """
+    # connection_created is sent again when a connection reconnects
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class TimedTemplate:
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        timing = current_timing.get()
+        if timing is None:
+            return self.template.render(context, request)
+        # templates rendered while rendering another are already timed
+        timing.template_started()
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            timing.template_finished(time.perf_counter() - started)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, timing renders of sampled requests.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class RequestTimingMiddleware:
+    """
+    Times a sample of requests, see the module docstring. Install it first,
+    so the total covers every other middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # marks the instance as a coroutine function to the handler
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        timing = self.sample()
+        if timing is None:
+            return self.get_response(request)
+        token = current_timing.set(timing)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timing.reset(token)
+        return self.report(request, response, timing)
+
+    async def __acall__(self, request):
+        timing = self.sample()
+        if timing is None:
+            return await self.get_response(request)
+        token = current_timing.set(timing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timing.reset(token)
+        return self.report(request, response, timing)
+
+    def sample(self):
+        """
+        Returns the recorder of a sampled request, None for the others.
+        """
+        rate = settings.REQUEST_TIMING_SAMPLE_RATE
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return None
+        return RequestTiming()
+
+    def report(self, request, response, timing):
+        finished = time.perf_counter()
+        response.headers['Server-Timing'] = timing.server_timing(finished)
+        total = finished - timing.started
+        if total * 1000 >= settings.REQUEST_TIMING_SLOW_MS:
+            self.log_slow_request(request, response, timing, total)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timing = current_timing.get()
+        if timing is not None:
+            timing.view_started = time.perf_counter()
+
+    def log_slow_request(self, request, response, timing, total):
+        lines = [
+            f'Slow request: {request.method} {request.get_full_path()} {response.status_code} '
+            f'in {total * 1000:.1f}ms, {timing.query_count} queries in {timing.query_time * 1000:.1f}ms, '
+            f'templates in {timing.template_time * 1000:.1f}ms'
+        ]
+        for sql, duration in timing.slowest_queries():
+            lines.append(f'  slow query {duration * 1000:.1f}ms: {sql}')
+        for sql, count, duration in timing.duplicate_queries():
+            lines.append(f'  repeated query x{count} in {duration * 1000:.1f}ms: {sql}')
+        logger.warning('\n'.join(lines))
@@ -0,0 +1,158 @@
+"""
+Write-behind vote journal.
+
+Vote views append one JSON line per vote to VOTE_JOURNAL_PATH and return
+without touching the database. The flusher (see the flush_votes command)
+renames the journal to a numbered segment, so writers start a new file, and
+commits the segment in batches before deleting it. A flusher holds an
+exclusive lock on the segment it commits, so concurrent flushers never
+commit the same segment twice.
+
+Replaying a segment is idempotent: every vote creates the vote of its user on
+its target or switches the existing one in place, never adding a second one,
+so a segment left behind by a crash is simply replayed from the start and
+leaves every user with their last vote of the segment, without losing or
+duplicating votes.
+"""
+import fcntl
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from django.conf import settings
+
+
+SEGMENT_SUFFIX = '.flushing'
+
+
+def journal_path():
+    return Path(settings.VOTE_JOURNAL_PATH)
+
+
+@contextmanager
+def journal_lock(operation):
+    # writers share the lock while appending, the flusher takes it exclusively
+    # to rotate, so no vote can be appended to a segment being flushed
+    path = journal_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(f'{path}.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def ends_mid_line(journal):
+    """
+    Returns whether the journal, open for reading, ends in the middle of a
+    line: torn by a writer which died while appending, or being appended.
+    """
+    size = journal.seek(0, os.SEEK_END)
+    if size == 0:
+        return False
+    journal.seek(size - 1)
+    return journal.read(1) != b'\n'
+
+
+def write_line(journal, line):
+    journal.write(line)
+    journal.flush()
+    if settings.VOTE_JOURNAL_FSYNC:
+        os.fsync(journal.fileno())
+
+
+def append_vote(direction, target, target_id, user_id):
+    line = (json.dumps({
+        'direction': direction,
+        'target': target,
+        'id': target_id,
+        'user': user_id
+    }) + '\n').encode()
+    with journal_lock(fcntl.LOCK_SH):
+        with open(journal_path(), 'a+b') as journal:
+            if not ends_mid_line(journal):
+                write_line(journal, line)
+                return
+    # appended after a torn line, the vote would be skipped with it. Another
+    # writer may also be appending, so the line is ended once every writer
+    # is done, under the exclusive lock
+    with journal_lock(fcntl.LOCK_EX):
+        with open(journal_path(), 'a+b') as journal:
+            if ends_mid_line(journal):
+                line = b'\n' + line
+            write_line(journal, line)
+
+
+def rotate():
+    """
+    Moves the current journal to a new segment, and returns the segments
+    waiting to be flushed, oldest first.
+    """
+    path = journal_path()
+    with journal_lock(fcntl.LOCK_EX):
+        if path.exists() and path.stat().st_size > 0:
+            path.rename(path.with_name(f'{path.name}.{time.time_ns()}{SEGMENT_SUFFIX}'))
+    return sorted(
+        path.parent.glob(f'{path.name}.*{SEGMENT_SUFFIX}'),
+        key=lambda segment: int(segment.name[len(path.name) + 1:-len(SEGMENT_SUFFIX)])
+    )
+
+
+@contextmanager
+def claim_segment(segment):
+    """
+    Yields whether this flusher holds segment: False when another flusher
+    holds it or already deleted it. The lock is held until the block ends.
+    """
+    try:
+        file = open(segment)
+    except FileNotFoundError:
+        yield False
+        return
+    with file:
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        # the flusher holding it before may have deleted it since
+        yield segment.exists()
+
+
+def read_segment(segment, batch_size):
+    """
+    Yields the votes of segment in lists of at most batch_size. Torn lines,
+    left by crashes in the middle of an append, are skipped.
+    """
+    batch = []
+    with open(segment) as lines:
+        for line in lines:
+            try:
+                batch.append(json.loads(line))
+            except ValueError:
+                continue
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def flush(ingest, batch_size=None):
+    """
+    Commits every pending segment with ingest(votes), one batch at a time,
+    and returns the number of votes read.
+    """
+    batch_size = batch_size or settings.VOTE_FLUSH_BATCH_SIZE
+    total = 0
+    for segment in rotate():
+        with claim_segment(segment) as claimed:
+            if not claimed:
+                continue
+            for batch in read_segment(segment, batch_size):
+                ingest(batch)
+                total += len(batch)
+            segment.unlink()
+    return total
@@ -0,0 +1,32 @@
+import asyncio
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+
+def load(queries):
+    """
+    Runs a dict of independent queries (name -> callable) one after another
+    and returns their results by name.
+    """
+    return {name: query() for name, query in queries.items()}
+
+
+def run_in_thread(query):
+    try:
+        return query()
+    finally:
+        # worker threads are reused, give back connections past CONN_MAX_AGE
+        close_old_connections()
+
+
+async def aload(queries):
+    """
+    Runs a dict of independent queries (name -> callable) concurrently, each
+    in a worker thread with its own database connection, and returns their
+    results by name. The first exception raised by a query is propagated.
+    """
+    results = await asyncio.gather(*(
+        sync_to_async(run_in_thread, thread_sensitive=False)(query)
+        for query in queries.values()
+    ))
+    return dict(zip(queries, results))
@@ -0,0 +1,166 @@
+import asyncio
+import io
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+from main.models import Comment, Follow, Post, comment_path_step
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares read latency of the user and post detail views served by '
+        'the sync views under WSGI and the async views under ASGI, on '
+        'throwaway SQLite databases'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds of load per server')
+        parser.add_argument('--users', type=int, default=50, help='Number of users seeded')
+        parser.add_argument('--posts', type=int, default=1000, help='Number of posts seeded')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+        parser.add_argument('--worker', choices=['wsgi', 'asgi'], help='Internal: run the load in this process')
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            return self.run_worker(options)
+
+        results = {}
+        for server in ('wsgi', 'asgi'):
+            with tempfile.TemporaryDirectory() as directory:
+                env = dict(
+                    os.environ,
+                    DEVBOARD_ASYNC_READ_VIEWS='1' if server == 'asgi' else '0',
+                    DEVBOARD_DATABASE_NAME=str(Path(directory) / 'benchmark.sqlite3')
+                )
+                command = [
+                    sys.executable, str(settings.BASE_DIR / 'manage.py'), 'benchmark_asgi', '--worker', server,
+                    '--concurrency', str(options['concurrency']),
+                    '--duration', str(options['duration']),
+                    '--users', str(options['users']),
+                    '--posts', str(options['posts']),
+                ]
+                output = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+                results[server] = json.loads(output)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f'{"server":<8}{"reads/s":>10}{"errors":>8}{"p50":>10}{"p99":>10}')
+        for server, result in results.items():
+            self.stdout.write(
+                f'{server:<8}{result["reads_per_second"]:>10.1f}{result["errors"]:>8}'
+                f'{result["read_ms"]["p50"]:>10.2f}{result["read_ms"]["p99"]:>10.2f}'
+            )
+
+    def seed(self, options):
+        User.objects.bulk_create([
+            User(username=f'benchmark {i}') for i in range(options['users'])
+        ])
+        users = list(User.objects.all())
+        for user in users:
+            for followed in random.sample(users, min(10, len(users))):
+                if followed != user:
+                    Follow.objects.create(follower=user, followed=followed)
+        Post.objects.bulk_create([
+            Post(user=random.choice(users), title=f'Benchmark post {i}', body='Lorem ipsum dolor sit amet')
+            for i in range(options['posts'])
+        ])
+        posts = list(Post.objects.all())
+        Comment.objects.bulk_create([
+            # root comments, with paths unique whatever their post
+            Comment(post=random.choice(posts), user=random.choice(users), body='Lorem ipsum', path=comment_path_step(i + 1))
+            for i in range(options['posts'] * 5)
+        ])
+        call_command('rebuild_counters', stdout=io.StringIO())
+        return (
+            [f'/user/{user.id}/' for user in users] +
+            [f'/post/{post.id}/' for post in posts]
+        )
+
+    def run_worker(self, options):
+        if 'DEVBOARD_DATABASE_NAME' not in os.environ:
+            raise CommandError('The worker only runs on a throwaway database, see --help')
+        if settings.ASYNC_READ_VIEWS != (options['worker'] == 'asgi'):
+            raise CommandError('Set DEVBOARD_ASYNC_READ_VIEWS to match the worker, see --help')
+        call_command('migrate', verbosity=0)
+        urls = self.seed(options)
+
+        reads = []
+        errors = []
+        deadline = time.perf_counter() + options['duration']
+
+        def load_wsgi():
+            client = Client()
+            try:
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    try:
+                        response = client.get(random.choice(urls))
+                    except Exception as error:
+                        errors.append(repr(error))
+                        continue
+                    if response.status_code != 200:
+                        errors.append(f'{response.status_code} {response.request["PATH_INFO"]}')
+                        continue
+                    reads.append(time.perf_counter() - started)
+            finally:
+                connections.close_all()
+
+        async def load_asgi():
+            client = AsyncClient()
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(random.choice(urls))
+                except Exception as error:
+                    errors.append(repr(error))
+                    continue
+                if response.status_code != 200:
+                    errors.append(f'{response.status_code} {response.request["path"]}')
+                    continue
+                reads.append(time.perf_counter() - started)
+
+        async def run_asgi():
+            await asyncio.gather(*(load_asgi() for i in range(options['concurrency'])))
+
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            started = time.perf_counter()
+            if options['worker'] == 'asgi':
+                asyncio.run(run_asgi())
+            else:
+                threads = [threading.Thread(target=load_wsgi) for i in range(options['concurrency'])]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            elapsed = time.perf_counter() - started
+
+        def percentiles(samples):
+            if len(samples) < 2:
+                return {'p50': 0.0, 'p99': 0.0}
+            cuts = statistics.quantiles(samples, n=100)
+            return {'p50': cuts[49] * 1000, 'p99': cuts[98] * 1000}
+
+        self.stdout.write(json.dumps({
+            'server': options['worker'],
+            'concurrency': options['concurrency'],
+            'seconds': elapsed,
+            'reads_per_second': len(reads) / elapsed,
+            'errors': len(errors),
+            'error_samples': errors[:5],
+            'read_ms': percentiles(reads),
+        }))
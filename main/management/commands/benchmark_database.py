@@ -0,0 +1,142 @@
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, override_settings
+from main.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures concurrent read/write throughput of the post and vote views '
+        'under each database profile, on throwaway SQLite databases'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--profiles',
+            nargs='+',
+            default=['development', 'production'],
+            help='Database profiles to compare'
+        )
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=10, help='Seconds of load per profile')
+        parser.add_argument('--write-ratio', type=float, default=0.2, help='Share of requests that vote')
+        parser.add_argument('--posts', type=int, default=2000, help='Number of posts seeded')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+        parser.add_argument('--worker', action='store_true', help='Internal: run the load in this process')
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            return self.run_worker(options)
+
+        results = {}
+        for profile in options['profiles']:
+            with tempfile.TemporaryDirectory() as directory:
+                env = dict(
+                    os.environ,
+                    DEVBOARD_DATABASE_PROFILE=profile,
+                    DEVBOARD_DATABASE_NAME=str(Path(directory) / 'benchmark.sqlite3')
+                )
+                command = [
+                    sys.executable, str(settings.BASE_DIR / 'manage.py'), 'benchmark_database', '--worker',
+                    '--threads', str(options['threads']),
+                    '--duration', str(options['duration']),
+                    '--write-ratio', str(options['write_ratio']),
+                    '--posts', str(options['posts']),
+                ]
+                output = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+                results[profile] = json.loads(output)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f'{"profile":<14}{"reads/s":>10}{"writes/s":>10}{"errors":>8}{"read p50":>10}{"read p99":>10}{"write p50":>10}{"write p99":>10}')
+        for profile, result in results.items():
+            self.stdout.write(
+                f'{profile:<14}{result["reads_per_second"]:>10.1f}{result["writes_per_second"]:>10.1f}{result["errors"]:>8}'
+                f'{result["read_ms"]["p50"]:>10.2f}{result["read_ms"]["p99"]:>10.2f}'
+                f'{result["write_ms"]["p50"]:>10.2f}{result["write_ms"]["p99"]:>10.2f}'
+            )
+
+    def run_worker(self, options):
+        if 'DEVBOARD_DATABASE_NAME' not in os.environ:
+            raise CommandError('The worker only runs on a throwaway database, see --help')
+        call_command('migrate', verbosity=0)
+
+        users = [
+            User.objects.create_user(username=f'benchmark {i}', password='benchmark')
+            for i in range(options['threads'])
+        ]
+        Post.objects.bulk_create([
+            Post(user=users[i % len(users)], title=f'Benchmark post {i}', body='Lorem ipsum dolor sit amet')
+            for i in range(options['posts'])
+        ])
+        post_ids = list(Post.objects.values_list('id', flat=True))
+
+        reads = []
+        writes = []
+        errors = []
+        deadline = time.perf_counter() + options['duration']
+
+        def load(user):
+            client = Client(HTTP_HOST='localhost')
+            client.force_login(user)
+            # every user votes each post at most once, in a private order
+            unvoted = random.sample(post_ids, len(post_ids))
+            try:
+                while time.perf_counter() < deadline:
+                    write = unvoted and random.random() < options['write_ratio']
+                    started = time.perf_counter()
+                    try:
+                        if write:
+                            client.post(f'/post/{unvoted.pop()}/upvote/create/')
+                        elif random.random() < 0.5:
+                            client.get(f'/post/{random.choice(post_ids)}/')
+                        else:
+                            client.get('/post/')
+                    except Exception as error:
+                        errors.append(repr(error))
+                        continue
+                    (writes if write else reads).append(time.perf_counter() - started)
+            finally:
+                connections.close_all()
+
+        with override_settings(ALLOWED_HOSTS=['localhost']):
+            threads = [threading.Thread(target=load, args=(user,)) for user in users]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+
+        def percentiles(samples):
+            if len(samples) < 2:
+                return {'p50': 0.0, 'p99': 0.0}
+            cuts = statistics.quantiles(samples, n=100)
+            return {'p50': cuts[49] * 1000, 'p99': cuts[98] * 1000}
+
+        self.stdout.write(json.dumps({
+            'profile': settings.DATABASE_PROFILE,
+            'pragmas': settings.SQLITE_PRAGMAS,
+            'threads': options['threads'],
+            'seconds': elapsed,
+            'reads_per_second': len(reads) / elapsed,
+            'writes_per_second': len(writes) / elapsed,
+            'errors': len(errors),
+            'error_samples': errors[:5],
+            'read_ms': percentiles(reads),
+            'write_ms': percentiles(writes),
+        }))
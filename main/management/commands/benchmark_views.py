@@ -0,0 +1,269 @@
+import json
+import random
+import resource
+import statistics
+import time
+import tracemalloc
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from main import urls
+from main.models import Post, Comment, Follow
+
+
+PASSWORD = 'correct horse battery staple'
+
+
+class Scenario:
+    """
+    Builds the requests sent to one route of main.urls. Writes use a pool of
+    benchmark users, so every vote and follow is new.
+    """
+
+    def __init__(self, random, users, post_ids, comments, user_ids):
+        self.random = random
+        self.users = users
+        self.post_ids = post_ids
+        self.comments = comments
+        self.user_ids = user_ids
+        self.used = set()
+
+    def user(self):
+        return self.random.choice(self.users)
+
+    def post_id(self):
+        return self.random.choice(self.post_ids)
+
+    def comment(self):
+        return self.random.choice(self.comments)
+
+    def fresh(self, user, kind, choose):
+        # a target user has not voted on or followed yet
+        for _ in range(100):
+            target = choose()
+            if (user.id, kind, target) not in self.used:
+                self.used.add((user.id, kind, target))
+                return target
+        raise CommandError('Not enough data for new votes and follows, generate more with generate_data')
+
+    def new_followed_id(self, user):
+        return self.fresh(user, 'user', lambda: self.random.choice(self.user_ids))
+
+    def new_post_id(self, user):
+        return self.fresh(user, 'post', self.post_id)
+
+    def new_comment(self, user):
+        return self.fresh(user, 'comment', self.comment)
+
+
+# route -> function(scenario, user) returning the (method, path, data) of a
+# request sent as user; every route of main.urls must have one
+SCENARIOS = {
+    '': lambda s, user: ('get', '/', None),
+    'search/': lambda s, user: ('get', '/search/', {'q': s.random.choice(['lorem', 'python', 'sqlite index'])}),
+    'user/': lambda s, user: ('get', '/user/', None),
+    'user/create/': lambda s, user: (
+        'post', '/user/create/',
+        {'username': f'benchmark_{s.random.getrandbits(64)}', 'password1': PASSWORD, 'password2': PASSWORD}
+    ),
+    'user/login/': lambda s, user: ('post', '/user/login/', {'username': user.username, 'password': PASSWORD}),
+    'user/logout/': lambda s, user: ('get', '/user/logout/', None),
+    'user/<id>/': lambda s, user: ('get', f'/user/{s.random.choice(s.user_ids)}/', None),
+    'user/<id>/followers/': lambda s, user: ('get', f'/user/{s.random.choice(s.user_ids)}/followers/', None),
+    'user/<id>/followeds/': lambda s, user: ('get', f'/user/{s.random.choice(s.user_ids)}/followeds/', None),
+    'user/<id>/posts/': lambda s, user: ('get', f'/user/{s.random.choice(s.user_ids)}/posts/', None),
+    'user/<id>/comments/': lambda s, user: ('get', f'/user/{s.random.choice(s.user_ids)}/comments/', None),
+    'user/<id>/follow/create/': lambda s, user: (
+        'post', f'/user/{s.new_followed_id(user)}/follow/create/', None
+    ),
+    'user/<id>/follow/delete/': lambda s, user: (
+        'post', f'/user/{follow_to_delete(s, user)}/follow/delete/', None
+    ),
+    'post/': lambda s, user: ('get', '/post/', None),
+    'post/create/': lambda s, user: ('post', '/post/create/', {
+        'title': 'Benchmark', 'body': 'Lorem ipsum dolor sit amet', 'user': user.id
+    }),
+    'post/hot/': lambda s, user: ('get', '/post/hot/', None),
+    'post/<id>/': lambda s, user: ('get', f'/post/{s.post_id()}/', None),
+    'post/<id>/comment/create/': lambda s, user: ('post', f'/post/{s.post_id()}/comment/create/', {'body': 'Lorem ipsum'}),
+    'post/<id>/comments/': lambda s, user: ('get', f'/post/{s.post_id()}/comments/', None),
+    'post/<id>/upvote/create/': lambda s, user: ('post', f'/post/{s.new_post_id(user)}/upvote/create/', None),
+    'post/<id>/downvote/create/': lambda s, user: ('post', f'/post/{s.new_post_id(user)}/downvote/create/', None),
+    'post/<post_id>/comment/<comment_id>/upvote/create/': lambda s, user: (
+        'post', '/post/{}/comment/{}/upvote/create/'.format(*s.new_comment(user)), None
+    ),
+    'post/<post_id>/comment/<comment_id>/downvote/create/': lambda s, user: (
+        'post', '/post/{}/comment/{}/downvote/create/'.format(*s.new_comment(user)), None
+    ),
+    'vote/batch/create/': lambda s, user: ('json', '/vote/batch/create/', {'votes': [
+        {'direction': 'up', 'target': 'post', 'id': s.new_post_id(user)} for _ in range(100)
+    ]}),
+    'api/posts/': lambda s, user: ('get', '/api/posts/', None),
+    'api/posts/<int:id>/': lambda s, user: ('get', f'/api/posts/{s.post_id()}/', None),
+    'api/posts/<int:id>/comments/': lambda s, user: ('get', f'/api/posts/{s.post_id()}/comments/', None),
+    'api/users/': lambda s, user: ('get', '/api/users/', None),
+    'api/users/<int:id>/': lambda s, user: ('get', f'/api/users/{s.random.choice(s.user_ids)}/', None),
+    'api/users/<int:id>/followers/': lambda s, user: ('get', f'/api/users/{s.random.choice(s.user_ids)}/followers/', None),
+    'api/users/<int:id>/followeds/': lambda s, user: ('get', f'/api/users/{s.random.choice(s.user_ids)}/followeds/', None),
+}
+
+# routes requested without a logged in user
+ANONYMOUS = {'user/create/', 'user/login/'}
+
+
+def follow_to_delete(scenario, user):
+    # follows first, outside of the measured request
+    followed_id = scenario.new_followed_id(user)
+    Follow.objects.create(follower=user, followed_id=followed_id)
+    return followed_id
+
+
+def read(response):
+    # streamed bodies are produced while they are read, which is timed too
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+def routes():
+    return [str(pattern.pattern) for pattern in urls.urlpatterns]
+
+
+def summary(samples):
+    samples = sorted(samples)
+    if len(samples) < 2:
+        value = samples[0] if samples else 0.0
+        return {'p50': value, 'p90': value, 'p99': value, 'max': value, 'mean': value}
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return {
+        'p50': cuts[49],
+        'p90': cuts[89],
+        'p99': cuts[98],
+        'max': samples[-1],
+        'mean': statistics.fmean(samples)
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Requests every route of main.urls through the test client against the '
+        'current database, and prints latency percentiles, queries per request '
+        'and peak memory per route as JSON. Writes are rolled back at the end.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help='Requests per route')
+        parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests per route first')
+        parser.add_argument('--memory-iterations', type=int, default=3, help='Requests per route traced for peak memory')
+        parser.add_argument('--routes', nargs='+', help='Only routes containing any of these strings')
+        parser.add_argument('--users', type=int, default=20, help='Size of the benchmark user pool')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        missing = set(routes()) - set(SCENARIOS)
+        if missing:
+            raise CommandError(f'No benchmark scenario for routes: {", ".join(sorted(missing))}')
+        selected = [
+            route for route in routes()
+            if not options['routes'] or any(part in route for part in options['routes'])
+        ]
+
+        post_ids = list(Post.objects.values_list('id', flat=True))
+        comments = list(Comment.objects.values_list('post_id', 'id'))
+        user_ids = list(User.objects.values_list('id', flat=True))
+        if not post_ids or not comments:
+            raise CommandError('The database has no posts or comments, run generate_data first')
+
+        results = {}
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            # every write of the run is rolled back, so runs are repeatable
+            with transaction.atomic():
+                pool = self.create_users(options['users'])
+                scenario = Scenario(random.Random(options['seed']), pool, post_ids, comments, user_ids)
+                for route in selected:
+                    results[route] = self.run_route(route, scenario, options)
+                transaction.set_rollback(True)
+
+        output = json.dumps({
+            'database': {
+                'vendor': connection.vendor,
+                'users': len(user_ids),
+                'posts': len(post_ids),
+                'comments': len(comments),
+            },
+            'iterations': options['iterations'],
+            'routes': results,
+            'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+
+    def create_users(self, total):
+        password = make_password(PASSWORD)
+        # saved one by one, so users cached under reused ids are evicted
+        return [
+            User.objects.get_or_create(username=f'benchmark_pool_{i}', defaults={'password': password})[0]
+            for i in range(total)
+        ]
+
+    def request(self, route, scenario):
+        client = Client()
+        user = scenario.user()
+        if route not in ANONYMOUS:
+            client.force_login(user)
+        method, path, data = SCENARIOS[route](scenario, user)
+        if method == 'json':
+            return lambda: client.post(path, json.dumps(data), content_type='application/json')
+        return lambda: read(getattr(client, method)(path, data))
+
+    def run_route(self, route, scenario, options):
+        for _ in range(options['warmup']):
+            try:
+                self.request(route, scenario)()
+            except Exception:
+                pass
+
+        latencies = []
+        queries = []
+        statuses = {}
+        for _ in range(options['iterations']):
+            send = self.request(route, scenario)
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                try:
+                    status = str(send().status_code)
+                except Exception as error:
+                    status = type(error).__name__
+                latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(len(captured))
+            statuses[status] = statuses.get(status, 0) + 1
+
+        peaks = []
+        tracemalloc.start()
+        try:
+            for _ in range(options['memory_iterations']):
+                send = self.request(route, scenario)
+                tracemalloc.reset_peak()
+                try:
+                    send()
+                except Exception:
+                    pass
+                peaks.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'requests': options['iterations'],
+            'statuses': dict(sorted(statuses.items())),
+            'latency_ms': summary(latencies),
+            'queries': {'mean': statistics.fmean(queries), 'max': max(queries)} if queries else None,
+            'peak_memory_kb': max(peaks) / 1024 if peaks else None,
+        }
@@ -0,0 +1,65 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from main.models import (
+    Post,
+    PostScore
+)
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the hot scores of recent posts, so they decay with age'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Number of scores updated per transaction'
+        )
+        parser.add_argument(
+            '--max-age-days',
+            type=int,
+            default=7,
+            help='Posts older than this get a final score of 0, then are skipped'
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        now = timezone.now()
+        cutoff = now - timedelta(days=options['max_age_days'])
+        posts = Post.objects.filter(created_at__gte=cutoff) \
+            .order_by('id') \
+            .values_list('id', flat=True)
+        total = 0
+        last_id = 0
+        while True:
+            ids = list(posts.filter(id__gt=last_id)[:chunk_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                PostScore.refresh_many(ids, now)
+            total += len(ids)
+            last_id = ids[-1]
+
+        # scores of posts which aged out, last refreshed while recent or by a
+        # vote since, decay to 0 once, and zero scores stay out of the next
+        # runs: they are read through the hot index, the unary + keeps SQLite
+        # from reading every old post through the created_at index instead
+        aged_scores = (
+            'SELECT main_postscore.post_id FROM main_postscore '
+            'INNER JOIN main_post ON main_post.id = main_postscore.post_id '
+            'WHERE (main_postscore.hot > 0 OR main_postscore.hot < 0) AND +main_post.created_at < %s '
+            'LIMIT %s'
+        )
+        zeroed = 0
+        while True:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(aged_scores, [connection.ops.adapt_datetimefield_value(cutoff), chunk_size])
+                ids = [id for id, in cursor.fetchall()]
+                if not ids:
+                    break
+                PostScore.objects.filter(post_id__in=ids).update(hot=0, updated_at=now)
+            zeroed += len(ids)
+        self.stdout.write(f'Decayed hot scores of {total} posts, zeroed {zeroed} older ones')
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from main.board import (
+    BOARD_TYPES,
+    BoardEncoder,
+    board_fields,
+    open_board
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Exports users, posts, comments, votes and follows as NDJSON, one row '
+        'per line, read in chunks so memory does not grow with the board. '
+        'Output paths ending in .gz are gzip compressed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Path of the NDJSON file')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Number of rows read per query')
+
+    def handle(self, *args, **options):
+        encoder = BoardEncoder()
+        totals = []
+        # one read transaction, so the rows of every table are of one moment
+        with open_board(options['output'], 'w') as file, transaction.atomic():
+            for type, model in BOARD_TYPES.items():
+                columns = [field.attname for field in board_fields(model)]
+                rows = model.objects.order_by('id').values(*columns).iterator(chunk_size=options['chunk_size'])
+                total = 0
+                for row in rows:
+                    file.write(encoder.encode({'type': type, **row}))
+                    file.write('\n')
+                    total += 1
+                totals.append(f'{total} {type}s')
+        self.stdout.write(f'Exported {", ".join(totals)}')
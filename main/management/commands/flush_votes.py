@@ -0,0 +1,37 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from main.votes import flush_votes
+
+
+class Command(BaseCommand):
+    help = 'Commits the write-behind vote journal to the database, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Flush pending votes and exit, instead of flushing periodically'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=settings.VOTE_FLUSH_INTERVAL,
+            help='Seconds between flushes'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.VOTE_FLUSH_BATCH_SIZE,
+            help='Number of votes committed per transaction'
+        )
+
+    def handle(self, *args, **options):
+        # segments left by a crashed flusher are replayed by the first flush
+        while True:
+            total = flush_votes(options['batch_size'])
+            if total:
+                self.stdout.write(f'Flushed {total} votes')
+            if options['once']:
+                return
+            time.sleep(options['interval'])
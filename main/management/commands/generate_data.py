@@ -0,0 +1,240 @@
+import random
+from datetime import timedelta
+from itertools import accumulate, count, groupby, islice
+from operator import itemgetter
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from main.models import (
+    Post,
+    Comment,
+    Vote,
+    Follow,
+    UserStats,
+    comment_path_step
+)
+from main.timeline import fill_timelines
+
+
+WORDS = (
+    'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod '
+    'tempor incididunt ut labore et dolore magna aliqua django python sqlite '
+    'query index cache async view template model migration benchmark'
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        'Generates a synthetic dataset with batched inserts: users, a power-law '
+        'follow graph, posts, comments and votes, then builds the derived data '
+        '(counters, hot scores, follow stats and timelines)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=50000)
+        parser.add_argument('--votes', type=int, default=200000, help='Votes on posts and comments')
+        parser.add_argument('--follows', type=int, default=20, help='Average number of users followed by a user, skewed by a power law')
+        parser.add_argument('--days', type=int, default=30, help='Posts and comments are spread over the last days')
+        parser.add_argument('--password', default='password', help='Password of every generated user')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=10000, help='Number of rows inserted per transaction')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.start = self.now - timedelta(days=options['days'])
+
+        user_ids = self.generate_users(options['users'], options['password'])
+        follows = self.generate_follows(user_ids, options['follows'])
+        posts = self.generate_posts(user_ids, options['posts'])
+        comments = self.generate_comments(user_ids, posts, options['comments'])
+        votes = self.generate_votes(user_ids, posts, comments, options['votes'])
+
+        self.stdout.write('Building derived data')
+        call_command('rebuild_counters', stdout=self.stdout)
+        call_command('decay_hot_scores', max_age_days=options['days'] + 1, stdout=self.stdout)
+        if posts:
+            fill_timelines(posts[0][0] - 1, self.batch_size)
+            self.stdout.write('Filled timelines')
+        self.stdout.write(
+            f'Generated {len(user_ids)} users, {follows} follows, {len(posts)} posts, '
+            f'{len(comments)} comments and {votes} votes'
+        )
+
+    def zipf_weights(self, ids, exponent=1.1):
+        # popularity follows a power law over a random ranking of ids
+        ranked = list(ids)
+        self.random.shuffle(ranked)
+        return ranked, list(accumulate(1 / (rank + 1) ** exponent for rank in range(len(ranked))))
+
+    def moment(self, after=None):
+        start = self.start if after is None else after
+        return start + (self.now - start) * self.random.random()
+
+    def timestamp(self, moment):
+        return connection.ops.adapt_datetimefield_value(moment)
+
+    def insert(self, model, fields, rows):
+        # plain INSERTs in transactions of batch_size, skipping model instances
+        # and save() side effects; rows breaking unique constraints are ignored
+        meta = model._meta
+        columns = ', '.join(meta.get_field(field).column for field in fields)
+        placeholders = ', '.join(['%s'] * len(fields))
+        sql = f'INSERT OR IGNORE INTO {meta.db_table} ({columns}) VALUES ({placeholders})'
+        rows = iter(rows)
+        total = 0
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                return total
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, batch)
+            total += len(batch)
+
+    def generate_users(self, total, password):
+        first_id = (User.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+        # hashing is slow on purpose, so every user shares one hash
+        password = make_password(password)
+        self.insert(
+            User,
+            ['username', 'password', 'first_name', 'last_name', 'email', 'is_staff', 'is_active', 'is_superuser', 'date_joined'],
+            (
+                (f'user{first_id + i}', password, '', '', '', False, True, False, self.timestamp(self.moment()))
+                for i in range(total)
+            )
+        )
+        self.stdout.write(f'Generated {total} users')
+        return list(User.objects.filter(id__gte=first_id).values_list('id', flat=True))
+
+    def generate_follows(self, user_ids, average):
+        if len(user_ids) < 2:
+            return 0
+        ranked, weights = self.zipf_weights(user_ids)
+        follower_counts = dict.fromkeys(user_ids, 0)
+        followed_counts = dict.fromkeys(user_ids, 0)
+        now = self.timestamp(self.now)
+
+        def follows():
+            for follower_id in user_ids:
+                # out-degrees are skewed too, a few users follow a lot
+                wanted = min(int(self.random.paretovariate(1.5) * average / 3), len(user_ids) - 1)
+                followed_ids = set()
+                while len(followed_ids) < wanted:
+                    followed_ids.update(self.random.choices(ranked, cum_weights=weights, k=wanted - len(followed_ids)))
+                    followed_ids.discard(follower_id)
+                for followed_id in followed_ids:
+                    follower_counts[followed_id] += 1
+                    followed_counts[follower_id] += 1
+                    yield follower_id, followed_id, now
+
+        total = self.insert(Follow, ['follower', 'followed', 'created_at'], follows())
+        self.insert(UserStats, ['user', 'follower_count', 'followed_count', 'changed_at'], (
+            (user_id, follower_counts[user_id], followed_counts[user_id], now)
+            for user_id in user_ids
+        ))
+        self.stdout.write(f'Generated {total} follows')
+        return total
+
+    def generate_posts(self, user_ids, total):
+        if not user_ids:
+            return []
+        first_id = (Post.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+        ranked, weights = self.zipf_weights(user_ids)
+
+        def posts():
+            for user_id in self.random.choices(ranked, cum_weights=weights, k=total):
+                created_at = self.timestamp(self.moment())
+                yield (
+                    self.sentence(4, 10)[:100], self.sentence(20, 120)[:1000], user_id,
+                    created_at, created_at, 0, 0, 0
+                )
+
+        self.insert(
+            Post,
+            ['title', 'body', 'user', 'created_at', 'changed_at', 'upvote_count', 'downvote_count', 'comment_count'],
+            posts()
+        )
+        posts = list(Post.objects.filter(id__gte=first_id).order_by('id').values_list('id', 'created_at'))
+        self.stdout.write(f'Generated {len(posts)} posts')
+        return posts
+
+    def generate_comments(self, user_ids, posts, total):
+        if not user_ids or not posts:
+            return []
+        first_id = (Comment.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+        ranked_posts, post_weights = self.zipf_weights(posts)
+        ranked_users, user_weights = self.zipf_weights(user_ids)
+        commented = self.random.choices(ranked_posts, cum_weights=post_weights, k=total)
+        authors = self.random.choices(ranked_users, cum_weights=user_weights, k=total)
+        # threads are built in creation order, so sorted by post and moment
+        comments = sorted(
+            (post_id, self.moment(after=created_at), user_id)
+            for (post_id, created_at), user_id in zip(commented, authors)
+        )
+
+        def rows():
+            # ids are given, so replies can point to their parents
+            ids = count(first_id)
+            for post_id, thread in groupby(comments, key=itemgetter(0)):
+                # path -> (id, number of replies) of the comments of the post
+                replied = {'': (None, 0)}
+                paths = []
+                for _, created_at, user_id in thread:
+                    # half of the comments reply to an earlier one
+                    parent_path = ''
+                    if paths and self.random.random() < 0.5:
+                        parent_path = self.random.choice(paths)
+                        if len(parent_path) // settings.COMMENT_PATH_STEP_WIDTH >= settings.COMMENT_MAX_DEPTH:
+                            parent_path = ''
+                    parent_id, replies = replied[parent_path]
+                    replied[parent_path] = (parent_id, replies + 1)
+                    id = next(ids)
+                    path = parent_path + comment_path_step(replies + 1)
+                    replied[path] = (id, 0)
+                    paths.append(path)
+                    yield (
+                        id, self.sentence(5, 60)[:500], post_id, parent_id, path, user_id,
+                        self.timestamp(created_at), 0, 0
+                    )
+
+        self.insert(
+            Comment,
+            ['id', 'body', 'post', 'parent', 'path', 'user', 'created_at', 'upvote_count', 'downvote_count'],
+            rows()
+        )
+        comments = list(Comment.objects.filter(id__gte=first_id).values_list('id', flat=True))
+        self.stdout.write(f'Generated {len(comments)} comments')
+        return comments
+
+    def generate_votes(self, user_ids, posts, comments, total):
+        if not user_ids or not (posts or comments):
+            return 0
+        # popular posts and comments get most votes, two thirds of them are
+        # upvotes; repeated (target, user) pairs are ignored
+        targets = [(id, None) for id, created_at in posts] + [(None, id) for id in comments]
+        ranked, weights = self.zipf_weights(targets, exponent=0.9)
+        now = self.timestamp(self.now)
+
+        def votes():
+            for start in range(0, total, self.batch_size):
+                size = min(self.batch_size, total - start)
+                voted = self.random.choices(ranked, cum_weights=weights, k=size)
+                for (post_id, comment_id), user_id in zip(voted, self.random.choices(user_ids, k=size)):
+                    value = Vote.UP if self.random.random() < 2 / 3 else Vote.DOWN
+                    yield post_id, comment_id, user_id, value, now
+
+        existing = Vote.objects.count()
+        self.insert(Vote, ['post', 'comment', 'user', 'value', 'created_at'], votes())
+        generated = Vote.objects.count() - existing
+        self.stdout.write(f'Generated {generated} votes')
+        return generated
+
+    def sentence(self, shortest, longest):
+        return ' '.join(self.random.choices(WORDS, k=self.random.randint(shortest, longest))).capitalize()
@@ -0,0 +1,205 @@
+import json
+import os
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from main.board import (
+    BOARD_TYPES,
+    board_fields,
+    open_board
+)
+from main.models import (
+    Post,
+    Comment,
+    PostScore,
+    UserStats,
+    hot_score
+)
+from main.timeline import fill_timelines
+
+
+class Command(BaseCommand):
+    help = (
+        'Imports an NDJSON board written by export_board, validating rows and '
+        'inserting them in batches. Users are matched by username; posts, '
+        'comments, votes and follows get new ids, shifted past the ids in use. '
+        'Progress is checkpointed after every batch, and running the command '
+        'again after an interruption resumes from the checkpoint.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='Path of the NDJSON file, gzip compressed if it ends in .gz')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of rows inserted per transaction')
+        parser.add_argument('--checkpoint', help='Path of the checkpoint, the input path with .checkpoint appended by default')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        checkpoint = options['checkpoint'] or f'{options["input"]}.checkpoint'
+        state = self.read_checkpoint(checkpoint)
+        # old user id -> id in this database, rebuilt on resume by replaying
+        # the user rows, which are matched by username
+        self.users = {}
+        self.totals = dict.fromkeys(BOARD_TYPES, 0)
+
+        with open_board(options['input'], 'r') as file:
+            batch = []
+            for number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                    type = row.pop('type')
+                except (ValueError, KeyError, AttributeError):
+                    raise CommandError(f'Line {number}: not a board row')
+                if type not in BOARD_TYPES:
+                    raise CommandError(f'Line {number}: unknown type {type!r}')
+                if number <= state['line'] and type != 'user':
+                    continue
+                if batch and (batch[0][1] != type or len(batch) == self.batch_size):
+                    self.import_batch(batch, state, checkpoint)
+                    batch = []
+                batch.append((number, type, row))
+            if batch:
+                self.import_batch(batch, state, checkpoint)
+
+        self.stdout.write('Building derived data')
+        self.build_derived_data(state)
+        os.remove(checkpoint)
+        self.stdout.write('Imported ' + ', '.join(f'{total} {type}s' for type, total in self.totals.items()))
+
+    def read_checkpoint(self, checkpoint):
+        if os.path.exists(checkpoint):
+            with open(checkpoint) as file:
+                state = json.load(file)
+            self.stdout.write(f'Resuming after line {state["line"]}')
+            return state
+        # new rows go past the ids in use when the import starts
+        state = {'line': 0, 'offsets': {}}
+        for type, model in BOARD_TYPES.items():
+            if model is not User:
+                state['offsets'][type] = model.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        self.write_checkpoint(checkpoint, state)
+        return state
+
+    def write_checkpoint(self, checkpoint, state):
+        # replaced at once, so an interruption never leaves half a checkpoint
+        with open(f'{checkpoint}.tmp', 'w') as file:
+            json.dump(state, file)
+        os.replace(f'{checkpoint}.tmp', checkpoint)
+
+    def new_id(self, model, old_id, state, number):
+        if old_id is None:
+            return None
+        if model is User:
+            try:
+                return self.users[old_id]
+            except KeyError:
+                raise CommandError(f'Line {number}: user {old_id} is not in the board')
+        type = next(type for type, board_model in BOARD_TYPES.items() if board_model is model)
+        return old_id + state['offsets'][type]
+
+    def instance(self, model, row, state, number):
+        """
+        Returns the instance of row, with its ids remapped.
+        """
+        values = {}
+        for field in board_fields(model):
+            if field.attname not in row:
+                if field.has_default() or field.null or field.primary_key:
+                    continue
+                raise CommandError(f'Line {number}: {field.attname} is missing')
+            value = row[field.attname]
+            if field.is_relation:
+                value = self.new_id(field.related_model, value, state, number)
+            elif field.primary_key:
+                value = None if model is User else self.new_id(model, value, state, number)
+            values[field.attname] = value
+        return model(**values)
+
+    def validate(self, model, instance, number):
+        try:
+            # foreign keys are checked by the database at commit, in bulk
+            instance.full_clean(
+                exclude=[field.name for field in board_fields(model) if field.is_relation],
+                validate_unique=False
+            )
+        except ValidationError as error:
+            raise CommandError(f'Line {number}: {"; ".join(error.messages)}')
+
+    def attach_parents(self, comments):
+        """
+        Sets the parents of the replies among comments, from the batch or
+        else from the rows already imported, so validating them reads the
+        parents once per batch and finds those not inserted yet.
+        """
+        batch = {comment.id: comment for comment in comments}
+        missing = {
+            comment.parent_id for comment in comments
+            if comment.parent_id is not None and comment.parent_id not in batch
+        }
+        parents = {**Comment.objects.only('id', 'post_id', 'path').in_bulk(missing), **batch}
+        for comment in comments:
+            if comment.parent_id in parents:
+                comment.parent = parents[comment.parent_id]
+
+    def insert(self, model, fields, instances):
+        # plain INSERTs: bulk_create would overwrite created_at (auto_now_add)
+        # and rows already inserted before an interruption are ignored
+        database = transaction.get_connection()
+        columns = ', '.join(database.ops.quote_name(field.column) for field in fields)
+        placeholders = ', '.join(['%s'] * len(fields))
+        with database.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT OR IGNORE INTO {model._meta.db_table} ({columns}) VALUES ({placeholders})',
+                [
+                    [field.get_db_prep_save(getattr(instance, field.attname), database) for field in fields]
+                    for instance in instances
+                ]
+            )
+
+    def import_batch(self, batch, state, checkpoint):
+        type = batch[0][1]
+        model = BOARD_TYPES[type]
+        first, last = batch[0][0], batch[-1][0]
+        instances = [self.instance(model, row, state, number) for number, _, row in batch]
+        if model is Comment:
+            self.attach_parents(instances)
+        for instance, (number, _, _) in zip(instances, batch):
+            self.validate(model, instance, number)
+        try:
+            with transaction.atomic():
+                self.insert(model, [
+                    field for field in board_fields(model) if not (field.primary_key and model is User)
+                ], instances)
+                if model is User:
+                    usernames = {instance.username: row['id'] for instance, (_, _, row) in zip(instances, batch)}
+                    for username, id in User.objects.filter(username__in=usernames).values_list('username', 'id'):
+                        self.users[usernames[username]] = id
+                elif model is Post:
+                    # the posts are new, so are their scores
+                    now = timezone.now()
+                    self.insert(PostScore, PostScore._meta.concrete_fields, [
+                        PostScore(
+                            post_id=post.id,
+                            hot=hot_score(post.upvote_count, post.downvote_count, post.created_at, now),
+                            updated_at=now
+                        )
+                        for post in instances
+                    ])
+        except IntegrityError as error:
+            raise CommandError(f'Lines {first} to {last}: {error}')
+        if last > state['line']:
+            self.totals[type] += len(instances)
+            state['line'] = last
+            self.write_checkpoint(checkpoint, state)
+
+    def build_derived_data(self, state):
+        # what saves of the models would have done: follow counters first, as
+        # they decide which authors are fanned out
+        user_ids = sorted(set(self.users.values()))
+        for start in range(0, len(user_ids), self.batch_size):
+            with transaction.atomic():
+                UserStats.recount(user_ids[start:start + self.batch_size])
+        fill_timelines(state['offsets']['post'], self.batch_size)
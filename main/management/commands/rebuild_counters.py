@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from main.models import (
+    Post,
+    Comment,
+    recounted_counters
+)
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the denormalized vote and comment counters of posts and comments'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Number of rows updated per transaction'
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        posts = self.rebuild(Post, chunk_size)
+        comments = self.rebuild(Comment, chunk_size)
+        self.stdout.write(f'Rebuilt counters of {posts} posts and {comments} comments')
+
+    def rebuild(self, model, chunk_size):
+        counters = recounted_counters(model)
+        total = 0
+        last_id = 0
+        while True:
+            ids = list(
+                model.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', flat=True)[:chunk_size]
+            )
+            if not ids:
+                return total
+            with transaction.atomic():
+                model.objects.filter(id__gte=ids[0], id__lte=ids[-1]).update(**counters)
+            total += len(ids)
+            last_id = ids[-1]
@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from main.search import SEARCH_TABLE, TRIGGERS
+
+
+# the index being built, swapped in for main_search once complete
+REBUILD_TABLE = 'main_search_rebuild'
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilds the full-text search index of posts and comments into a new '
+        'table, then swaps it in, so searches keep using the current index '
+        'until the new one is complete'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=10000,
+            help='Number of rows indexed per transaction'
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        with connection.cursor() as cursor:
+            # left by an interrupted rebuild
+            cursor.execute(f'DROP TABLE IF EXISTS {REBUILD_TABLE}')
+            cursor.execute(SEARCH_TABLE.format(name=REBUILD_TABLE))
+        post_sql = (
+            f"INSERT INTO {REBUILD_TABLE} (title, body, kind, object_id, post_id) "
+            f"SELECT title, body, 'post', id, id FROM main_post WHERE id > %s AND id <= %s"
+        )
+        comment_sql = (
+            f"INSERT INTO {REBUILD_TABLE} (title, body, kind, object_id, post_id) "
+            f"SELECT '', body, 'comment', id, post_id FROM main_comment WHERE id > %s AND id <= %s"
+        )
+        posts, max_post_id = self.index('main_post', post_sql, chunk_size)
+        comments, max_comment_id = self.index('main_comment', comment_sql, chunk_size)
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {REBUILD_TABLE} ({REBUILD_TABLE}) VALUES ('optimize')")
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            # rows inserted since their table was read, the write lock taken
+            # here keeps new ones out until the swap is committed
+            cursor.execute(post_sql, [max_post_id, 2 ** 63 - 1])
+            posts += cursor.rowcount
+            cursor.execute(comment_sql, [max_comment_id, 2 ** 63 - 1])
+            comments += cursor.rowcount
+            # SQLite rejects renaming while triggers point to a missing table
+            cursor.execute('DROP TRIGGER main_search_post_insert')
+            cursor.execute('DROP TRIGGER main_search_comment_insert')
+            cursor.execute('DROP TABLE main_search')
+            cursor.execute(f'ALTER TABLE {REBUILD_TABLE} RENAME TO main_search')
+            for sql in TRIGGERS:
+                cursor.execute(sql)
+        self.stdout.write(f'Indexed {posts} posts and {comments} comments')
+
+    def index(self, table, sql, chunk_size):
+        """
+        Runs sql over the rows of table in id ranges of chunk_size, and
+        returns the number of rows indexed and the last id read.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT MAX(id) FROM {table}')
+            max_id = cursor.fetchone()[0] or 0
+        total = 0
+        for start in range(0, max_id, chunk_size):
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(sql, [start, start + chunk_size])
+                total += cursor.rowcount
+        return total, max_id
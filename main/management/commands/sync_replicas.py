@@ -0,0 +1,42 @@
+import sqlite3
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Copies the primary SQLite database to every read replica with the online backup API'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Copy once and exit, instead of copying periodically'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help='Seconds between copies, i.e. the maximum replica lag'
+        )
+        parser.add_argument(
+            '--pages',
+            type=int,
+            default=1024,
+            help='Pages copied per step, the primary is only locked during a step'
+        )
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES['default']['NAME']
+        while True:
+            for alias in settings.DATABASE_REPLICAS:
+                source = sqlite3.connect(primary)
+                target = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+                try:
+                    source.backup(target, pages=options['pages'])
+                finally:
+                    target.close()
+                    source.close()
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,83 @@
+# Generated by Django 4.0.4 on 2026-10-18 03:02
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def count_subquery(model, field):
+    queryset = model.objects.filter(**{field: OuterRef('id')}) \
+        .order_by() \
+        .values(field) \
+        .annotate(total=Count('id')) \
+        .values('total')
+    return Coalesce(Subquery(queryset, output_field=IntegerField()), 0)
+
+
+def fill_counters(apps, schema_editor):
+    Post = apps.get_model('main', 'Post')
+    Comment = apps.get_model('main', 'Comment')
+    Upvote = apps.get_model('main', 'Upvote')
+    Downvote = apps.get_model('main', 'Downvote')
+    Post.objects.update(
+        upvote_count=count_subquery(Upvote, 'post'),
+        downvote_count=count_subquery(Downvote, 'post'),
+        comment_count=count_subquery(Comment, 'post')
+    )
+    Comment.objects.update(
+        upvote_count=count_subquery(Upvote, 'comment'),
+        downvote_count=count_subquery(Downvote, 'comment')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main', '0009_follow_alter_comment_post_alter_downvote_comment_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='downvote_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='upvote_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='downvote_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='upvote_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='follow',
+            name='followed',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='followers', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='follow',
+            name='follower',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='followeds', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('follower', 'followed'), name='unique_follower_followed'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.0.4 on 2026-10-18 03:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+
+HOT_GRAVITY = 1.8
+
+
+def hot_score(upvote_count, downvote_count, created_at, now):
+    # the hot score of main.models when this migration was written
+    age_hours = max((now - created_at).total_seconds(), 0) / 3600
+    return (upvote_count - downvote_count) / (age_hours + 2) ** HOT_GRAVITY
+
+
+def fill_scores(apps, schema_editor):
+    Post = apps.get_model('main', 'Post')
+    PostScore = apps.get_model('main', 'PostScore')
+    posts = Post.objects.values_list('id', 'upvote_count', 'downvote_count', 'created_at')
+    now = timezone.now()
+    PostScore.objects.bulk_create(
+        (
+            PostScore(post_id=id, hot=hot_score(upvote_count, downvote_count, created_at, now))
+            for id, upvote_count, downvote_count, created_at in posts.iterator()
+        ),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_post_created_at_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostScore',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score', serialize=False, to='main.post')),
+                ('hot', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='postscore',
+            index=models.Index(fields=['hot', 'post'], name='postscore_hot_post_idx'),
+        ),
+        migrations.RunPython(fill_scores, migrations.RunPython.noop),
+    ]
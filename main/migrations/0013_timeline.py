@@ -0,0 +1,92 @@
+# Generated by Django 4.0.4 on 2026-10-18 03:07
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def fill_stats_and_timelines(apps, schema_editor):
+    Post = apps.get_model('main', 'Post')
+    Follow = apps.get_model('main', 'Follow')
+    UserStats = apps.get_model('main', 'UserStats')
+    TimelineEntry = apps.get_model('main', 'TimelineEntry')
+
+    stats = {}
+    for user_id, total in Follow.objects.values_list('followed_id').annotate(total=Count('id')).order_by():
+        stats.setdefault(user_id, UserStats(user_id=user_id)).follower_count = total
+    for user_id, total in Follow.objects.values_list('follower_id').annotate(total=Count('id')).order_by():
+        stats.setdefault(user_id, UserStats(user_id=user_id)).followed_count = total
+    UserStats.objects.bulk_create(stats.values(), batch_size=1000)
+
+    def recent_posts(user_id):
+        return Post.objects.filter(user_id=user_id) \
+            .order_by('-created_at', '-id') \
+            .values_list('id', 'created_at')[:settings.TIMELINE_BACKFILL_SIZE]
+
+    celebrity_ids = {
+        user_id for user_id, user_stats in stats.items()
+        if user_stats.follower_count >= settings.TIMELINE_FANOUT_MAX_FOLLOWERS
+    }
+    author_ids = Post.objects.values_list('user_id', flat=True).distinct().order_by()
+    for author_id in author_ids.iterator():
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(user_id=author_id, post_id=id, created_at=created_at) for id, created_at in recent_posts(author_id)],
+            ignore_conflicts=True
+        )
+    follows = Follow.objects.exclude(followed_id__in=celebrity_ids).values_list('follower_id', 'followed_id')
+    for follower_id, followed_id in follows.iterator():
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(user_id=follower_id, post_id=id, created_at=created_at) for id, created_at in recent_posts(followed_id)],
+            ignore_conflicts=True
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main', '0012_postscore'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('follower_count', models.PositiveIntegerField(default=0)),
+                ('followed_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='post_user_created_at_id_idx'),
+        ),
+        migrations.AddField(
+            model_name='timelineentry',
+            name='post',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main.post'),
+        ),
+        migrations.AddField(
+            model_name='timelineentry',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', 'created_at', 'post'], name='timeline_user_created_at_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique_timeline_user_post'),
+        ),
+        migrations.RunPython(fill_stats_and_timelines, migrations.RunPython.noop),
+    ]
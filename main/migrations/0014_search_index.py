@@ -0,0 +1,56 @@
+# Generated by Django 4.0.4 on 2026-10-18 03:10
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_timeline'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                # full-text index of post titles and bodies and comment bodies,
+                # title is empty for comments
+                """
+                CREATE VIRTUAL TABLE main_search USING fts5(
+                    title,
+                    body,
+                    kind UNINDEXED,
+                    object_id UNINDEXED,
+                    post_id UNINDEXED,
+                    tokenize = 'porter unicode61'
+                )
+                """,
+                # posts and comments can not be changed or deleted, so inserts
+                # are all that needs syncing
+                """
+                CREATE TRIGGER main_search_post_insert AFTER INSERT ON main_post BEGIN
+                    INSERT INTO main_search (title, body, kind, object_id, post_id)
+                    VALUES (new.title, new.body, 'post', new.id, new.id);
+                END
+                """,
+                """
+                CREATE TRIGGER main_search_comment_insert AFTER INSERT ON main_comment BEGIN
+                    INSERT INTO main_search (title, body, kind, object_id, post_id)
+                    VALUES ('', new.body, 'comment', new.id, new.post_id);
+                END
+                """,
+                """
+                INSERT INTO main_search (title, body, kind, object_id, post_id)
+                SELECT title, body, 'post', id, id FROM main_post
+                """,
+                """
+                INSERT INTO main_search (title, body, kind, object_id, post_id)
+                SELECT '', body, 'comment', id, post_id FROM main_comment
+                """,
+            ],
+            reverse_sql=[
+                'DROP TRIGGER main_search_comment_insert',
+                'DROP TRIGGER main_search_post_insert',
+                'DROP TABLE main_search',
+            ]
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.0.4 on 2026-10-18 03:11
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='userstats',
+            name='changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['changed_at'], name='post_changed_at_idx'),
+        ),
+    ]
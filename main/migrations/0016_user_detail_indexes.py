@@ -0,0 +1,25 @@
+# Generated by Django 4.0.4 on 2026-10-18 03:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_changed_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='comment_user_created_at_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['followed', 'created_at', 'id'], name='follow_followed_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['follower', 'created_at', 'id'], name='follow_follower_created_at_idx'),
+        ),
+    ]
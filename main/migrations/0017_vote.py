@@ -0,0 +1,120 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+BATCH_SIZE = 10000
+
+
+def run_in_batches(schema_editor, table, statements):
+    """
+    Runs statements, each filtering rows of table on "id > %s AND id <= %s",
+    over consecutive id ranges of BATCH_SIZE, so tables of any size are
+    copied in bounded steps.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'SELECT MAX(id) FROM {table}')
+        max_id = cursor.fetchone()[0] or 0
+        for start in range(0, max_id, BATCH_SIZE):
+            for statement in statements:
+                cursor.execute(statement, [start, start + BATCH_SIZE])
+
+
+def copy_votes(apps, schema_editor):
+    # plain SQL keeps created_at, which auto_now_add would overwrite
+    run_in_batches(schema_editor, 'main_upvote', [
+        'INSERT INTO main_vote (post_id, comment_id, user_id, value, created_at) '
+        'SELECT post_id, comment_id, user_id, 1, created_at FROM main_upvote '
+        'WHERE main_upvote.id > %s AND main_upvote.id <= %s'
+    ])
+    # a user could hold both votes on a target, the most recent one is kept;
+    # UPDATE ... FROM needs SQLite 3.33 or later
+    run_in_batches(schema_editor, 'main_downvote', [
+        f'UPDATE main_vote SET value = -1, created_at = main_downvote.created_at FROM main_downvote '
+        f'WHERE main_downvote.id > %s AND main_downvote.id <= %s '
+        f'AND main_vote.{field} = main_downvote.{field} AND main_vote.user_id = main_downvote.user_id '
+        f'AND main_vote.created_at < main_downvote.created_at'
+        for field in ('post_id', 'comment_id')
+    ] + [
+        f'INSERT INTO main_vote (post_id, comment_id, user_id, value, created_at) '
+        f'SELECT post_id, comment_id, user_id, -1, created_at FROM main_downvote '
+        f'WHERE main_downvote.id > %s AND main_downvote.id <= %s AND main_downvote.{field} IS NOT NULL '
+        f'AND NOT EXISTS (SELECT 1 FROM main_vote WHERE main_vote.{field} = main_downvote.{field} '
+        f'AND main_vote.user_id = main_downvote.user_id)'
+        for field in ('post_id', 'comment_id')
+    ])
+    recount_votes(apps)
+
+
+def split_votes(apps, schema_editor):
+    run_in_batches(schema_editor, 'main_vote', [
+        f'INSERT INTO {table} (post_id, comment_id, user_id, created_at) '
+        f'SELECT post_id, comment_id, user_id, created_at FROM main_vote '
+        f'WHERE main_vote.id > %s AND main_vote.id <= %s AND value = {value}'
+        for table, value in (('main_upvote', 1), ('main_downvote', -1))
+    ])
+
+
+def recount_votes(apps):
+    # targets a user held both votes on lost one of them
+    Vote = apps.get_model('main', 'Vote')
+    for model_name, field in (('Post', 'post'), ('Comment', 'comment')):
+        model = apps.get_model('main', model_name)
+
+        def count(value):
+            queryset = Vote.objects.filter(**{field: OuterRef('id')}, value=value) \
+                .order_by() \
+                .values(field) \
+                .annotate(total=Count('id')) \
+                .values('total')
+            return Coalesce(Subquery(queryset, output_field=IntegerField()), 0)
+
+        max_id = model.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        for start in range(0, max_id, BATCH_SIZE):
+            model.objects.filter(id__gt=start, id__lte=start + BATCH_SIZE).update(
+                upvote_count=count(1),
+                downvote_count=count(-1)
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main', '0016_user_detail_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Vote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('value', models.SmallIntegerField(choices=[(1, 'Up'), (-1, 'Down')])),
+                ('comment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='main.comment')),
+                ('post', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='main.post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='votes', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(fields=('post', 'user'), name='unique_post_vote'),
+        ),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(fields=('comment', 'user'), name='unique_comment_vote'),
+        ),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.CheckConstraint(check=models.Q(('value__in', [1, -1])), name='vote_value_up_or_down'),
+        ),
+        migrations.RunPython(copy_votes, split_votes),
+        migrations.DeleteModel(
+            name='Downvote',
+        ),
+        migrations.DeleteModel(
+            name='Upvote',
+        ),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 4.0.4 on 2026-10-18 03:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# foreign key indexes made redundant by a composite index or a unique
+# constraint starting with the same column; dropping them by name avoids the
+# table rebuild SQLite needs to alter a field
+REDUNDANT_INDEXES = [
+    ('main_comment', 'post_id', 'main_comment_post_id_8158f528'),
+    ('main_comment', 'user_id', 'main_comment_user_id_cf3356a1'),
+    ('main_follow', 'followed_id', 'main_follow_followed_id_a5bab6c0'),
+    ('main_follow', 'follower_id', 'main_follow_follower_id_2be2dec0'),
+    ('main_post', 'user_id', 'main_post_user_id_313f9722'),
+    ('main_timelineentry', 'user_id', 'main_timelineentry_user_id_7a828843'),
+    ('main_vote', 'comment_id', 'main_vote_comment_id_2ca37ab3'),
+    ('main_vote', 'post_id', 'main_vote_post_id_56cbce80'),
+    ('main_vote', 'user_id', 'main_vote_user_id_95515d7a'),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main', '0017_vote'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='comment',
+                    name='post',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='main.post'),
+                ),
+                migrations.AlterField(
+                    model_name='comment',
+                    name='user',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL),
+                ),
+                migrations.AlterField(
+                    model_name='follow',
+                    name='followed',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='followers', to=settings.AUTH_USER_MODEL),
+                ),
+                migrations.AlterField(
+                    model_name='follow',
+                    name='follower',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='followeds', to=settings.AUTH_USER_MODEL),
+                ),
+                migrations.AlterField(
+                    model_name='post',
+                    name='user',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL),
+                ),
+                migrations.AlterField(
+                    model_name='timelineentry',
+                    name='user',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL),
+                ),
+                migrations.AlterField(
+                    model_name='vote',
+                    name='comment',
+                    field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='main.comment'),
+                ),
+                migrations.AlterField(
+                    model_name='vote',
+                    name='post',
+                    field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='main.post'),
+                ),
+                migrations.AlterField(
+                    model_name='vote',
+                    name='user',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='votes', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    f'DROP INDEX "{name}"',
+                    f'CREATE INDEX "{name}" ON "{table}" ("{column}")'
+                )
+                for table, column, name in REDUNDANT_INDEXES
+            ]
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created_at', 'id'], name='comment_post_created_at_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(condition=models.Q(('post__isnull', False)), fields=['user', 'post'], name='vote_user_post_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(condition=models.Q(('comment__isnull', False)), fields=['user', 'comment'], name='vote_user_comment_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+BATCH_SIZE = 10000
+
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def path_step(position):
+    digits = ''
+    while position:
+        position, digit = divmod(position, 36)
+        digits = DIGITS[digit] + digits
+    return digits.rjust(settings.COMMENT_PATH_STEP_WIDTH, '0')
+
+
+def number_comments(apps, schema_editor):
+    # existing comments become the roots of their threads, in creation order
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT MAX(post_id) FROM main_comment')
+        max_post_id = cursor.fetchone()[0] or 0
+        for start in range(0, max_post_id, BATCH_SIZE):
+            cursor.execute(
+                'SELECT id, ROW_NUMBER() OVER (PARTITION BY post_id ORDER BY created_at, id) '
+                'FROM main_comment WHERE post_id > %s AND post_id <= %s',
+                [start, start + BATCH_SIZE]
+            )
+            rows = [(path_step(position), id) for id, position in cursor.fetchall()]
+            cursor.executemany('UPDATE main_comment SET path = %s WHERE id = %s', rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0018_query_plan_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='main.comment'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+            preserve_default=False,
+        ),
+        migrations.RunPython(number_comments, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='comment',
+            constraint=models.UniqueConstraint(fields=('post', 'path'), name='unique_comment_path'),
+        ),
+    ]
@@ -1,10 +1,118 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.core.exceptions import ValidationError
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+
+# hot ranking: net votes / (age in hours + 2) ^ HOT_GRAVITY
+HOT_GRAVITY = 1.8
+
+
+def increment_counter(model, id, field, amount=1, **values):
+    """
+    Atomically adds amount to a counter column, without reading the row first.
+    Extra values are written by the same UPDATE.
+    """
+    model.objects.filter(pk=id).update(**{field: F(field) + amount}, **values)
+
+
+def comment_path_step(position):
+    """
+    Returns the path step of the reply at position (from 1) among the replies
+    of its parent: fixed width base 36 digits, which sort like the positions.
+    """
+    width = settings.COMMENT_PATH_STEP_WIDTH
+    if position >= 36 ** width:
+        raise ValidationError(f'Comments can not have more than {36 ** width - 1} replies')
+    digits = ''
+    while position:
+        position, digit = divmod(position, 36)
+        digits = '0123456789abcdefghijklmnopqrstuvwxyz'[digit] + digits
+    return digits.rjust(width, '0')
+
+
+# sorts after every path step, so the paths under a prefix are the ones
+# between prefix and prefix + COMMENT_PATH_END
+COMMENT_PATH_END = '~'
+
+
+def count_subquery(model, field, outer='id', **filters):
+    """
+    Returns a correlated COUNT(*) of model rows whose field points to the
+    outer column of the outer row, optionally filtered.
+    """
+    queryset = model.objects.filter(**{field: OuterRef(outer)}, **filters) \
+        .order_by() \
+        .values(field) \
+        .annotate(total=Count('id')) \
+        .values('total')
+    return Coalesce(Subquery(queryset, output_field=IntegerField()), 0)
+
+
+def recounted_counters(model):
+    """
+    Returns the counter columns of Post or Comment recomputed from the vote
+    and comment tables, as update() values.
+    """
+    field = 'post' if model is Post else 'comment'
+    counters = {
+        'upvote_count': count_subquery(Vote, field, value=Vote.UP),
+        'downvote_count': count_subquery(Vote, field, value=Vote.DOWN),
+    }
+    if model is Post:
+        counters['comment_count'] = count_subquery(Comment, 'post')
+    return counters
+
+
+def tally_field(value):
+    return 'upvote_count' if value == Vote.UP else 'downvote_count'
+
+
+def count_vote(vote, previous_value=None):
+    """
+    Bumps the tallies of the voted post or comment, moving the vote from the
+    previous_value tally when it switched direction, and the change versions
+    of every page showing it.
+    """
+    now = timezone.now()
+    tallies = {tally_field(vote.value): F(tally_field(vote.value)) + 1}
+    if previous_value is not None:
+        tallies[tally_field(previous_value)] = F(tally_field(previous_value)) - 1
+    if vote.post_id is not None:
+        Post.objects.filter(pk=vote.post_id).update(**tallies, changed_at=now)
+        PostScore.refresh(vote.post_id)
+    else:
+        Comment.objects.filter(pk=vote.comment_id).update(**tallies)
+        Post.objects.filter(pk=vote.comment.post_id).update(changed_at=now)
+        UserStats.touch(vote.comment.user_id)
+
+
+def hot_score(upvote_count, downvote_count, created_at, now=None):
+    """
+    Net votes decayed by age, so new posts with few votes can outrank old
+    posts with many. Scores only shrink with time, so they must be refreshed
+    periodically (see the decay_hot_scores command).
+    """
+    now = now or timezone.now()
+    age_hours = max((now - created_at).total_seconds(), 0) / 3600
+    return (upvote_count - downvote_count) / (age_hours + 2) ** HOT_GRAVITY
 
 
 class Post(models.Model):
 
+    class Meta:
+        indexes = [
+            # serves the keyset pagination of the post list
+            models.Index(fields=['created_at', 'id'], name='post_created_at_id_idx'),
+            # serves the posts of a user newest first, e.g. timeline merges
+            models.Index(fields=['user', 'created_at', 'id'], name='post_user_created_at_id_idx'),
+            # serves the latest change of the post list
+            models.Index(fields=['changed_at'], name='post_changed_at_idx'),
+        ]
+
     title = models.CharField(
         blank=False,
         null=False,
@@ -21,9 +129,29 @@ class Post(models.Model):
         auto_now_add=True
     )
 
+    # indexed by post_user_created_at_id_idx
     user = models.ForeignKey(
         User,
-        on_delete=models.PROTECT
+        on_delete=models.PROTECT,
+        db_index=False
+    )
+
+    # denormalized tallies, kept in sync by Comment and Vote saves
+    upvote_count = models.PositiveIntegerField(
+        default=0
+    )
+
+    downvote_count = models.PositiveIntegerField(
+        default=0
+    )
+
+    comment_count = models.PositiveIntegerField(
+        default=0
+    )
+
+    # change version of the detail page, bumped by every comment and vote
+    changed_at = models.DateTimeField(
+        default=timezone.now
     )
 
     def __str__(self):
@@ -32,12 +160,87 @@ class Post(models.Model):
     def clean(self):
         if len(self.body) > 1000:
             raise ValidationError('Post body must be less than 1000 chars')
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            PostScore.objects.create(post=self)
+            TimelineEntry.fan_out(self)
+            UserStats.touch(self.user_id)
     
     def delete(self, *args, **kwargs):
         raise ValidationError('Posts can not be deleted')
 
 
+class PostScore(models.Model):
+    """
+    Materialized hot score of a post, refreshed on every post vote and
+    re-decayed periodically, so the hot feed is an index scan.
+    """
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['hot', 'post'], name='postscore_hot_post_idx'),
+        ]
+
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='score'
+    )
+
+    hot = models.FloatField(
+        default=0
+    )
+
+    updated_at = models.DateTimeField(
+        auto_now=True
+    )
+
+    @classmethod
+    def refresh(cls, post_id, now=None):
+        post = Post.objects.values('upvote_count', 'downvote_count', 'created_at').get(id=post_id)
+        cls.objects.update_or_create(post_id=post_id, defaults={
+            'hot': hot_score(post['upvote_count'], post['downvote_count'], post['created_at'], now)
+        })
+
+    @classmethod
+    def refresh_many(cls, post_ids, now=None):
+        now = now or timezone.now()
+        posts = Post.objects.filter(id__in=post_ids) \
+            .values_list('id', 'upvote_count', 'downvote_count', 'created_at')
+        scores = [
+            cls(post_id=id, hot=hot_score(upvote_count, downvote_count, created_at, now), updated_at=now)
+            for id, upvote_count, downvote_count, created_at in posts
+        ]
+        # creates scores missing for posts inserted in bulk, then overwrites
+        # all of them
+        cls.objects.bulk_create(scores, ignore_conflicts=True)
+        cls.objects.bulk_update(scores, ['hot', 'updated_at'])
+
+
 class Comment(models.Model):
+    """
+    A comment on a post, or a reply to another comment. The path holds the
+    position of the comment among its siblings, appended to the path of its
+    parent (see comment_path_step), so ordering by path reads a thread
+    depth first, and the replies of a comment at any depth are a range.
+    """
+
+    class Meta:
+        constraints = [
+            # serves threads and subtrees of a post in order, on the post detail
+            models.UniqueConstraint(fields=['post', 'path'], name='unique_comment_path'),
+        ]
+        indexes = [
+            # serves the comments of a post newest first, on the API
+            models.Index(fields=['post', 'created_at', 'id'], name='comment_post_created_at_id_idx'),
+            # serves the comments of a user newest first, on the user detail
+            models.Index(fields=['user', 'created_at', 'id'], name='comment_user_created_at_id_idx'),
+        ]
 
     body = models.TextField(
         blank=False,
@@ -49,83 +252,143 @@ class Comment(models.Model):
         auto_now_add=True
     )
 
+    # foreign keys are indexed by the composite indexes above
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
-        related_name='comments'
+        related_name='comments',
+        db_index=False
     )
 
     user = models.ForeignKey(
         User,
-        on_delete=models.PROTECT
+        on_delete=models.PROTECT,
+        db_index=False
     )
 
-    def __str__(self):
-        return self.body
-    
-    def delete(self, *args, **kwargs):
-        raise ValidationError('Posts can not be deleted')
-
-
-class Upvote(models.Model):
-    
-    class Meta:
-        constraints = [
-            models.UniqueConstraint(fields=['post', 'user'], name='unique_post_upvote'),
-            models.UniqueConstraint(fields=['comment', 'user'], name='unique_comment_upvote'),
-        ]
-
-    post = models.ForeignKey(
-        Post,
+    # replies are found by path, not by parent
+    parent = models.ForeignKey(
+        'self',
         on_delete=models.CASCADE,
-        blank=True,
+        related_name='replies',
         null=True,
-        related_name='upvotes'
+        blank=True,
+        db_index=False
     )
 
-    comment = models.ForeignKey(
-        Comment,
-        on_delete=models.CASCADE,
+    # set on creation, so blank until saved
+    path = models.CharField(
+        max_length=255,
         blank=True,
-        null=True,
-        related_name='upvotes'
+        editable=False
     )
 
-    created_at = models.DateTimeField(
-        auto_now_add=True
+    # denormalized tallies, kept in sync by Vote saves
+    upvote_count = models.PositiveIntegerField(
+        default=0
     )
 
-    user = models.ForeignKey(
-        User,
-        on_delete=models.PROTECT,
-        related_name='upvotes'
+    downvote_count = models.PositiveIntegerField(
+        default=0
     )
 
-    def clean(self):
-        if self.post != None and self.comment != None:
-            raise ValidationError('Post and comment are exclusive!')
-        
-        if self.post == None and self.comment == None:
-            raise ValidationError('Post or comment are required')
+    def __str__(self):
+        return self.body
+
+    @property
+    def depth(self):
+        return len(self.path) // settings.COMMENT_PATH_STEP_WIDTH - 1
+
+    @property
+    def accepts_replies(self):
+        return self.depth + 1 < settings.COMMENT_MAX_DEPTH
 
+    def descendants(self):
+        """
+        Returns the replies to the comment at any depth, in thread order.
+        """
+        return Comment.objects.filter(
+            post_id=self.post_id,
+            path__gt=self.path,
+            path__lt=self.path + COMMENT_PATH_END
+        ).order_by('path')
+
+    def clean(self):
+        if self.parent_id is None:
+            return
+        try:
+            parent = self.parent
+        except Comment.DoesNotExist:
+            raise ValidationError('Replies must be to an existing comment')
+        if parent.post_id != self.post_id:
+            raise ValidationError('Replies must be on the post of their parent')
+        if not parent.accepts_replies:
+            raise ValidationError(f'Replies can not be nested more than {settings.COMMENT_MAX_DEPTH} levels deep')
+
+    def next_path(self):
+        parent_path = self.parent.path if self.parent_id is not None else ''
+        # the last path under the parent belongs to its last reply or to a
+        # reply of it, and starts with the step of the last reply
+        last_path = Comment.objects.filter(
+            post_id=self.post_id,
+            path__gt=parent_path,
+            path__lt=parent_path + COMMENT_PATH_END
+        ).order_by('-path').values_list('path', flat=True).first()
+        position = 1
+        if last_path is not None:
+            step = last_path[len(parent_path):len(parent_path) + settings.COMMENT_PATH_STEP_WIDTH]
+            position = int(step, 36) + 1
+        return parent_path + comment_path_step(position)
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            # updating the post first takes the write lock, so concurrent
+            # comments on the post can not read the same last path
+            increment_counter(Post, self.post_id, 'comment_count', changed_at=timezone.now())
+            self.path = self.next_path()
+            super().save(*args, **kwargs)
+            UserStats.touch(self.user_id)
+    
     def delete(self, *args, **kwargs):
         raise ValidationError('Posts can not be deleted')
 
 
-class Downvote(models.Model):
-    
+class Vote(models.Model):
+    """
+    A vote of a user on a post or a comment, at most one per target: voting
+    again in the other direction switches the vote in place.
+    """
+
+    UP = 1
+    DOWN = -1
+
     class Meta:
         constraints = [
-            models.UniqueConstraint(fields=['post', 'user'], name='unique_post_downvote'),
-            models.UniqueConstraint(fields=['comment', 'user'], name='unique_comment_downvote'),
+            models.UniqueConstraint(fields=['post', 'user'], name='unique_post_vote'),
+            models.UniqueConstraint(fields=['comment', 'user'], name='unique_comment_vote'),
+            models.CheckConstraint(check=models.Q(value__in=[1, -1]), name='vote_value_up_or_down'),
         ]
-    
+        indexes = [
+            # serve the votes of a user on posts and on comments, each holding
+            # only the rows of its target
+            models.Index(fields=['user', 'post'], condition=models.Q(post__isnull=False), name='vote_user_post_idx'),
+            models.Index(fields=['user', 'comment'], condition=models.Q(comment__isnull=False), name='vote_user_comment_idx'),
+            # serves the votes of a user on any target, e.g. the PROTECT check
+            # of a user deletion, which the partial indexes above can not
+            models.Index(fields=['user'], name='vote_user_idx'),
+        ]
+
+    # foreign keys are indexed by the constraints and indexes above
+
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
         blank=True,
         null=True,
-        related_name='downvotes'
+        related_name='votes',
+        db_index=False
     )
 
     comment = models.ForeignKey(
@@ -133,7 +396,8 @@ class Downvote(models.Model):
         on_delete=models.CASCADE,
         blank=True,
         null=True,
-        related_name='downvotes'
+        related_name='votes',
+        db_index=False
     )
 
     created_at = models.DateTimeField(
@@ -143,18 +407,42 @@ class Downvote(models.Model):
     user = models.ForeignKey(
         User,
         on_delete=models.PROTECT,
-        related_name='downvotes'
+        related_name='votes',
+        db_index=False
+    )
+
+    value = models.SmallIntegerField(
+        choices=[(UP, 'Up'), (DOWN, 'Down')]
     )
 
     def clean(self):
-        if self.post != None and self.comment != None:
+        # ids, so validating a vote does not load its target
+        if self.post_id != None and self.comment_id != None:
             raise ValidationError('Post and comment are exclusive!')
         
-        if self.post == None and self.comment == None:
+        if self.post_id == None and self.comment_id == None:
             raise ValidationError('Post or comment are required')
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            target = {'post_id': self.post_id} if self.post_id is not None else {'comment_id': self.comment_id}
+            existing = Vote.objects.filter(user_id=self.user_id, **target).values('id', 'value', 'created_at').first()
+            if existing is None:
+                super().save(*args, **kwargs)
+                count_vote(self)
+                return
+            # the vote exists, switch its direction if it changed
+            self.id = existing['id']
+            self.created_at = existing['created_at']
+            self._state.adding = False
+            if existing['value'] != self.value:
+                Vote.objects.filter(id=self.id).update(value=self.value)
+                count_vote(self, previous_value=existing['value'])
+
     def delete(self, *args, **kwargs):
-        raise ValidationError('Posts can not be deleted')
+        raise ValidationError('Votes can not be deleted')
 
 
 class Follow(models.Model):
@@ -163,17 +451,26 @@ class Follow(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['follower', 'followed'], name='unique_follower_followed')
         ]
+        indexes = [
+            # serve the followers and followeds of a user newest first
+            models.Index(fields=['followed', 'created_at', 'id'], name='follow_followed_created_at_idx'),
+            models.Index(fields=['follower', 'created_at', 'id'], name='follow_follower_created_at_idx'),
+        ]
+
+    # foreign keys are indexed by the indexes above
 
     follower = models.ForeignKey(
         User,
         on_delete=models.PROTECT,
-        related_name='followeds'
+        related_name='followeds',
+        db_index=False
     )
 
     followed = models.ForeignKey(
         User,
         on_delete=models.PROTECT,
-        related_name='followers'
+        related_name='followers',
+        db_index=False
     )
 
     created_at = models.DateTimeField(
@@ -181,11 +478,139 @@ class Follow(models.Model):
     )
 
     def clean(self):
-        try:
-            if self.follower == self.followed:
-                raise ValidationError('Can not follow yourself')
-        except User.DoesNotExist:
-            pass
+        if self.follower_id is not None and self.follower_id == self.followed_id:
+            raise ValidationError('Can not follow yourself')
 
     def __str__(self):
         return f'{self.follower.username} → {self.followed.username}'
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            UserStats.increment(self.followed_id, 'follower_count')
+            UserStats.increment(self.follower_id, 'followed_count')
+            TimelineEntry.backfill(self.follower_id, self.followed_id)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            TimelineEntry.objects.filter(user_id=self.follower_id, post__user_id=self.followed_id).delete()
+            UserStats.increment(self.followed_id, 'follower_count', -1)
+            UserStats.increment(self.follower_id, 'followed_count', -1)
+            return super().delete(*args, **kwargs)
+
+
+class UserStats(models.Model):
+    """
+    Denormalized follow counters of a user, kept in sync by Follow saves and
+    deletes, and the change version of the user detail page. Rows are created
+    lazily, a missing row means zero.
+    """
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+
+    follower_count = models.PositiveIntegerField(
+        default=0
+    )
+
+    followed_count = models.PositiveIntegerField(
+        default=0
+    )
+
+    # bumped by follows, posts, comments and votes on comments of the user
+    changed_at = models.DateTimeField(
+        default=timezone.now
+    )
+
+    @classmethod
+    def increment(cls, user_id, field, amount=1):
+        cls.objects.get_or_create(user_id=user_id)
+        increment_counter(cls, user_id, field, amount, changed_at=timezone.now())
+
+    @classmethod
+    def touch(cls, user_id):
+        cls.objects.update_or_create(user_id=user_id, defaults={'changed_at': timezone.now()})
+
+    @classmethod
+    def touch_many(cls, user_ids):
+        cls.objects.bulk_create([cls(user_id=user_id) for user_id in user_ids], ignore_conflicts=True)
+        cls.objects.filter(user_id__in=user_ids).update(changed_at=timezone.now())
+
+    @classmethod
+    def recount(cls, user_ids):
+        # for follows inserted in bulk, which skip Follow.save
+        cls.touch_many(user_ids)
+        cls.objects.filter(user_id__in=user_ids).update(
+            follower_count=count_subquery(Follow, 'followed', outer='user_id'),
+            followed_count=count_subquery(Follow, 'follower', outer='user_id')
+        )
+
+    @classmethod
+    def is_celebrity(cls, user_id):
+        return cls.objects.filter(
+            user_id=user_id,
+            follower_count__gte=settings.TIMELINE_FANOUT_MAX_FOLLOWERS
+        ).exists()
+
+
+class TimelineEntry(models.Model):
+    """
+    A post in the home timeline of a user, written when the post is created
+    (fan-out-on-write). Posts of users with more than
+    TIMELINE_FANOUT_MAX_FOLLOWERS followers are not fanned out, they are
+    merged in when the timeline is read (see main.timeline).
+    """
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'], name='unique_timeline_user_post')
+        ]
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'post'], name='timeline_user_created_at_idx'),
+        ]
+
+    # indexed by unique_timeline_user_post
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        db_index=False
+    )
+
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+
+    # copied from the post, so the timeline is read from this table alone
+    created_at = models.DateTimeField()
+
+    @classmethod
+    def fan_out(cls, post):
+        user_ids = [post.user_id]
+        if not UserStats.is_celebrity(post.user_id):
+            user_ids += Follow.objects.filter(followed_id=post.user_id).values_list('follower_id', flat=True)
+        cls.objects.bulk_create(
+            [cls(user_id=user_id, post_id=post.id, created_at=post.created_at) for user_id in user_ids],
+            batch_size=settings.TIMELINE_FANOUT_BATCH_SIZE,
+            ignore_conflicts=True
+        )
+
+    @classmethod
+    def backfill(cls, user_id, followed_id):
+        if UserStats.is_celebrity(followed_id):
+            return
+        posts = Post.objects.filter(user_id=followed_id) \
+            .order_by('-created_at', '-id') \
+            .values_list('id', 'created_at')[:settings.TIMELINE_BACKFILL_SIZE]
+        cls.objects.bulk_create(
+            [cls(user_id=user_id, post_id=id, created_at=created_at) for id, created_at in posts],
+            ignore_conflicts=True
+        )
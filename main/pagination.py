@@ -0,0 +1,127 @@
+import base64
+import binascii
+import json
+from functools import reduce
+from operator import or_
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage:
+    """
+    A page of a keyset paginated queryset, with opaque cursors pointing to
+    the next and previous pages (None when there is no such page).
+    """
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def encode_cursor(values):
+    raw = json.dumps([str(value) for value in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, model, fields):
+    """
+    Returns the values of fields held by cursor, converted for model. Raises
+    InvalidCursor unless it holds one string (or integer) per field, each a
+    valid value of its field.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise InvalidCursor(cursor)
+        # bool is an int, but no cursor holds one
+        if any(type(value) not in (str, int) for value in values):
+            raise InvalidCursor(cursor)
+        values = [
+            model._meta.get_field(field).to_python(value)
+            for field, value in zip(fields, values)
+        ]
+    except (binascii.Error, TypeError, ValueError, ValidationError):
+        raise InvalidCursor(cursor)
+    # empty strings convert to None, which no key holds
+    if any(value is None for value in values):
+        raise InvalidCursor(cursor)
+    return values
+
+
+def keyset_filter(fields, values, lookup):
+    """
+    Builds the lexicographic comparison (f1, f2, ...) <lookup> (v1, v2, ...)
+    as an OR of prefix equalities. The OR alone is planned as one lookup per
+    branch followed by a sort, so it is bounded by f1 <lookup>= v1, which
+    SQLite serves with a single index range scan in index order.
+    """
+    conditions = []
+    for position, field in enumerate(fields):
+        equalities = dict(zip(fields[:position], values[:position]))
+        equalities[f'{field}__{lookup}'] = values[position]
+        conditions.append(Q(**equalities))
+    return Q(**{f'{fields[0]}__{lookup}e': values[0]}) & reduce(or_, conditions)
+
+
+def keyset_paginate(queryset, after=None, before=None, per_page=20, fields=('created_at', 'id'), ascending=False):
+    """
+    Paginates queryset newest first on fields (in fields order if ascending),
+    without OFFSET: every page is a range scan starting at the cursor, so deep
+    pages cost the same as the first. Raises InvalidCursor if a cursor can not
+    be decoded.
+    """
+    fields = list(fields)
+    descending = [f'-{field}' for field in fields]
+    forward, backward = (list(fields), descending) if ascending else (descending, list(fields))
+    next_lookup, previous_lookup = ('gt', 'lt') if ascending else ('lt', 'gt')
+
+    if before is not None:
+        values = decode_cursor(before, queryset.model, fields)
+        rows = list(
+            queryset.filter(keyset_filter(fields, values, previous_lookup))
+            .order_by(*backward)[:per_page + 1]
+        )
+        has_more = len(rows) > per_page
+        object_list = list(reversed(rows[:per_page]))
+        has_next = True
+        has_previous = has_more
+    else:
+        if after is not None:
+            values = decode_cursor(after, queryset.model, fields)
+            queryset = queryset.filter(keyset_filter(fields, values, next_lookup))
+        rows = list(queryset.order_by(*forward)[:per_page + 1])
+        object_list = rows[:per_page]
+        has_next = len(rows) > per_page
+        has_previous = after is not None
+
+    if not object_list:
+        return KeysetPage([], None, None)
+
+    def cursor_of(instance):
+        return encode_cursor(getattr(instance, field) for field in fields)
+
+    return KeysetPage(
+        object_list,
+        cursor_of(object_list[-1]) if has_next else None,
+        cursor_of(object_list[0]) if has_previous else None
+    )
@@ -0,0 +1,90 @@
+import asyncio
+import random
+from contextvars import ContextVar
+from functools import wraps
+from django.conf import settings
+
+
+# database alias reads are routed to, None means the default database
+read_database = ContextVar('read_database', default=None)
+
+# set on responses to writes, so the writer reads its own writes from the
+# primary until replicas catch up
+STICKY_COOKIE = 'devboard_primary'
+
+
+class ReplicaRouter:
+    """
+    Routes reads to the database chosen for the current request (see
+    read_from_replica) and every write to the primary. Replicas are copies
+    of the primary, so nothing is migrated on them.
+    """
+
+    def db_for_read(self, model, **hints):
+        return read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+def choose_read_database(request):
+    if request.method not in ('GET', 'HEAD'):
+        return 'default'
+    if not settings.DATABASE_REPLICAS or STICKY_COOKIE in request.COOKIES:
+        return 'default'
+    return random.choice(settings.DATABASE_REPLICAS)
+
+
+def read_from_replica(view):
+    """
+    Serves safe requests of view from a random replica, unless the client
+    wrote something in the last REPLICA_STICKY_SECONDS.
+    """
+    if asyncio.iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            # sync_to_async copies the context, so queries of the view run
+            # in other threads are routed too
+            token = read_database.set(choose_read_database(request))
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                read_database.reset(token)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = read_database.set(choose_read_database(request))
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            read_database.reset(token)
+    return wrapper
+
+
+class PrimaryStickinessMiddleware:
+    """
+    Pins clients to the primary for a short window after every write, so the
+    redirect after a vote or a comment shows it.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and settings.DATABASE_REPLICAS:
+            response.set_cookie(
+                STICKY_COOKIE,
+                '1',
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True,
+                samesite='Lax'
+            )
+        return response
@@ -0,0 +1,115 @@
+import re
+from django.db import connection, connections
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+
+# snippet() wraps matches in these, they are swapped for <mark> after escaping
+MATCH_START = '\x02'
+MATCH_END = '\x03'
+
+# title matches weigh more than body matches
+BM25_WEIGHTS = (10.0, 1.0)
+
+# full-text index of post titles and bodies and comment bodies, title is
+# empty for comments, as created by the 0014_search_index migration
+SEARCH_TABLE = """
+    CREATE VIRTUAL TABLE {name} USING fts5(
+        title,
+        body,
+        kind UNINDEXED,
+        object_id UNINDEXED,
+        post_id UNINDEXED,
+        tokenize = 'porter unicode61'
+    )
+"""
+
+# posts and comments can not be changed or deleted, so inserts are all that
+# needs syncing
+TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS main_search_post_insert AFTER INSERT ON main_post BEGIN
+        INSERT INTO main_search (title, body, kind, object_id, post_id)
+        VALUES (new.title, new.body, 'post', new.id, new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS main_search_comment_insert AFTER INSERT ON main_comment BEGIN
+        INSERT INTO main_search (title, body, kind, object_id, post_id)
+        VALUES ('', new.body, 'comment', new.id, new.post_id);
+    END
+    """,
+]
+
+
+class SearchResult:
+
+    def __init__(self, kind, object_id, post_id, title, snippet):
+        self.kind = kind
+        self.object_id = object_id
+        self.post_id = post_id
+        self.title = title
+        self.snippet = snippet
+
+    @property
+    def url(self):
+        if self.kind == 'comment':
+            return f'/post/{self.post_id}/#comment-{self.object_id}'
+        return f'/post/{self.post_id}/'
+
+
+def build_match_query(query):
+    """
+    Turns free text into an FTS5 query of quoted terms, all required, so user
+    input can not inject FTS5 syntax.
+    """
+    terms = re.findall(r'\w+', query)
+    return ' '.join(f'"{term}"' for term in terms)
+
+
+def highlight(snippet):
+    snippet = escape(snippet)
+    snippet = snippet.replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>')
+    return mark_safe(snippet)
+
+
+def search(query, page=1, per_page=20):
+    """
+    Returns the results of page (1-based) ranked by BM25, and whether there
+    is a next page.
+    """
+    match_query = build_match_query(query)
+    if not match_query:
+        return [], False
+    sql = f"""
+        SELECT
+            main_search.kind,
+            main_search.object_id,
+            main_search.post_id,
+            main_post.title,
+            snippet(main_search, -1, '{MATCH_START}', '{MATCH_END}', '…', 16)
+        FROM main_search
+        INNER JOIN main_post ON main_post.id = main_search.post_id
+        WHERE main_search MATCH %s
+        ORDER BY bm25(main_search, {BM25_WEIGHTS[0]}, {BM25_WEIGHTS[1]})
+        LIMIT %s OFFSET %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match_query, per_page + 1, (page - 1) * per_page])
+        rows = cursor.fetchall()
+    results = [
+        SearchResult(kind, object_id, post_id, title, highlight(snippet))
+        for kind, object_id, post_id, title, snippet in rows[:per_page]
+    ]
+    return results, len(rows) > per_page
+
+
+def create_triggers(using='default', **kwargs):
+    """
+    Creates the triggers syncing the search index. Migrations altering posts
+    or comments rebuild their tables, which drops the triggers, so this runs
+    after every migrate.
+    """
+    with connections[using].cursor() as cursor:
+        for sql in TRIGGERS:
+            cursor.execute(sql)
@@ -0,0 +1,170 @@
+"""
+Static files, fingerprinted and precompressed by collectstatic and served by
+StaticFilesMiddleware.
+
+CompressedManifestStaticFilesStorage writes every file with the hash of its
+content in its name, then a gzip (.gz) and, with the brotli package
+installed, a brotli (.br) copy of the compressible ones. Pages link to the
+hashed names, which never change content, so they are cached for a year.
+"""
+import gzip
+import mimetypes
+import os
+from dataclasses import dataclass, field
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.files.base import ContentFile
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.json', '.map', '.svg', '.txt', '.xml')
+
+# smaller files gain less than the headers of the compressed response cost
+MIN_COMPRESS_SIZE = 256
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# names without a hash may change content at the next deploy
+MUTABLE_CACHE_CONTROL = 'public, max-age=60'
+
+# preferred first
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+
+
+def compress(content):
+    """
+    Returns the compressed copies of content worth keeping, by encoding.
+    """
+    copies = {'gzip': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        copies['br'] = brotli.compress(content, quality=11)
+    return {encoding: copy for encoding, copy in copies.items() if len(copy) < len(content) * 0.9}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        # originals and their hashed names mostly hold the same content
+        compressed = {}
+        for name in set(paths) | set(self.hashed_files.values()):
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS) or self.size(name) < MIN_COMPRESS_SIZE:
+                continue
+            with self.open(name) as file:
+                content = file.read()
+            if content not in compressed:
+                compressed[content] = compress(content)
+            copies = compressed[content]
+            for encoding, copy in copies.items():
+                copy_name = name + ENCODINGS[encoding]
+                if self.exists(copy_name):
+                    self.delete(copy_name)
+                self._save(copy_name, ContentFile(copy))
+                yield name, copy_name, True
+
+
+@dataclass
+class StaticFile:
+    path: str
+    content_type: str
+    last_modified: float
+    immutable: bool
+    # encoding -> path of the compressed copy
+    copies: dict = field(default_factory=dict)
+
+
+def index_static_root():
+    """
+    Returns the files collected in STATIC_ROOT by name, read once, so serving
+    them needs no lookup in the filesystem.
+    """
+    files = {}
+    if not settings.STATIC_ROOT or not os.path.isdir(settings.STATIC_ROOT):
+        return files
+    hashed_names = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+    suffixes = tuple(ENCODINGS.values())
+    for directory, _, filenames in os.walk(settings.STATIC_ROOT):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            if filename.endswith(suffixes) and os.path.exists(path.rsplit('.', 1)[0]):
+                continue
+            name = os.path.relpath(path, settings.STATIC_ROOT).replace(os.sep, '/')
+            content_type, _ = mimetypes.guess_type(filename)
+            files[name] = StaticFile(
+                path=path,
+                content_type=content_type or 'application/octet-stream',
+                last_modified=os.path.getmtime(path),
+                immutable=name in hashed_names,
+                copies={
+                    encoding: path + suffix
+                    for encoding, suffix in ENCODINGS.items()
+                    if os.path.exists(path + suffix)
+                }
+            )
+    return files
+
+
+def accepted_encodings(header):
+    """
+    Returns the encodings of an Accept-Encoding header, but those with q=0.
+    """
+    encodings = set()
+    for part in header.split(','):
+        encoding, _, parameters = part.partition(';')
+        try:
+            quality = float(parameters.strip().removeprefix('q=') or 1)
+        except ValueError:
+            quality = 1
+        if quality > 0:
+            encodings.add(encoding.strip().lower())
+    return encodings
+
+
+class StaticFilesMiddleware:
+    """
+    Serves the files collected in STATIC_ROOT under STATIC_URL, with their
+    brotli or gzip copy when the client accepts it. Files are indexed when
+    the server starts, so restart it after collectstatic.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL
+        self.files = index_static_root()
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and request.path_info.startswith(self.prefix):
+            static_file = self.files.get(request.path_info[len(self.prefix):])
+            if static_file is not None:
+                return self.serve(request, static_file)
+        return self.get_response(request)
+
+    def serve(self, request, static_file):
+        if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), static_file.last_modified):
+            response = HttpResponseNotModified()
+        else:
+            accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+            encoding = next((encoding for encoding in static_file.copies if encoding in accepted), None)
+            response = FileResponse(open(static_file.copies.get(encoding, static_file.path), 'rb'))
+            # FileResponse guesses both from the name of the file it sends
+            response.headers['Content-Type'] = static_file.content_type
+            del response.headers['Content-Disposition']
+            if encoding is not None:
+                response.headers['Content-Encoding'] = encoding
+        response.headers['Last-Modified'] = http_date(static_file.last_modified)
+        response.headers['Cache-Control'] = (
+            IMMUTABLE_CACHE_CONTROL if static_file.immutable else MUTABLE_CACHE_CONTROL
+        )
+        if static_file.copies:
+            patch_vary_headers(response, ['Accept-Encoding'])
+        return response
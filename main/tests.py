@@ -1,6 +1,35 @@
-from django.test import TestCase
+import asyncio
+import base64
+import gzip
+import json
+import tempfile
+import threading
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import caches
+from django.db import connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.test import (
+    AsyncRequestFactory,
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.core.management import call_command
 from django.core.exceptions import ValidationError
-from django.contrib.auth.models import User
+from django.core.management.base import CommandError
+from django.http import Http404, HttpResponse
+from django.contrib.auth.models import AnonymousUser, User
 from main.forms import (
     UserCreateForm,
     UserLoginForm,
@@ -9,11 +38,42 @@ from main.forms import (
 )
 from main.models import (
     Post,
+    PostScore,
     Comment,
-    Upvote,
-    Downvote,
-    Follow
+    Vote,
+    Follow,
+    TimelineEntry,
+    UserStats,
+    comment_path_step,
+    hot_score
+)
+from main.fragments import (
+    comment_body_fragment,
+    post_body_fragment
+)
+from main import api, async_views, journal, staticfiles, views
+from main.graph import (
+    FollowGraph,
+    clear_follow_graph,
+    follow_changed,
+    follow_graph
+)
+from main.instrumentation import RequestTiming, RequestTimingMiddleware
+from main.loading import aload, load
+from main.routers import (
+    STICKY_COOKIE,
+    ReplicaRouter,
+    choose_read_database,
+    read_database
 )
+from main.search import search
+from main.votes import (
+    flush_votes,
+    ingest_votes
+)
+from main.timeline import read_timeline
+from main.urls import urlpatterns
+from main.views import POST_COMMENTS_PAGE_SIZE, USER_DETAIL_PAGE_SIZE
 
 
 class PostTest(TestCase):
@@ -53,6 +113,43 @@ class PostTest(TestCase):
         with self.assertRaises(ValidationError):
             test_post.delete()
 
+    def test_if_counters_are_updated_on_comment_and_votes(self):
+        test_user = User.objects.create_user(username='test', password='secret')
+        test_post = Post.objects.create(title='test', body='test', user=test_user)
+        test_user_2 = User.objects.create_user(username='test 2', password='secret')
+        Comment.objects.create(post=test_post, body='test', user=test_user)
+        Vote.objects.create(post=test_post, user=test_user, value=Vote.UP)
+        Vote.objects.create(post=test_post, user=test_user_2, value=Vote.DOWN)
+        test_post.refresh_from_db()
+        self.assertEqual(test_post.comment_count, 1)
+        self.assertEqual(test_post.upvote_count, 1)
+        self.assertEqual(test_post.downvote_count, 1)
+
+
+class PostScoreTest(TestCase):
+
+    def test_if_score_is_created_with_post(self):
+        test_user = User.objects.create_user(username='test', password='secret')
+        test_post = Post.objects.create(title='test', body='test', user=test_user)
+        self.assertEqual(test_post.score.hot, 0)
+
+    def test_if_score_is_refreshed_on_post_votes(self):
+        test_user_1 = User.objects.create_user(username='test 1', password='secret')
+        test_user_2 = User.objects.create_user(username='test 2', password='secret')
+        test_post = Post.objects.create(title='test', body='test', user=test_user_1)
+        Vote.objects.create(post=test_post, user=test_user_1, value=Vote.UP)
+        Vote.objects.create(post=test_post, user=test_user_2, value=Vote.UP)
+        self.assertGreater(PostScore.objects.get(post=test_post).hot, 0)
+        Vote.objects.create(post=test_post, user=test_user_1, value=Vote.DOWN)
+        self.assertEqual(PostScore.objects.get(post=test_post).hot, 0)
+
+    def test_if_hot_score_decays_with_age(self):
+        now = timezone.now()
+        fresh = hot_score(10, 0, now, now)
+        old = hot_score(10, 0, now - timedelta(days=1), now)
+        self.assertGreater(fresh, old)
+        self.assertLess(hot_score(0, 10, now, now), 0)
+
 
 class CommentTest(TestCase):
     
@@ -79,6 +176,48 @@ class CommentTest(TestCase):
         with self.assertRaises(ValidationError):
             test_comment.full_clean()
 
+    def test_if_threads_are_ordered_depth_first(self):
+        test_user = User.objects.create_user(username='test', password='secret')
+        test_post = Post.objects.create(title='test', body='test', user=test_user)
+
+        def comment(body, parent=None):
+            return Comment.objects.create(post=test_post, parent=parent, body=body, user=test_user)
+
+        first = comment('first')
+        second = comment('second')
+        first_reply = comment('first reply', first)
+        nested_reply = comment('nested reply', first_reply)
+        comment('second reply', first)
+        comment('reply to second', second)
+        self.assertEqual((first.path, first_reply.path, nested_reply.path), ('0001', '00010001', '000100010001'))
+        self.assertEqual((first.depth, nested_reply.depth), (0, 2))
+        self.assertEqual(
+            [comment.body for comment in test_post.comments.order_by('path')],
+            ['first', 'first reply', 'nested reply', 'second reply', 'second', 'reply to second']
+        )
+        self.assertEqual(
+            [comment.body for comment in first.descendants()],
+            ['first reply', 'nested reply', 'second reply']
+        )
+
+    @override_settings(COMMENT_MAX_DEPTH=2)
+    def test_if_replies_are_nested_at_most_max_depth_levels(self):
+        test_user = User.objects.create_user(username='test', password='secret')
+        test_post = Post.objects.create(title='test', body='test', user=test_user)
+        parent = Comment.objects.create(post=test_post, body='test', user=test_user)
+        reply = Comment.objects.create(post=test_post, parent=parent, body='test', user=test_user)
+        self.assertFalse(reply.accepts_replies)
+        with self.assertRaises(ValidationError):
+            Comment(post=test_post, parent=reply, body='test', user=test_user).full_clean()
+
+    @override_settings(COMMENT_PATH_STEP_WIDTH=1)
+    def test_if_replies_of_a_comment_are_bounded(self):
+        test_user = User.objects.create_user(username='test', password='secret')
+        test_post = Post.objects.create(title='test', body='test', user=test_user)
+        Comment.objects.bulk_create([Comment(post=test_post, body='test', user=test_user, path='z')])
+        with self.assertRaises(ValidationError):
+            Comment.objects.create(post=test_post, body='test', user=test_user)
+
     def test_if_body_field_has_at_most_500_chars(self):
         test_user = User.objects.create_user(username='test', password='secret')
         long_body = 'a' * 501
@@ -106,21 +245,42 @@ class CommentTest(TestCase):
         with self.assertRaises(ValidationError):
             test_comment.delete()
 
+    def test_if_counters_are_updated_on_votes(self):
+        test_user = User.objects.create_user(username='test', password='secret')
+        test_post = Post.objects.create(title='test', body='test', user=test_user)
+        test_comment = Comment.objects.create(post=test_post, body='test', user=test_user)
+        test_user_2 = User.objects.create_user(username='test 2', password='secret')
+        Vote.objects.create(comment=test_comment, user=test_user, value=Vote.UP)
+        Vote.objects.create(comment=test_comment, user=test_user_2, value=Vote.DOWN)
+        test_comment.refresh_from_db()
+        test_post.refresh_from_db()
+        self.assertEqual(test_comment.upvote_count, 1)
+        self.assertEqual(test_comment.downvote_count, 1)
+        self.assertEqual(test_post.upvote_count, 0)
+        self.assertEqual(test_post.downvote_count, 0)
+
 
-class UpvoteTest(TestCase):
+class VoteTest(TestCase):
 
     def test_if_post_or_comment_is_required(self):
         test_user = User.objects.create_user(username='test', password='secret')
-        test_upvote = Upvote(post=None, comment=None, user=test_user)
+        test_vote = Vote(post=None, comment=None, user=test_user, value=Vote.UP)
         with self.assertRaises(ValidationError):
-            test_upvote.full_clean()
+            test_vote.full_clean()
 
     def test_if_user_is_required(self):
         test_user = User.objects.create_user(username='test', password='secret')
         test_post = Post.objects.create(title='test', body='test', user=test_user)
-        test_upvote = Upvote(post=test_post, user=None)
+        test_vote = Vote(post=test_post, user=None, value=Vote.UP)
         with self.assertRaises(ValidationError):
-            test_upvote.full_clean()
+            test_vote.full_clean()
+
+    def test_if_value_is_up_or_down(self):
+        test_user = User.objects.create_user(username='test', password='secret')
+        test_post = Post.objects.create(title='test', body='test', user=test_user)
+        test_vote = Vote(post=test_post, user=test_user, value=2)
+        with self.assertRaises(ValidationError):
+            test_vote.full_clean()
 
     def test_if_created_at_is_required(self):
         pass # Django ensures that created_at is set
@@ -129,94 +289,58 @@ class UpvoteTest(TestCase):
         test_user = User.objects.create_user(username='test', password='secret')
         test_post = Post.objects.create(title='test', body='test', user=test_user)
         test_comment = Comment.objects.create(body='test', post=test_post, user=test_user)
-        test_upvote = Upvote(post=test_post, comment=test_comment, user=test_user)
+        test_vote = Vote(post=test_post, comment=test_comment, user=test_user, value=Vote.UP)
         with self.assertRaises(ValidationError):
-            test_upvote.full_clean()
+            test_vote.full_clean()
     
     def test_if_created_at_is_defined_automatically(self):
         test_user = User.objects.create_user(username='test', password='secret')
         test_post = Post.objects.create(title='test', body='test', user=test_user)
-        test_upvote = Upvote.objects.create(post=test_post, user=test_user)
-        self.assertIsNotNone(test_upvote.created_at)
+        test_vote = Vote.objects.create(post=test_post, user=test_user, value=Vote.UP)
+        self.assertIsNotNone(test_vote.created_at)
 
-    def test_if_upvote_can_not_be_deleted(self):
+    def test_if_vote_can_not_be_deleted(self):
         test_user = User.objects.create_user(username='test', password='secret')
         test_post = Post.objects.create(title='test', body='test', user=test_user)
-        test_upvote = Upvote.objects.create(post=test_post, user=test_user)
+        test_vote = Vote.objects.create(post=test_post, user=test_user, value=Vote.UP)
         with self.assertRaises(ValidationError):
-            test_upvote.delete()
+            test_vote.delete()
 
-    def test_if_user_can_not_upvote_the_same_post_more_than_once(self):
+    def test_if_user_can_not_vote_the_same_post_more_than_once(self):
         test_user = User.objects.create_user(username='test', password='secret')
         test_post = Post.objects.create(title='test', body='test', user=test_user)
-        Upvote.objects.create(post=test_post, user=test_user)
+        Vote.objects.create(post=test_post, user=test_user, value=Vote.UP)
         with self.assertRaises(ValidationError):
-            duplicated_upvote = Upvote(post=test_post, user=test_user)
-            duplicated_upvote.full_clean()
+            duplicated_vote = Vote(post=test_post, user=test_user, value=Vote.DOWN)
+            duplicated_vote.full_clean()
 
-    def test_if_user_can_not_upvote_the_same_comment_more_than_once(self):
+    def test_if_user_can_not_vote_the_same_comment_more_than_once(self):
         test_user = User.objects.create_user(username='test', password='secret')
         test_post = Post.objects.create(title='test', body='test', user=test_user)
-        # test_comment = Comment.objects.create(body='test', post=test_post, user=test_user)
         test_comment = test_post.comments.create(body='test', user=test_user)
-        Upvote.objects.create(comment=test_comment, user=test_user)
-        with self.assertRaises(ValidationError):
-            duplicated_upvote = Upvote(comment=test_comment, user=test_user)
-            duplicated_upvote.full_clean()
-
-class DownvoteTest(TestCase):
-    
-    def test_if_post_or_comment_is_required(self):
-        test_user = User.objects.create_user(username='test', password='secret')
-        test_downvote = Downvote(post=None, comment=None, user=test_user)
-        with self.assertRaises(ValidationError):
-            test_downvote.full_clean()
-
-    def test_if_user_is_required(self):
-        test_user = User.objects.create_user(username='test', password='secret')
-        test_post = Post.objects.create(title='test', body='test', user=test_user)
-        test_downvote = Downvote(post=test_post, user=None)
-        with self.assertRaises(ValidationError):
-            test_downvote.full_clean()
-
-    def test_if_post_and_comment_are_exclusive(self):
-        test_user = User.objects.create_user(username='test', password='secret')
-        test_post = Post.objects.create(title='test', body='test', user=test_user)
-        test_comment = Comment.objects.create(body='test', post=test_post, user=test_user)
-        test_downvote = Downvote(post=test_post, comment=test_comment, user=test_user)
-        with self.assertRaises(ValidationError):
-            test_downvote.full_clean()
-    
-    def test_if_created_at_is_defined_automatically(self):
-        test_user = User.objects.create_user(username='test', password='secret')
-        test_post = Post.objects.create(title='test', body='test', user=test_user)
-        test_downvote = Downvote.objects.create(post=test_post, user=test_user)
-        self.assertIsNotNone(test_downvote.created_at)
-
-    def test_if_downvote_can_not_be_deleted(self):
-        test_user = User.objects.create_user(username='test', password='secret')
-        test_post = Post.objects.create(title='test', body='test', user=test_user)
-        test_downvote = Downvote.objects.create(post=test_post, user=test_user)
+        Vote.objects.create(comment=test_comment, user=test_user, value=Vote.UP)
         with self.assertRaises(ValidationError):
-            test_downvote.delete()
+            duplicated_vote = Vote(comment=test_comment, user=test_user, value=Vote.DOWN)
+            duplicated_vote.full_clean()
 
-    def test_if_user_can_not_downvote_the_same_post_more_than_once(self):
+    def test_if_voting_again_switches_the_vote_in_place(self):
         test_user = User.objects.create_user(username='test', password='secret')
         test_post = Post.objects.create(title='test', body='test', user=test_user)
-        Downvote.objects.create(post=test_post, user=test_user)
-        with self.assertRaises(ValidationError):
-            duplicated_downvote = Downvote(post=test_post, user=test_user)
-            duplicated_downvote.full_clean()
-
-    def test_if_user_can_not_downvote_the_same_comment_more_than_once(self):
+        test_vote = Vote.objects.create(post=test_post, user=test_user, value=Vote.UP)
+        switched_vote = Vote.objects.create(post=test_post, user=test_user, value=Vote.DOWN)
+        self.assertEqual(switched_vote.id, test_vote.id)
+        self.assertEqual(list(test_post.votes.values_list('value', flat=True)), [Vote.DOWN])
+        test_post.refresh_from_db()
+        self.assertEqual((test_post.upvote_count, test_post.downvote_count), (0, 1))
+
+    def test_if_voting_again_in_the_same_direction_changes_nothing(self):
         test_user = User.objects.create_user(username='test', password='secret')
         test_post = Post.objects.create(title='test', body='test', user=test_user)
-        # test_comment = Comment.objects.create(body='test', post=test_post, user=test_user)
-        test_comment = test_post.comments.create(body='test', user=test_user)
-        Downvote.objects.create(comment=test_comment, user=test_user)
-        with self.assertRaises(ValidationError):
-            duplicated_downvote = Downvote(comment=test_comment, user=test_user)
-            duplicated_downvote.full_clean()
+        Vote.objects.create(post=test_post, user=test_user, value=Vote.UP)
+        with self.assertNumQueries(3):
+            Vote.objects.create(post=test_post, user=test_user, value=Vote.UP)
+        test_post.refresh_from_db()
+        self.assertEqual((test_post.upvote_count, test_post.downvote_count), (1, 0))
 
 
 class FollowTest(TestCase):
@@ -260,6 +384,155 @@ class FollowTest(TestCase):
         self.assertEqual(str(test_follow), 'test 1 → test 2')
 
 
+class UserStatsTest(TestCase):
+
+    def test_if_counters_follow_follows(self):
+        test_user_1 = User.objects.create_user(username='test 1', password='secret')
+        test_user_2 = User.objects.create_user(username='test 2', password='secret')
+        follow = Follow.objects.create(follower=test_user_1, followed=test_user_2)
+        self.assertEqual(UserStats.objects.get(user=test_user_1).followed_count, 1)
+        self.assertEqual(UserStats.objects.get(user=test_user_2).follower_count, 1)
+        follow.delete()
+        self.assertEqual(UserStats.objects.get(user=test_user_1).followed_count, 0)
+        self.assertEqual(UserStats.objects.get(user=test_user_2).follower_count, 0)
+
+
+class TimelineTest(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='secret')
+        self.reader = User.objects.create_user(username='reader', password='secret')
+
+    def test_if_posts_are_fanned_out_to_followers(self):
+        Follow.objects.create(follower=self.reader, followed=self.author)
+        test_post = Post.objects.create(title='test', body='test', user=self.author)
+        self.assertTrue(TimelineEntry.objects.filter(user=self.reader, post=test_post).exists())
+        self.assertTrue(TimelineEntry.objects.filter(user=self.author, post=test_post).exists())
+
+    def test_if_recent_posts_are_backfilled_on_follow(self):
+        test_post = Post.objects.create(title='test', body='test', user=self.author)
+        follow = Follow.objects.create(follower=self.reader, followed=self.author)
+        self.assertEqual(list(read_timeline(self.reader)), [test_post])
+        follow.delete()
+        self.assertEqual(list(read_timeline(self.reader)), [])
+
+    @override_settings(TIMELINE_FANOUT_MAX_FOLLOWERS=1)
+    def test_if_celebrity_posts_are_merged_at_read_time(self):
+        Follow.objects.create(follower=self.reader, followed=self.author)
+        other = User.objects.create_user(username='other', password='secret')
+        first_post = Post.objects.create(title='first', body='test', user=self.author)
+        second_post = Post.objects.create(title='second', body='test', user=self.reader)
+        third_post = Post.objects.create(title='third', body='test', user=self.author)
+        Post.objects.create(title='unrelated', body='test', user=other)
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader, post__user=self.author).exists())
+        self.assertEqual(list(read_timeline(self.reader)), [third_post, second_post, first_post])
+
+    @override_settings(TIMELINE_FANOUT_MAX_FOLLOWERS=1)
+    def test_if_paginates_merged_timeline(self):
+        Follow.objects.create(follower=self.reader, followed=self.author)
+        for i in range(5):
+            Post.objects.create(title=f'author {i}', body='test', user=self.author)
+            Post.objects.create(title=f'reader {i}', body='test', user=self.reader)
+        first_page = read_timeline(self.reader, per_page=4)
+        second_page = read_timeline(self.reader, after=first_page.next_cursor, per_page=4)
+        third_page = read_timeline(self.reader, after=second_page.next_cursor, per_page=4)
+        titles = [post.title for page in (first_page, second_page, third_page) for post in page]
+        self.assertEqual(titles[:2], ['reader 4', 'author 4'])
+        self.assertEqual(len(titles), 10)
+        self.assertEqual(len(set(titles)), 10)
+        self.assertFalse(third_page.has_next)
+
+
+class FollowGraphTest(TestCase):
+
+    def setUp(self):
+        clear_follow_graph()
+        self.addCleanup(clear_follow_graph)
+        self.users = {
+            name: User.objects.create_user(username=name, password='secret')
+            for name in ('ana', 'bob', 'cid', 'dee', 'eve')
+        }
+        for follower, followed in [
+            ('ana', 'bob'), ('ana', 'cid'), ('bob', 'dee'), ('cid', 'dee'), ('cid', 'eve'), ('bob', 'ana')
+        ]:
+            Follow.objects.create(follower=self.users[follower], followed=self.users[followed])
+
+    def suggested(self, name):
+        return [
+            (User.objects.get(id=id).username, count)
+            for id, count in follow_graph().suggestions(self.users[name].id, 5)
+        ]
+
+    def test_if_suggests_users_followed_by_followeds(self):
+        self.assertEqual(self.suggested('ana'), [('dee', 2), ('eve', 1)])
+        self.assertEqual(self.suggested('eve'), [])
+
+    def test_if_applies_follow_changes_in_place(self):
+        graph = follow_graph()
+        follow_changed(self.users['ana'].id, self.users['dee'].id, following=True)
+        follow_changed(self.users['cid'].id, self.users['dee'].id, following=False)
+        follow_changed(self.users['cid'].id, self.users['dee'].id, following=True)
+        follow_changed(self.users['bob'].id, self.users['eve'].id, following=True)
+        self.assertIs(follow_graph(), graph)
+        self.assertEqual(self.suggested('ana'), [('eve', 2)])
+        follow_changed(self.users['bob'].id, self.users['eve'].id, following=False)
+        self.assertEqual(self.suggested('ana'), [('eve', 1)])
+
+    def test_if_serves_the_old_graph_while_reloading(self):
+        old_graph = follow_graph()
+        old_graph.loaded_at -= settings.FOLLOW_GRAPH_MAX_AGE + 1
+        load = FollowGraph.load
+
+        def load_meanwhile():
+            new_graph = load()
+            # requests during the reload read the old graph, and their changes
+            # reach the new one
+            self.assertIs(follow_graph(), old_graph)
+            follow_changed(self.users['ana'].id, self.users['dee'].id, following=True)
+            return new_graph
+
+        with mock.patch.object(FollowGraph, 'load', side_effect=load_meanwhile):
+            new_graph = follow_graph()
+        self.assertIsNot(new_graph, old_graph)
+        self.assertIs(follow_graph(), new_graph)
+        self.assertEqual(self.suggested('ana'), [('eve', 1)])
+
+    def test_if_loads_from_the_primary(self):
+        token = read_database.set('missing replica')
+        try:
+            graph = FollowGraph.load()
+        finally:
+            read_database.reset(token)
+        self.assertEqual(len(graph.targets), 6)
+
+    def test_if_follow_views_update_graph(self):
+        follow_graph()
+        self.client.login(username='ana', password='secret')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/user/{self.users["dee"].id}/follow/create/')
+        self.assertEqual(self.suggested('ana'), [('eve', 1)])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/user/{self.users["dee"].id}/follow/delete/')
+        self.assertEqual(self.suggested('ana'), [('dee', 2), ('eve', 1)])
+
+    def test_if_renders_suggestions_on_own_page(self):
+        self.client.login(username='ana', password='secret')
+        response = self.client.get(f'/user/{self.users["ana"].id}/')
+        self.assertEqual(
+            [(user.username, count) for user, count in response.context['suggestions']],
+            [('dee', 2), ('eve', 1)]
+        )
+        self.assertContains(response, 'Who to follow')
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/user/{self.users["eve"].id}/follow/create/')
+        response = self.client.get(f'/user/{self.users["ana"].id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(user.username, count) for user, count in response.context['suggestions']], [('dee', 2)])
+        response = self.client.get(f'/user/{self.users["bob"].id}/')
+        self.assertNotIn('suggestions', response.context)
+
+
 class HomeViewTest(TestCase):
 
     def test_if_returns_home_page(self):
@@ -267,6 +540,64 @@ class HomeViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'main/home.html')
 
+    def test_if_renders_timeline_of_logged_user(self):
+        author = User.objects.create_user(username='author', password='secret')
+        reader = User.objects.create_user(username='reader', password='secret')
+        Follow.objects.create(follower=reader, followed=author)
+        Post.objects.create(title='followed post', body='test', user=author)
+        self.client.login(username='reader', password='secret')
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'followed post')
+
+
+class SearchViewTest(TestCase):
+
+    def setUp(self):
+        self.test_user = User.objects.create_user(username='test', password='secret')
+
+    def test_if_finds_posts_and_comments(self):
+        test_post = Post.objects.create(user=self.test_user, title='Python decorators', body='How do they work?')
+        test_comment = Comment.objects.create(post=test_post, user=self.test_user, body='Decorators wrap functions')
+        Post.objects.create(user=self.test_user, title='Rust lifetimes', body='Borrow checker')
+        response = self.client.get('/search/', {'q': 'decorator'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'main/search.html')
+        results = response.context['results']
+        self.assertEqual([result.kind for result in results], ['post', 'comment'])
+        self.assertEqual(results[1].url, f'/post/{test_post.id}/#comment-{test_comment.id}')
+        self.assertContains(response, '<mark>decorators</mark>', html=False)
+
+    def test_if_escapes_snippets(self):
+        Post.objects.create(user=self.test_user, title='xss', body='<script>alert(1)</script>')
+        response = self.client.get('/search/', {'q': 'script'})
+        self.assertNotContains(response, '<script>alert')
+        self.assertContains(response, '&lt;<mark>script</mark>&gt;', html=False)
+
+    def test_if_ignores_fts_syntax(self):
+        response = self.client.get('/search/', {'q': '"unbalanced AND ('})
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_paginates_results(self):
+        for i in range(25):
+            Post.objects.create(user=self.test_user, title=f'sqlite {i}', body='test')
+        response = self.client.get('/search/', {'q': 'sqlite'})
+        self.assertEqual(len(response.context['results']), 20)
+        self.assertEqual(response.context['next_page'], 2)
+        response = self.client.get('/search/', {'q': 'sqlite', 'page': 2})
+        self.assertEqual(len(response.context['results']), 5)
+        self.assertIsNone(response.context['next_page'])
+
+    def test_if_returns_400_on_pages_out_of_range(self):
+        Post.objects.create(user=self.test_user, title='sqlite', body='test')
+        for page in ('99999999999999999999', views.SEARCH_MAX_PAGE + 1, 'x'):
+            response = self.client.get('/search/', {'q': 'sqlite', 'page': page})
+            self.assertEqual(response.status_code, 400, page)
+        with mock.patch.object(views, 'SEARCH_MAX_PAGE', 1), mock.patch.object(views, 'SEARCH_PAGE_SIZE', 1):
+            Post.objects.create(user=self.test_user, title='sqlite', body='test')
+            response = self.client.get('/search/', {'q': 'sqlite'})
+        self.assertIsNone(response.context['next_page'])
+
 
 class UserListViewTest(TestCase):
 
@@ -299,6 +630,41 @@ class UserDetailViewTest(TestCase):
         response = self.client.get('/user/9999/')
         self.assertEqual(response.status_code, 404)
 
+    def test_if_sections_are_capped_with_totals(self):
+        test_user = User.objects.create_user(username='test', password='secret')
+        test_post = Post.objects.create(user=test_user, title='test', body='test')
+        Comment.objects.bulk_create([
+            Comment(post=test_post, user=test_user, body=f'comment {i}', path=comment_path_step(i + 1))
+            for i in range(USER_DETAIL_PAGE_SIZE + 1)
+        ])
+        # the user with totals, one page per section and the validators
+        with self.assertNumQueries(6):
+            response = self.client.get(f'/user/{test_user.id}/')
+        self.assertEqual(response.context['user_model'].comment_total, USER_DETAIL_PAGE_SIZE + 1)
+        self.assertEqual(response.context['user_model'].post_total, 1)
+        page = response.context['comments_page']
+        self.assertEqual(len(page), USER_DETAIL_PAGE_SIZE)
+        self.assertContains(response, f'/user/{test_user.id}/comments/?after={page.next_cursor}')
+
+    def test_if_renders_more_of_a_section(self):
+        test_user = User.objects.create_user(username='test', password='secret')
+        test_post = Post.objects.create(user=test_user, title='test', body='test')
+        Comment.objects.bulk_create([
+            Comment(post=test_post, user=test_user, body=f'comment {i}', path=comment_path_step(i + 1))
+            for i in range(USER_DETAIL_PAGE_SIZE + 1)
+        ])
+        first = self.client.get(f'/user/{test_user.id}/').context['comments_page']
+        response = self.client.get(f'/user/{test_user.id}/comments/?after={first.next_cursor}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'main/user/sections/comments.html')
+        self.assertEqual(len(response.context['page']), 1)
+        self.assertTrue(response.context['page'].has_previous)
+
+    def test_if_more_returns_400_on_invalid_cursor(self):
+        test_user = User.objects.create_user(username='test', password='secret')
+        response = self.client.get(f'/user/{test_user.id}/followers/?after=invalid')
+        self.assertEqual(response.status_code, 400)
+
 
 class UserCreateViewTest(TestCase):
 
@@ -356,6 +722,37 @@ class UserLogoutViewTest(TestCase):
     pass
 
 
+class CachedAuthTest(TestCase):
+
+    def setUp(self):
+        self.test_user = User.objects.create_user(username='test', password='secret')
+        self.client.login(username='test', password='secret')
+        self.client.get('/post/create/')
+
+    def test_if_resolves_logged_user_without_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/post/create/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([
+            query['sql'] for query in queries
+            if 'django_session' in query['sql'] or 'WHERE "auth_user"."id"' in query['sql']
+        ])
+        self.assertEqual(response.wsgi_request.user, self.test_user)
+
+    def test_if_password_change_logs_user_out(self):
+        self.test_user.set_password('changed')
+        self.test_user.save()
+        response = self.client.get('/post/create/')
+        self.assertEqual(response.status_code, 302)
+
+    def test_if_logout_is_seen_by_cached_sessions(self):
+        other_client = self.client_class()
+        other_client.cookies = self.client.cookies
+        self.client.get('/user/logout/')
+        response = other_client.get('/post/create/')
+        self.assertEqual(response.status_code, 302)
+
+
 class PostListViewTest(TestCase):
     
     def test_if_renders_posts_list(self):
@@ -373,6 +770,63 @@ class PostListViewTest(TestCase):
         self.assertTemplateUsed(response, 'main/post/list.html')
         self.assertContains(response, 'No posts')
 
+    def test_if_paginates_posts_with_cursors(self):
+        test_user = User.objects.create_user(username='test', password='secret')
+        for i in range(25):
+            Post.objects.create(user=test_user, title=f'test {i}', body='test')
+        response = self.client.get('/post/')
+        first_page = response.context['page']
+        self.assertEqual([post.title for post in first_page][0], 'test 24')
+        self.assertEqual(len(first_page), 20)
+        self.assertFalse(first_page.has_previous)
+        self.assertTrue(first_page.has_next)
+        response = self.client.get(f'/post/?after={first_page.next_cursor}')
+        second_page = response.context['page']
+        self.assertEqual([post.title for post in second_page], [f'test {i}' for i in range(4, -1, -1)])
+        self.assertFalse(second_page.has_next)
+        self.assertTrue(second_page.has_previous)
+        response = self.client.get(f'/post/?before={second_page.previous_cursor}')
+        self.assertEqual(list(response.context['page']), list(first_page))
+        self.assertFalse(response.context['page'].has_previous)
+
+    def test_if_returns_400_on_invalid_cursor(self):
+        response = self.client.get('/post/?after=bogus')
+        self.assertEqual(response.status_code, 400)
+
+    def test_if_returns_400_on_cursors_of_wrong_types(self):
+        test_user = User.objects.create_user(username='test', password='secret')
+        test_post = Post.objects.create(user=test_user, title='test', body='test')
+        for values in ([None, None], [{'a': 1}, 1], ['', ''], [True, 1], ['2026-01-01', '1', '2'], {'a': 1}):
+            cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+            for path in ('/post/', '/post/hot/', f'/post/{test_post.id}/comments/', '/api/posts/'):
+                response = self.client.get(path, {'after': cursor})
+                self.assertEqual(response.status_code, 400, (path, values))
+
+
+class PostHotViewTest(TestCase):
+
+    def test_if_renders_posts_by_hot_score(self):
+        test_user = User.objects.create_user(username='test', password='secret')
+        cold_post = Post.objects.create(user=test_user, title='cold', body='test')
+        hot_post = Post.objects.create(user=test_user, title='hot', body='test')
+        Vote.objects.create(post=cold_post, user=test_user, value=Vote.UP)
+        Vote.objects.create(post=hot_post, user=test_user, value=Vote.UP)
+        Post.objects.filter(id=cold_post.id).update(created_at=timezone.now() - timedelta(days=1))
+        PostScore.refresh(cold_post.id)
+        response = self.client.get('/post/hot/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'main/post/list.html')
+        self.assertEqual([post.title for post in response.context['post_list']], ['hot', 'cold'])
+
+    def test_if_paginates_hot_posts_with_cursors(self):
+        test_user = User.objects.create_user(username='test', password='secret')
+        for i in range(25):
+            Post.objects.create(user=test_user, title=f'test {i}', body='test')
+        response = self.client.get('/post/hot/')
+        page = response.context['page']
+        response = self.client.get(f'/post/hot/?after={page.next_cursor}')
+        self.assertEqual(len(response.context['post_list']), 5)
+
 
 class PostDetailViewTest(TestCase):
 
@@ -390,6 +844,222 @@ class PostDetailViewTest(TestCase):
         response = self.client.get('/post/9999/')
         self.assertEqual(response.status_code, 404)
 
+    def test_if_query_count_does_not_depend_on_comment_count(self):
+        test_user = User.objects.create_user(username='test', password='secret')
+        test_post = Post.objects.create(user=test_user, title='test', body='test')
+        commenters = [
+            User.objects.create(username=f'commenter {i}') for i in range(10)
+        ]
+        Comment.objects.bulk_create([
+            Comment(post=test_post, user=commenters[i % 10], body=f'comment {i}', path=comment_path_step(i + 1))
+            for i in range(300)
+        ])
+        # the change version, the post with its author, a page of comments
+        # with theirs
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/post/{test_post.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, f'comment {POST_COMMENTS_PAGE_SIZE - 1}<')
+        self.assertNotContains(response, f'comment {POST_COMMENTS_PAGE_SIZE}<')
+        self.client.login(username='test', password='secret')
+        self.client.get(f'/post/{test_post.id}/')
+        # sessions and users are cached, so authenticated users add no query
+        with self.assertNumQueries(3):
+            self.client.get(f'/post/{test_post.id}/')
+
+
+class PostCommentPageViewTest(TestCase):
+
+    def setUp(self):
+        self.test_user = User.objects.create_user(username='test', password='secret')
+        self.test_post = Post.objects.create(user=self.test_user, title='test', body='test')
+        for i in range(3):
+            Comment.objects.create(post=self.test_post, user=self.test_user, body=f'comment {i}')
+        Comment.objects.create(
+            post=self.test_post, parent=Comment.objects.get(body='comment 0'), user=self.test_user, body='reply'
+        )
+
+    @mock.patch.object(views, 'POST_COMMENTS_PAGE_SIZE', 2)
+    def test_if_loads_following_comments_in_thread_order(self):
+        response = self.client.get(f'/post/{self.test_post.id}/')
+        self.assertEqual([comment.body for comment, _, _ in response.context['comment_list']], ['comment 0', 'reply'])
+        bodies = []
+        next_cursor = response.context['page'].next_cursor
+        while next_cursor:
+            # the next page as list items, without the layout
+            response = self.client.get(f'/post/{self.test_post.id}/comments/', {'after': next_cursor})
+            self.assertTemplateUsed(response, 'main/post/comments.html')
+            self.assertTemplateNotUsed(response, 'main/layout.html')
+            bodies += [comment.body for comment, _, _ in response.context['comment_list']]
+            next_cursor = response.context['page'].next_cursor
+            if next_cursor:
+                self.assertContains(response, f'?after={next_cursor}')
+        self.assertEqual(bodies, ['comment 1', 'comment 2'])
+
+    def test_if_page_query_count_does_not_depend_on_comment_count(self):
+        Comment.objects.bulk_create([
+            Comment(post=self.test_post, user=self.test_user, body=f'more {i}', path=comment_path_step(i + 4))
+            for i in range(POST_COMMENTS_PAGE_SIZE * 3)
+        ])
+        cursor = self.client.get(f'/post/{self.test_post.id}/').context['page'].next_cursor
+        # the change version, a page of comments with their authors
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/post/{self.test_post.id}/comments/', {'after': cursor})
+        self.assertEqual(len(response.context['comment_list']), POST_COMMENTS_PAGE_SIZE)
+
+    def test_if_returns_errors_on_invalid_cursor_and_post(self):
+        response = self.client.get(f'/post/{self.test_post.id}/comments/', {'after': 'bogus'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/post/9999/comments/')
+        self.assertEqual(response.status_code, 404)
+
+
+class PostFragmentCacheTest(TestCase):
+
+    def setUp(self):
+        self.test_user = User.objects.create_user(username='test', password='secret')
+        self.test_post = Post.objects.create(user=self.test_user, title='test', body='test')
+        self.test_comment = Comment.objects.create(post=self.test_post, user=self.test_user, body='test')
+
+    def test_if_serves_post_and_comments_from_cache(self):
+        self.client.get(f'/post/{self.test_post.id}/')
+        cache = caches['fragments']
+        for fragment in (post_body_fragment(self.test_post), comment_body_fragment(self.test_comment)):
+            self.assertIsNotNone(cache.get(fragment.key, version=settings.FRAGMENT_CACHE_VERSION))
+            cache.set(fragment.key, f'<p>cached {fragment.key}</p>', version=settings.FRAGMENT_CACHE_VERSION)
+        response = self.client.get(f'/post/{self.test_post.id}/')
+        self.assertContains(response, f'cached {post_body_fragment(self.test_post).key}')
+        self.assertContains(response, f'cached {comment_body_fragment(self.test_comment).key}')
+
+    def test_if_votes_only_refresh_vote_fragments(self):
+        self.client.get(f'/post/{self.test_post.id}/')
+        cache = caches['fragments']
+        body_key = comment_body_fragment(self.test_comment).key
+        cache.set(body_key, '<p>cached body</p>', version=settings.FRAGMENT_CACHE_VERSION)
+        self.client.login(username='test', password='secret')
+        self.client.post(f'/post/{self.test_post.id}/comment/{self.test_comment.id}/upvote/create/')
+        response = self.client.get(f'/post/{self.test_post.id}/')
+        self.assertContains(response, 'cached body')
+        self.assertContains(response, '1 upvotes, 0 downvotes')
+
+
+class ConditionalGetTest(TestCase):
+
+    def setUp(self):
+        self.test_user = User.objects.create_user(username='test', password='secret')
+        self.test_post = Post.objects.create(user=self.test_user, title='test', body='test')
+        self.test_comment = Comment.objects.create(post=self.test_post, user=self.test_user, body='test')
+
+    def assertNotModifiedUntilChanged(self, url, change):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_post_list(self):
+        self.assertNotModifiedUntilChanged('/post/', lambda: Vote.objects.create(post=self.test_post, user=self.test_user, value=Vote.UP))
+
+    def test_post_detail_on_comment_vote(self):
+        self.assertNotModifiedUntilChanged(
+            f'/post/{self.test_post.id}/',
+            lambda: Vote.objects.create(comment=self.test_comment, user=self.test_user, value=Vote.DOWN)
+        )
+
+    def test_post_detail_on_comment(self):
+        self.assertNotModifiedUntilChanged(
+            f'/post/{self.test_post.id}/',
+            lambda: Comment.objects.create(post=self.test_post, user=self.test_user, body='test')
+        )
+
+    def test_user_detail_on_follow(self):
+        follower = User.objects.create_user(username='follower', password='secret')
+        self.assertNotModifiedUntilChanged(
+            f'/user/{self.test_user.id}/',
+            lambda: Follow.objects.create(follower=follower, followed=self.test_user)
+        )
+
+    def test_if_answers_if_modified_since(self):
+        response = self.client.get(f'/post/{self.test_post.id}/')
+        response = self.client.get(f'/post/{self.test_post.id}/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_if_etag_depends_on_user(self):
+        response = self.client.get(f'/post/{self.test_post.id}/')
+        self.client.login(username='test', password='secret')
+        response = self.client.get(f'/post/{self.test_post.id}/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+
+    def test_if_etag_depends_on_csrf_token(self):
+        # logging in again rotates the CSRF token the cached page holds
+        self.client.post('/user/login/', {'username': 'test', 'password': 'secret'})
+        response = self.client.get(f'/post/{self.test_post.id}/')
+        etag = response['ETag']
+        self.client.get('/user/logout/')
+        self.client.post('/user/login/', {'username': 'test', 'password': 'secret'})
+        response = self.client.get(f'/post/{self.test_post.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+class StaticFilesTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.static_root = tempfile.TemporaryDirectory()
+        cls.static_settings = override_settings(
+            STATIC_ROOT=cls.static_root.name,
+            STATICFILES_STORAGE='main.staticfiles.CompressedManifestStaticFilesStorage'
+        )
+        cls.static_settings.enable()
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.static_settings.disable()
+        cls.static_root.cleanup()
+        super().tearDownClass()
+
+    def stylesheet_url(self):
+        return staticfiles_storage.url('main/vendor/bootstrap/bootstrap.min.css')
+
+    def test_if_pages_link_hashed_local_assets(self):
+        response = self.client.get('/post/')
+        self.assertContains(response, self.stylesheet_url())
+        self.assertNotContains(response, 'cdn.jsdelivr.net')
+        self.assertRegex(self.stylesheet_url(), r'bootstrap\.min\.[0-9a-f]{12}\.css$')
+
+    def test_if_serves_precompressed_copies(self):
+        path = Path(self.static_root.name, 'main/vendor/bootstrap/bootstrap.min.css')
+        cases = [('gzip, br;q=0', 'gzip', gzip.decompress)]
+        if staticfiles.brotli is not None:
+            cases.append(('gzip, deflate, br', 'br', staticfiles.brotli.decompress))
+        for accept_encoding, encoding, content in cases:
+            response = self.client.get(self.stylesheet_url(), HTTP_ACCEPT_ENCODING=accept_encoding)
+            self.assertEqual(response['Content-Encoding'], encoding)
+            self.assertEqual(response['Content-Type'], 'text/css')
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+            self.assertEqual(content(b''.join(response.streaming_content)), path.read_bytes())
+        response = self.client.get(self.stylesheet_url())
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), path.read_bytes())
+
+    def test_if_only_hashed_names_are_immutable(self):
+        response = self.client.get(self.stylesheet_url())
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        last_modified = response['Last-Modified']
+        response = self.client.get('/static/main/vendor/bootstrap/bootstrap.min.css')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        response = self.client.get(self.stylesheet_url(), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get('/static/main/missing.css').status_code, 404)
+
 
 class PostCreateViewTest(TestCase):
     
@@ -443,6 +1113,29 @@ class PostCommentCreateViewTest(TestCase):
         self.assertQuerysetEqual(test_post.comments.all(), ['<Comment: test>'])
         self.assertRedirects(response, f'/post/{test_post.id}/')
 
+    def test_if_creates_reply_and_renders_it_below_its_parent(self):
+        test_user = User.objects.create_user(username='test', password='secret')
+        test_post = Post.objects.create(user=test_user, title='test', body='test')
+        first = Comment.objects.create(post=test_post, user=test_user, body='first')
+        Comment.objects.create(post=test_post, user=test_user, body='second')
+        self.client.login(username='test', password='secret')
+        response = self.client.post(f'/post/{test_post.id}/comment/create/', {'body': 'reply', 'parent': first.id})
+        self.assertRedirects(response, f'/post/{test_post.id}/')
+        reply = Comment.objects.get(body='reply')
+        self.assertEqual((reply.parent, reply.depth), (first, 1))
+        response = self.client.get(f'/post/{test_post.id}/')
+        bodies = [comment.body for comment, _, _ in response.context['comment_list']]
+        self.assertEqual(bodies, ['first', 'reply', 'second'])
+
+    def test_if_raises_error_on_reply_to_other_post(self):
+        test_user = User.objects.create_user(username='test', password='secret')
+        test_post = Post.objects.create(user=test_user, title='test', body='test')
+        other_post = Post.objects.create(user=test_user, title='other', body='other')
+        other_comment = Comment.objects.create(post=other_post, user=test_user, body='other')
+        self.client.login(username='test', password='secret')
+        with self.assertRaises(ValidationError):
+            self.client.post(f'/post/{test_post.id}/comment/create/', {'body': 'reply', 'parent': other_comment.id})
+
     def test_if_raises_error_if_form_is_invalid(self):
         test_user = User.objects.create_user(username='test', password='secret')
         test_post = Post.objects.create(user=test_user, title='test', body='test')
@@ -463,10 +1156,10 @@ class PostUpvoteCreateViewTest(TestCase):
     def test_if_creates_upvote_and_redirects_to_post_detail(self):
         test_user = User.objects.create_user(username='test', password='secret')
         test_post = Post.objects.create(user=test_user, title='test', body='test')
-        self.assertEqual(test_post.upvotes.count(), 0)
+        self.assertEqual(test_post.votes.filter(value=Vote.UP).count(), 0)
         self.client.login(username='test', password='secret')
         response = self.client.post(f'/post/{test_post.id}/upvote/create/')
-        self.assertEqual(test_post.upvotes.count(), 1)
+        self.assertEqual(test_post.votes.filter(value=Vote.UP).count(), 1)
         self.assertRedirects(response, f'/post/{test_post.id}/')
 
 
@@ -481,10 +1174,10 @@ class PostDownvoteCreateViewTest(TestCase):
     def test_if_creates_downvote_and_redirects_to_post_detail(self):
         test_user = User.objects.create_user(username='test', password='secret')
         test_post = Post.objects.create(user=test_user, title='test', body='test')
-        self.assertEqual(test_post.downvotes.count(), 0)
+        self.assertEqual(test_post.votes.filter(value=Vote.DOWN).count(), 0)
         self.client.login(username='test', password='secret')
         response = self.client.post(f'/post/{test_post.id}/downvote/create/')
-        self.assertEqual(test_post.downvotes.count(), 1)
+        self.assertEqual(test_post.votes.filter(value=Vote.DOWN).count(), 1)
         self.assertRedirects(response, f'/post/{test_post.id}/')
 
 
@@ -501,10 +1194,10 @@ class PostCommentUpvoteCreateViewTest(TestCase):
         test_user = User.objects.create_user(username='test', password='secret')
         test_post = Post.objects.create(user=test_user, title='test', body='test')
         test_comment = Comment.objects.create(post=test_post, user=test_user, body='test')
-        self.assertEqual(test_comment.upvotes.count(), 0)
+        self.assertEqual(test_comment.votes.filter(value=Vote.UP).count(), 0)
         self.client.login(username='test', password='secret')
         response = self.client.post(f'/post/{test_post.id}/comment/{test_comment.id}/upvote/create/')
-        self.assertEqual(test_comment.upvotes.count(), 1)
+        self.assertEqual(test_comment.votes.filter(value=Vote.UP).count(), 1)
         self.assertRedirects(response, f'/post/{test_post.id}/')
 
 
@@ -521,13 +1214,177 @@ class PostCommentDownvoteCreateViewTest(TestCase):
         test_user = User.objects.create_user(username='test', password='secret')
         test_post = Post.objects.create(user=test_user, title='test', body='test')
         test_comment = Comment.objects.create(post=test_post, user=test_user, body='test')
-        self.assertEqual(test_comment.downvotes.count(), 0)
+        self.assertEqual(test_comment.votes.filter(value=Vote.DOWN).count(), 0)
         self.client.login(username='test', password='secret')
         response = self.client.post(f'/post/{test_post.id}/comment/{test_comment.id}/downvote/create/')
-        self.assertEqual(test_comment.downvotes.count(), 1)
+        self.assertEqual(test_comment.votes.filter(value=Vote.DOWN).count(), 1)
         self.assertRedirects(response, f'/post/{test_post.id}/')
 
 
+class VoteBatchCreateViewTest(TestCase):
+
+    def setUp(self):
+        self.test_user = User.objects.create_user(username='test', password='secret')
+        self.test_post = Post.objects.create(user=self.test_user, title='test', body='test')
+        self.test_comment = Comment.objects.create(post=self.test_post, user=self.test_user, body='test')
+
+    def post_votes(self, votes):
+        return self.client.post('/vote/batch/create/', json.dumps({'votes': votes}), content_type='application/json')
+
+    def test_if_redirects_if_user_is_not_logged_in(self):
+        response = self.post_votes([])
+        self.assertRedirects(response, '/user/login/')
+
+    def test_if_creates_votes_and_returns_per_item_status(self):
+        Vote.objects.create(post=self.test_post, user=self.test_user, value=Vote.UP)
+        self.client.login(username='test', password='secret')
+        response = self.post_votes([
+            {'direction': 'up', 'target': 'post', 'id': self.test_post.id},
+            {'direction': 'down', 'target': 'post', 'id': self.test_post.id},
+            {'direction': 'up', 'target': 'comment', 'id': self.test_comment.id},
+            {'direction': 'up', 'target': 'comment', 'id': self.test_comment.id},
+            {'direction': 'up', 'target': 'comment', 'id': 9999},
+            {'direction': 'sideways', 'target': 'post', 'id': self.test_post.id},
+            {'direction': 'up', 'target': 'post', 'id': self.test_post.id, 'user': 9999},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual(
+            [result['status'] for result in response.json()['results']],
+            ['superseded', 'switched', 'superseded', 'created', 'not_found', 'invalid', 'forbidden']
+        )
+        self.test_post.refresh_from_db()
+        self.test_comment.refresh_from_db()
+        self.assertEqual((self.test_post.upvote_count, self.test_post.downvote_count), (0, 1))
+        self.assertEqual((self.test_comment.upvote_count, self.test_comment.downvote_count), (1, 0))
+
+    def test_if_keeps_votes_that_already_exist(self):
+        Vote.objects.create(post=self.test_post, user=self.test_user, value=Vote.UP)
+        self.client.login(username='test', password='secret')
+        response = self.post_votes([{'direction': 'up', 'target': 'post', 'id': self.test_post.id}])
+        self.assertEqual(response.json()['results'], [{'status': 'exists'}])
+        self.test_post.refresh_from_db()
+        self.assertEqual((self.test_post.upvote_count, self.test_post.downvote_count), (1, 0))
+
+    def test_if_moves_counters_by_the_votes_written(self):
+        Vote.objects.create(post=self.test_post, user=self.test_user, value=Vote.UP)
+        # counters are moved, not recounted, so the other votes they hold stay
+        Post.objects.filter(id=self.test_post.id).update(upvote_count=10, downvote_count=5)
+        self.client.login(username='test', password='secret')
+        self.post_votes([
+            {'direction': 'down', 'target': 'post', 'id': self.test_post.id},
+            {'direction': 'down', 'target': 'comment', 'id': self.test_comment.id},
+        ])
+        self.test_post.refresh_from_db()
+        self.test_comment.refresh_from_db()
+        self.assertEqual((self.test_post.upvote_count, self.test_post.downvote_count), (9, 6))
+        self.assertEqual((self.test_comment.upvote_count, self.test_comment.downvote_count), (0, 1))
+
+    @override_settings(VOTE_BATCH_CHUNK_SIZE=7)
+    def test_if_staff_imports_votes_of_other_users(self):
+        self.test_user.is_staff = True
+        self.test_user.save()
+        voters = [User(username=f'voter {i}') for i in range(30)]
+        User.objects.bulk_create(voters)
+        voter_ids = User.objects.filter(username__startswith='voter').values_list('id', flat=True)
+        self.client.login(username='test', password='secret')
+        response = self.post_votes([
+            {'direction': 'up', 'target': 'post', 'id': self.test_post.id, 'user': voter_id}
+            for voter_id in voter_ids
+        ])
+        self.assertEqual(response.json()['created'], 30)
+        self.test_post.refresh_from_db()
+        self.assertEqual(self.test_post.upvote_count, 30)
+        self.assertGreater(self.test_post.score.hot, 0)
+
+    def test_if_rejects_malformed_body(self):
+        self.client.login(username='test', password='secret')
+        response = self.client.post('/vote/batch/create/', 'nope', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/vote/batch/create/', '{"votes": 1}', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(VOTE_BATCH_MAX_SIZE=1)
+    def test_if_rejects_too_large_batches(self):
+        self.client.login(username='test', password='secret')
+        response = self.post_votes([{}, {}])
+        self.assertEqual(response.status_code, 400)
+
+
+class WriteBehindVoteTest(TestCase):
+
+    def setUp(self):
+        self.journal_dir = tempfile.TemporaryDirectory()
+        self.journal_path = Path(self.journal_dir.name) / 'votes.jsonl'
+        self.settings_override = override_settings(VOTE_WRITE_BEHIND=True, VOTE_JOURNAL_PATH=self.journal_path)
+        self.settings_override.enable()
+        self.test_user = User.objects.create_user(username='test', password='secret')
+        self.test_post = Post.objects.create(user=self.test_user, title='test', body='test')
+        self.test_comment = Comment.objects.create(post=self.test_post, user=self.test_user, body='test')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.journal_dir.cleanup()
+
+    def test_if_vote_views_append_to_journal(self):
+        self.client.login(username='test', password='secret')
+        response = self.client.post(f'/post/{self.test_post.id}/upvote/create/')
+        self.assertRedirects(response, f'/post/{self.test_post.id}/')
+        self.client.post(f'/post/{self.test_post.id}/comment/{self.test_comment.id}/downvote/create/')
+        self.assertEqual(Vote.objects.count(), 0)
+        self.assertEqual(len(self.journal_path.read_text().splitlines()), 2)
+        self.assertEqual(flush_votes(), 2)
+        self.assertFalse(self.journal_path.exists())
+        self.test_post.refresh_from_db()
+        self.test_comment.refresh_from_db()
+        self.assertEqual(self.test_post.upvote_count, 1)
+        self.assertEqual(self.test_comment.downvote_count, 1)
+
+    def test_if_replays_segments_left_by_a_crash_without_duplicates(self):
+        self.client.login(username='test', password='secret')
+        self.client.post(f'/post/{self.test_post.id}/upvote/create/')
+        self.client.post(f'/post/{self.test_post.id}/upvote/create/')
+        segments = journal.rotate()
+        self.assertEqual(len(segments), 1)
+        # the flusher committed the segment and crashed before deleting it,
+        # leaving a torn line behind
+        segment_path = segments[0]
+        with open(segment_path, 'a') as segment:
+            segment.write('{"direction": "do')
+        for batch in journal.read_segment(segment_path, 1):
+            ingest_votes(batch, None, allow_other_users=True)
+        self.client.post(f'/post/{self.test_post.id}/comment/{self.test_comment.id}/upvote/create/')
+        call_command('flush_votes', once=True, stdout=StringIO())
+        self.assertEqual(list(Path(self.journal_dir.name).glob('*.flushing')), [])
+        self.test_post.refresh_from_db()
+        self.assertEqual(self.test_post.upvote_count, 1)
+        self.assertEqual(Vote.objects.filter(post=self.test_post, value=Vote.UP).count(), 1)
+        self.assertEqual(Vote.objects.filter(comment=self.test_comment, value=Vote.UP).count(), 1)
+
+
+    def test_if_votes_appended_after_a_torn_line_are_replayed(self):
+        self.client.login(username='test', password='secret')
+        # a writer died in the middle of its append
+        self.journal_path.write_text('{"direction": "up", "tar')
+        self.client.post(f'/post/{self.test_post.id}/upvote/create/')
+        self.assertEqual(flush_votes(), 1)
+        self.test_post.refresh_from_db()
+        self.assertEqual(self.test_post.upvote_count, 1)
+
+    def test_if_concurrent_flushers_skip_claimed_segments(self):
+        self.client.login(username='test', password='secret')
+        self.client.post(f'/post/{self.test_post.id}/upvote/create/')
+        [segment] = journal.rotate()
+        with journal.claim_segment(segment) as claimed:
+            self.assertTrue(claimed)
+            # another flusher holds the segment
+            self.assertEqual(flush_votes(), 0)
+            self.assertTrue(segment.exists())
+        self.assertEqual(flush_votes(), 1)
+        self.assertFalse(segment.exists())
+        self.test_post.refresh_from_db()
+        self.assertEqual(self.test_post.upvote_count, 1)
+
 class UserFollowCreateViewTest(TestCase):
 
     def test_if_redirects_if_user_is_not_logged_in(self):
@@ -561,3 +1418,716 @@ class UserFollowDeleteViewTest(TestCase):
         response = self.client.post(f'/user/{followed.id}/follow/delete/')
         self.assertEqual(followed.followers.count(), 0)
         self.assertRedirects(response, f'/user/{followed.id}/')
+
+
+
+class ApiTest(TestCase):
+
+    def setUp(self):
+        self.test_user = User.objects.create_user(username='test', password='secret')
+        self.other_user = User.objects.create_user(username='other', password='secret')
+        Follow.objects.create(follower=self.other_user, followed=self.test_user)
+        self.test_post = Post.objects.create(user=self.test_user, title='test', body='test body')
+        for i in range(3):
+            Comment.objects.create(post=self.test_post, user=self.other_user, body=f'comment {i}')
+        Vote.objects.create(post=self.test_post, user=self.other_user, value=Vote.UP)
+
+    def get_json(self, path, data=None):
+        response = self.client.get(path, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming or path.startswith('/api/users/'))
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        return json.loads(content)
+
+    def test_if_lists_posts_with_tallies(self):
+        [post] = self.get_json('/api/posts/')['data']
+        self.assertEqual(post['id'], self.test_post.id)
+        self.assertEqual(post['user'], self.test_user.id)
+        self.assertEqual((post['upvote_count'], post['downvote_count'], post['comment_count']), (1, 0, 3))
+        self.assertNotIn('comments', post)
+
+    def test_if_returns_post_with_comments(self):
+        post = self.get_json(f'/api/posts/{self.test_post.id}/')
+        self.assertEqual(post['title'], 'test')
+        self.assertEqual([comment['body'] for comment in post['comments']], ['comment 0', 'comment 1', 'comment 2'])
+
+    def test_if_returns_sparse_fieldsets(self):
+        post = self.get_json(f'/api/posts/{self.test_post.id}/', {
+            'fields[post]': 'title,comments',
+            'fields[comment]': 'body'
+        })
+        self.assertEqual(post, {'title': 'test', 'comments': [{'body': f'comment {i}'} for i in range(3)]})
+        data = self.get_json('/api/users/', {'fields[user]': 'username,follower_count'})['data']
+        self.assertEqual(data, [{'username': 'other', 'follower_count': 0}, {'username': 'test', 'follower_count': 1}])
+        response = self.client.get('/api/posts/', {'fields[post]': 'title,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Unknown fields of post: password'})
+
+    def test_if_paginates_with_cursors(self):
+        for i in range(4):
+            Post.objects.create(user=self.test_user, title=f'test {i}', body='test')
+        titles = []
+        data = {'limit': 2, 'fields[post]': 'title'}
+        while True:
+            page = self.get_json('/api/posts/', data)
+            titles += [post['title'] for post in page['data']]
+            if page['next'] is None:
+                break
+            data['after'] = page['next']
+        self.assertEqual(titles, ['test 3', 'test 2', 'test 1', 'test 0', 'test'])
+        response = self.client.get('/api/posts/', {'after': 'bogus'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_if_streams_in_chunks(self):
+        Comment.objects.bulk_create([
+            Comment(post=self.test_post, user=self.test_user, body=f'more {i}', path=comment_path_step(i + 4))
+            for i in range(5)
+        ])
+        with mock.patch('main.api.API_CHUNK_SIZE', 2):
+            response = self.client.get(f'/api/posts/{self.test_post.id}/comments/', {'limit': 6})
+            pieces = list(response.streaming_content)
+        self.assertGreater(len(pieces), 4)
+        page = json.loads(b''.join(pieces))
+        self.assertEqual(len(page['data']), 6)
+        self.assertIsNotNone(page['next'])
+
+    def test_if_returns_users_and_follows(self):
+        user = self.get_json(f'/api/users/{self.test_user.id}/')
+        self.assertEqual((user['username'], user['follower_count'], user['followed_count']), ('test', 1, 0))
+        self.assertNotIn('password', user)
+        [follow] = self.get_json(f'/api/users/{self.test_user.id}/followers/')['data']
+        self.assertEqual((follow['follower'], follow['followed']), (self.other_user.id, self.test_user.id))
+        self.assertEqual(self.get_json(f'/api/users/{self.test_user.id}/followeds/')['data'], [])
+
+    def test_if_returns_404_if_object_does_not_exist(self):
+        for path in ('/api/posts/9999/', '/api/posts/9999/comments/', '/api/users/9999/', '/api/users/9999/followers/'):
+            self.assertEqual(self.client.get(path).status_code, 404, path)
+
+class ApiAsgiTest(TransactionTestCase):
+    # the ASGI handler sends responses from its event loop, where no query runs
+
+    def setUp(self):
+        self.test_user = User.objects.create_user(username='test', password='secret')
+        self.other_user = User.objects.create_user(username='other', password='secret')
+        Follow.objects.create(follower=self.other_user, followed=self.test_user)
+        self.test_post = Post.objects.create(user=self.test_user, title='test', body='test body')
+        Comment.objects.create(post=self.test_post, user=self.other_user, body='test comment')
+
+    def get_json(self, path):
+        from core.asgi import application
+
+        async def get():
+            communicator = ApplicationCommunicator(application, {
+                'type': 'http',
+                'asgi': {'version': '3.0'},
+                'http_version': '1.1',
+                'method': 'GET',
+                'scheme': 'http',
+                'path': path,
+                'query_string': b'',
+                'headers': [(b'host', b'testserver')]
+            })
+            await communicator.send_input({'type': 'http.request'})
+            start = await communicator.receive_output(5)
+            body = b''
+            while True:
+                message = await communicator.receive_output(5)
+                body += message.get('body', b'')
+                if not message.get('more_body'):
+                    return start['status'], body
+
+        status, body = async_to_sync(get)()
+        self.assertEqual(status, 200, body)
+        return json.loads(body)
+
+    def test_if_serves_api_through_asgi(self):
+        [post] = self.get_json('/api/posts/')['data']
+        self.assertEqual(post['id'], self.test_post.id)
+        post = self.get_json(f'/api/posts/{self.test_post.id}/')
+        self.assertEqual([comment['body'] for comment in post['comments']], ['test comment'])
+        [comment] = self.get_json(f'/api/posts/{self.test_post.id}/comments/')['data']
+        self.assertEqual(comment['body'], 'test comment')
+        self.assertEqual(len(self.get_json('/api/users/')['data']), 2)
+        [follow] = self.get_json(f'/api/users/{self.test_user.id}/followers/')['data']
+        self.assertEqual(follow['follower'], self.other_user.id)
+        [follow] = self.get_json(f'/api/users/{self.other_user.id}/followeds/')['data']
+        self.assertEqual(follow['followed'], self.test_user.id)
+
+
+class RebuildCountersCommandTest(TestCase):
+
+    def test_if_rebuilds_counters(self):
+        test_user = User.objects.create_user(username='test', password='secret')
+        test_post = Post.objects.create(title='test', body='test', user=test_user)
+        test_comment = Comment.objects.create(post=test_post, body='test', user=test_user)
+        Vote.objects.create(post=test_post, user=test_user, value=Vote.UP)
+        Vote.objects.create(comment=test_comment, user=test_user, value=Vote.DOWN)
+        Post.objects.update(upvote_count=0, downvote_count=0, comment_count=0)
+        Comment.objects.update(upvote_count=0, downvote_count=0)
+        call_command('rebuild_counters', chunk_size=1, stdout=StringIO())
+        test_post.refresh_from_db()
+        test_comment.refresh_from_db()
+        self.assertEqual(test_post.upvote_count, 1)
+        self.assertEqual(test_post.downvote_count, 0)
+        self.assertEqual(test_post.comment_count, 1)
+        self.assertEqual(test_comment.upvote_count, 0)
+        self.assertEqual(test_comment.downvote_count, 1)
+
+
+class DecayHotScoresCommandTest(TestCase):
+
+    def test_if_decays_scores(self):
+        test_user = User.objects.create_user(username='test', password='secret')
+        test_post = Post.objects.create(title='test', body='test', user=test_user)
+        Vote.objects.create(post=test_post, user=test_user, value=Vote.UP)
+        fresh_score = PostScore.objects.get(post=test_post).hot
+        Post.objects.filter(id=test_post.id).update(created_at=timezone.now() - timedelta(hours=12))
+        call_command('decay_hot_scores', chunk_size=1, stdout=StringIO())
+        self.assertLess(PostScore.objects.get(post=test_post).hot, fresh_score)
+
+    def test_if_zeroes_scores_of_old_posts(self):
+        test_user = User.objects.create_user(username='test', password='secret')
+        old_post = Post.objects.create(title='old', body='test', user=test_user)
+        Vote.objects.create(post=old_post, user=test_user, value=Vote.UP)
+        Post.objects.filter(id=old_post.id).update(created_at=timezone.now() - timedelta(days=8))
+        self.assertGreater(PostScore.objects.get(post=old_post).hot, 0)
+        output = StringIO()
+        call_command('decay_hot_scores', max_age_days=7, chunk_size=1, stdout=output)
+        self.assertEqual(PostScore.objects.get(post=old_post).hot, 0)
+        self.assertIn('zeroed 1 older ones', output.getvalue())
+
+    def test_if_creates_missing_scores(self):
+        test_user = User.objects.create_user(username='test', password='secret')
+        Post.objects.bulk_create([Post(title='test', body='test', user=test_user)])
+        call_command('decay_hot_scores', stdout=StringIO())
+        self.assertEqual(PostScore.objects.count(), 1)
+
+
+class RebuildSearchIndexCommandTest(TestCase):
+
+    def test_if_rebuilds_index(self):
+        test_user = User.objects.create_user(username='test', password='secret')
+        test_post = Post.objects.create(user=test_user, title='indexed', body='test')
+        Comment.objects.create(post=test_post, user=test_user, body='indexed comment')
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM main_search')
+        self.assertEqual(search('indexed'), ([], False))
+        call_command('rebuild_search_index', chunk_size=1, stdout=StringIO())
+        results, _ = search('indexed')
+        self.assertEqual(len(results), 2)
+
+    def test_if_swaps_in_the_new_index(self):
+        test_user = User.objects.create_user(username='test', password='secret')
+        test_post = Post.objects.create(user=test_user, title='indexed', body='test')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO main_search (title, body, kind, object_id, post_id) "
+                "VALUES ('stale', '', 'post', %s, %s)",
+                [test_post.id, test_post.id]
+            )
+        self.assertEqual(len(search('stale')[0]), 1)
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(search('stale'), ([], False))
+        # the triggers index posts created after the swap
+        Post.objects.create(user=test_user, title='later', body='test')
+        self.assertEqual(len(search('later')[0]), 1)
+        self.assertNotIn('main_search_rebuild', connection.introspection.table_names())
+
+
+class RequestTimingTest(TestCase):
+
+    def test_if_requests_are_not_timed_by_default(self):
+        response = self.client.get('/post/')
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(REQUEST_TIMING_SAMPLE_RATE=1)
+    def test_if_adds_server_timing(self):
+        test_user = User.objects.create_user(username='test', password='secret')
+        Post.objects.create(user=test_user, title='test', body='test')
+        with self.assertNumQueries(2):
+            response = self.client.get('/post/')
+        timing = response['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn('desc="2 queries"', timing)
+        self.assertIn('tpl;dur=', timing)
+        self.assertIn('view;dur=', timing)
+        self.assertIn('total;dur=', timing)
+
+    @override_settings(REQUEST_TIMING_SAMPLE_RATE=1, REQUEST_TIMING_SLOW_MS=0)
+    def test_if_logs_slow_requests(self):
+        with self.assertLogs('main.instrumentation', 'WARNING') as logs:
+            self.client.get('/post/')
+        self.assertIn('Slow request: GET /post/ 200', logs.output[0])
+        self.assertIn('slow query', logs.output[0])
+
+    @override_settings(REQUEST_TIMING_SAMPLE_RATE=1)
+    def test_if_times_async_requests(self):
+        async def get_response(request):
+            await sync_to_async(lambda: list(Post.objects.all()))()
+            return HttpResponse()
+
+        middleware = RequestTimingMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(AsyncRequestFactory().get('/'))
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+    def test_if_records_queries_of_concurrent_threads(self):
+        timing = RequestTiming()
+
+        def run():
+            for _ in range(1000):
+                timing.record_query('SELECT 1', 0.001)
+
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(timing.query_count, 4000)
+        self.assertEqual(timing.queries['SELECT 1'][0], 4000)
+
+    def test_if_reports_repeated_queries(self):
+        timing = RequestTiming()
+        for duration in (0.001, 0.002, 0.003):
+            timing.record_query('SELECT * FROM main_post WHERE id = %s', duration)
+        timing.record_query('SELECT * FROM main_comment', 0.01)
+        self.assertEqual(timing.slowest_queries()[0], ('SELECT * FROM main_comment', 0.01))
+        [(sql, count, duration)] = timing.duplicate_queries()
+        self.assertEqual((sql, count), ('SELECT * FROM main_post WHERE id = %s', 3))
+
+
+
+class BoardCommandTest(TestCase):
+
+    def setUp(self):
+        self.test_user = User.objects.create_user(username='test', password='secret')
+        self.other_user = User.objects.create_user(username='other', password='secret')
+        Follow.objects.create(follower=self.other_user, followed=self.test_user)
+        self.test_post = Post.objects.create(user=self.test_user, title='test', body='test body')
+        test_comment = Comment.objects.create(post=self.test_post, user=self.other_user, body='test comment')
+        Vote.objects.create(post=self.test_post, user=self.other_user, value=Vote.UP)
+        Vote.objects.create(comment=test_comment, user=self.test_user, value=Vote.DOWN)
+        Post.objects.filter(id=self.test_post.id).update(created_at=timezone.now() - timedelta(days=3))
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name) / 'board.ndjson.gz'
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def lines(self):
+        with gzip.open(self.path, 'rt') as file:
+            return [json.loads(line) for line in file]
+
+    def write_lines(self, rows):
+        with gzip.open(self.path, 'wt') as file:
+            file.writelines(json.dumps(row) + '\n' for row in rows)
+
+    def test_if_exports_rows_in_dependency_order(self):
+        call_command('export_board', str(self.path), stdout=StringIO())
+        rows = self.lines()
+        self.assertEqual([row['type'] for row in rows], ['user'] * 2 + ['post', 'comment', 'vote', 'vote', 'follow'])
+        self.assertEqual(rows[2]['user_id'], self.test_user.id)
+        self.assertEqual(rows[3]['post_id'], self.test_post.id)
+
+    def test_if_imports_with_new_ids(self):
+        call_command('export_board', str(self.path), stdout=StringIO())
+        call_command('import_board', str(self.path), batch_size=2, stdout=StringIO())
+        # users are matched by username, everything else is copied
+        self.assertEqual(User.objects.count(), 2)
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(Comment.objects.count(), 2)
+        self.assertEqual(Vote.objects.count(), 4)
+        imported_post = Post.objects.exclude(id=self.test_post.id).get()
+        self.test_post.refresh_from_db()
+        self.assertEqual(imported_post.created_at, self.test_post.created_at)
+        self.assertEqual((imported_post.user_id, imported_post.upvote_count, imported_post.comment_count), (self.test_user.id, 1, 1))
+        self.assertEqual(imported_post.comments.get().votes.get().user_id, self.test_user.id)
+        self.assertTrue(PostScore.objects.filter(post=imported_post).exists())
+        self.assertTrue(TimelineEntry.objects.filter(user=self.other_user, post=imported_post).exists())
+        self.assertEqual(UserStats.objects.get(user=self.test_user).follower_count, 1)
+        self.assertFalse(Path(f'{self.path}.checkpoint').exists())
+
+    def test_if_imports_threads(self):
+        test_comment = Comment.objects.get()
+        reply = Comment.objects.create(post=self.test_post, user=self.test_user, body='reply', parent=test_comment)
+        Comment.objects.create(post=self.test_post, user=self.other_user, body='nested reply', parent=reply)
+        call_command('export_board', str(self.path), stdout=StringIO())
+        # the nested reply is in the batch after its parent, the reply in the
+        # batch of its parent
+        call_command('import_board', str(self.path), batch_size=2, stdout=StringIO())
+        imported_post = Post.objects.exclude(id=self.test_post.id).get()
+        comments = list(imported_post.comments.order_by('path'))
+        self.assertEqual([comment.body for comment in comments], ['test comment', 'reply', 'nested reply'])
+        self.assertEqual([comment.parent_id for comment in comments], [None, comments[0].id, comments[1].id])
+        self.assertEqual([comment.depth for comment in comments], [0, 1, 2])
+        self.assertEqual(imported_post.comment_count, 3)
+
+    def test_if_rejects_replies_to_missing_comments(self):
+        call_command('export_board', str(self.path), stdout=StringIO())
+        rows = self.lines()
+        rows[3]['parent_id'] = 9999
+        self.write_lines(rows)
+        with self.assertRaisesMessage(CommandError, 'Line 4: Replies must be to an existing comment'):
+            call_command('import_board', str(self.path), stdout=StringIO())
+
+    def test_if_rejects_invalid_rows(self):
+        call_command('export_board', str(self.path), stdout=StringIO())
+        rows = self.lines()
+        rows[4]['value'] = 2
+        self.write_lines(rows)
+        with self.assertRaisesMessage(CommandError, 'Line 5: '):
+            call_command('import_board', str(self.path), stdout=StringIO())
+
+    def test_if_resumes_from_the_checkpoint(self):
+        call_command('export_board', str(self.path), stdout=StringIO())
+        rows = self.lines()
+        self.write_lines(rows[:5] + [{'type': 'vote'}] + rows[5:])
+        with self.assertRaises(CommandError):
+            call_command('import_board', str(self.path), batch_size=1, stdout=StringIO())
+        # the rows before the invalid one were imported and checkpointed
+        self.assertEqual(Vote.objects.count(), 3)
+        self.write_lines(rows[:5] + [{'type': 'comment', **rows[3], 'body': 'skipped'}] + rows[5:])
+        output = StringIO()
+        call_command('import_board', str(self.path), batch_size=1, stdout=output)
+        self.assertIn('Resuming after line 5', output.getvalue())
+        self.assertEqual(Vote.objects.count(), 4)
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(Follow.objects.count(), 1)
+
+class GenerateDataCommandTest(TestCase):
+
+    def test_if_generates_a_consistent_dataset(self):
+        call_command('generate_data', users=20, posts=50, comments=200, votes=1000, follows=5, stdout=StringIO())
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Post.objects.count(), 50)
+        self.assertEqual(Comment.objects.count(), 200)
+        self.assertGreater(Vote.objects.filter(value=Vote.UP).count(), Vote.objects.filter(value=Vote.DOWN).count())
+        post = Post.objects.order_by('-comment_count').first()
+        self.assertEqual(post.comment_count, post.comments.count())
+        self.assertEqual(post.upvote_count, post.votes.filter(value=Vote.UP).count())
+        self.assertEqual(PostScore.objects.count(), 50)
+        follower = Follow.objects.first().follower
+        self.assertEqual(follower.stats.followed_count, follower.followeds.count())
+        self.assertTrue(TimelineEntry.objects.filter(user=post.user, post=post).exists())
+        self.assertEqual(search('lorem', per_page=1)[1], True)
+
+
+class BenchmarkViewsCommandTest(TestCase):
+
+    def test_if_benchmarks_every_route(self):
+        call_command('generate_data', users=10, posts=300, comments=50, votes=100, stdout=StringIO())
+        posts = Post.objects.count()
+        with tempfile.TemporaryDirectory() as directory:
+            output = Path(directory) / 'benchmark.json'
+            call_command('benchmark_views', iterations=2, warmup=0, memory_iterations=1, output=str(output))
+            result = json.loads(output.read_text())
+        self.assertEqual(set(result['routes']), {str(pattern.pattern) for pattern in urlpatterns})
+        for route, stats in result['routes'].items():
+            self.assertTrue(set(stats['statuses']) <= {'200', '302'}, route)
+            self.assertGreaterEqual(stats['latency_ms']['p99'], stats['latency_ms']['p50'])
+        # writes are rolled back
+        self.assertEqual(Post.objects.count(), posts)
+
+
+class DatabaseProfileTest(SimpleTestCase):
+
+    @override_settings(SQLITE_PRAGMAS={'temp_store': 'MEMORY', 'cache_size': -1024})
+    def test_if_applies_pragmas_to_new_connections(self):
+        new_connection = connections.create_connection('default')
+        new_connection.settings_dict = dict(new_connection.settings_dict, NAME=':memory:')
+        try:
+            with new_connection.cursor() as cursor:
+                cursor.execute('PRAGMA temp_store')
+                self.assertEqual(cursor.fetchone()[0], 2)
+                cursor.execute('PRAGMA cache_size')
+                self.assertEqual(cursor.fetchone()[0], -1024)
+        finally:
+            new_connection.close()
+
+
+
+def query_plan(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+# the scans the board makes on purpose: name -> (plan step, whether the query
+# must be LIMITed). Keyset pages read the first rows of an ordered scan and
+# the follow graph is loaded whole.
+INTENTIONAL_SCANS = {
+    'post list page': ('SCAN main_post USING INDEX post_created_at_id_idx', True),
+    'hot post page': ('SCAN main_postscore USING INDEX postscore_hot_post_idx', True),
+    'user list page': ('SCAN auth_user', True),
+    'follow graph load': ('SCAN main_follow USING COVERING INDEX sqlite_autoindex_main_follow_1', False),
+}
+
+
+def plan_problems(sql, plan):
+    # any scan but the intentional ones, a sort in a temporary B-tree, or a
+    # plan searching nothing is a problem
+    def intentional(step):
+        return any(
+            step == scan and (' LIMIT ' in sql or not limited)
+            for scan, limited in INTENTIONAL_SCANS.values()
+        )
+
+    problems = [
+        step for step in plan
+        if (step.startswith('SCAN ') and not intentional(step)) or 'TEMP B-TREE' in step
+    ]
+    if not any(step.startswith('SEARCH ') or intentional(step) for step in plan):
+        problems.append('no SEARCH')
+    return problems
+
+
+@override_settings(TIMELINE_FANOUT_MAX_FOLLOWERS=2)
+class QueryPlanTest(TestCase):
+    """
+    Runs the hot paths of the board and checks the EXPLAIN QUERY PLAN of every
+    query they send, so a missing index fails here instead of in production.
+    """
+
+    def setUp(self):
+        self.test_user = User.objects.create_user(username='test', password='secret')
+        # the timeline merges in the posts of more than one celebrity
+        celebrities = [
+            User.objects.create_user(username=f'celebrity {i}', password='secret') for i in range(2)
+        ]
+        for i in range(2):
+            fan = User.objects.create_user(username=f'fan {i}', password='secret')
+            for celebrity in celebrities:
+                Follow.objects.create(follower=fan, followed=celebrity)
+        for celebrity in celebrities:
+            Follow.objects.create(follower=self.test_user, followed=celebrity)
+            Post.objects.create(user=celebrity, title='celebrity', body='lorem ipsum')
+        self.celebrity = celebrities[0]
+        self.test_post = Post.objects.create(user=self.test_user, title='test', body='lorem ipsum')
+        self.test_comment = Comment.objects.create(post=self.test_post, user=self.celebrity, body='test comment')
+        Comment.objects.create(post=self.test_post, parent=self.test_comment, user=self.test_user, body='test reply')
+        Vote.objects.create(post=self.test_post, user=self.celebrity, value=Vote.UP)
+        Vote.objects.create(comment=self.test_comment, user=self.celebrity, value=Vote.DOWN)
+        self.client.login(username='test', password='secret')
+
+    def assertIndexedQueries(self, action):
+        statements = []
+
+        def capture(execute, sql, params, many, context):
+            if not many and sql.lstrip().split(' ', 1)[0] in ('SELECT', 'UPDATE', 'DELETE'):
+                statements.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(capture):
+            action()
+        self.assertTrue(statements)
+        for sql, params in statements:
+            plan = query_plan(sql, params)
+            with self.subTest(sql=sql):
+                self.assertEqual(plan_problems(sql, plan), [], '\n'.join(plan))
+
+    def test_if_pages_are_read_through_indexes(self):
+        user_id = self.celebrity.id
+
+        def browse():
+            for path in (
+                '/', '/post/', '/post/hot/', f'/post/{self.test_post.id}/', '/search/?q=lorem',
+                f'/user/{user_id}/', f'/user/{user_id}/followers/', f'/user/{user_id}/followeds/',
+                f'/user/{user_id}/posts/', f'/user/{user_id}/comments/', f'/post/{self.test_post.id}/comments/',
+                '/api/posts/', f'/api/posts/{self.test_post.id}/', f'/api/posts/{self.test_post.id}/comments/',
+                '/api/users/', f'/api/users/{user_id}/', f'/api/users/{user_id}/followers/',
+                f'/api/users/{user_id}/followeds/'
+            ):
+                response = self.client.get(path)
+                self.assertEqual(response.status_code, 200, path)
+                if response.streaming:
+                    next_cursor = json.loads(b''.join(response.streaming_content)).get('next')
+                else:
+                    next_cursor = getattr((response.context or {}).get('page'), 'next_cursor', None)
+                if next_cursor:
+                    response = self.client.get(path, {'after': next_cursor})
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+
+        # pages of one row, so every list also has a next page to read
+        with override_settings(TIMELINE_PAGE_SIZE=1), \
+                mock.patch.object(views, 'POST_LIST_PAGE_SIZE', 1), \
+                mock.patch.object(views, 'USER_DETAIL_PAGE_SIZE', 1), \
+                mock.patch.object(views, 'POST_COMMENTS_PAGE_SIZE', 1), \
+                mock.patch.object(api, 'API_PAGE_SIZE', 1):
+            self.assertIndexedQueries(browse)
+
+    def test_if_writes_are_indexed(self):
+        def write():
+            self.client.post('/post/create/', {'title': 'new', 'body': 'new', 'user': self.test_user.id})
+            self.client.post(f'/post/{self.test_post.id}/comment/create/', {'body': 'new'})
+            self.client.post(f'/post/{self.test_post.id}/comment/create/', {'body': 'reply', 'parent': self.test_comment.id})
+            self.client.post(f'/post/{self.test_post.id}/upvote/create/')
+            self.client.post(f'/post/{self.test_post.id}/downvote/create/')
+            self.client.post(f'/post/{self.test_post.id}/comment/{self.test_comment.id}/upvote/create/')
+            self.client.post('/vote/batch/create/', json.dumps({'votes': [
+                {'direction': 'down', 'target': 'comment', 'id': self.test_comment.id}
+            ]}), content_type='application/json')
+            self.client.post(f'/user/{self.celebrity.id}/follow/delete/')
+            self.client.post(f'/user/{self.celebrity.id}/follow/create/')
+
+        self.assertIndexedQueries(write)
+
+    def test_if_votes_of_a_user_are_indexed(self):
+        def read():
+            list(self.celebrity.votes.filter(post__isnull=False).values_list('post_id', 'value'))
+            list(self.celebrity.votes.filter(comment__isnull=False).values_list('comment_id', 'value'))
+            list(self.celebrity.votes.values_list('id', flat=True))
+            list(Vote.objects.filter(user__in=[self.celebrity, self.test_user]).values_list('id', flat=True))
+
+        self.assertIndexedQueries(read)
+
+    def test_if_only_intentional_scans_pass(self):
+        sql = 'SELECT * FROM main_post ORDER BY created_at DESC, id DESC'
+        self.assertEqual(plan_problems(sql + ' LIMIT 2', ['SCAN main_post USING INDEX post_created_at_id_idx']), [])
+        # the same scan without a limit reads every post
+        self.assertEqual(
+            plan_problems(sql, ['SCAN main_post USING INDEX post_created_at_id_idx']),
+            ['SCAN main_post USING INDEX post_created_at_id_idx', 'no SEARCH']
+        )
+        self.assertEqual(
+            plan_problems(sql + ' LIMIT 2', ['SCAN main_comment USING INDEX comment_post_created_at_id_idx']),
+            ['SCAN main_comment USING INDEX comment_post_created_at_id_idx', 'no SEARCH']
+        )
+
+    def test_if_follow_graph_is_read_through_indexes(self):
+        self.assertIndexedQueries(FollowGraph.load)
+
+    def test_if_replies_are_read_through_indexes(self):
+        self.assertIndexedQueries(lambda: list(self.test_comment.descendants()))
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1', 'replica_2'])
+class ReplicaRouterTest(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_if_safe_requests_read_from_a_replica(self):
+        request = self.factory.get('/post/')
+        self.assertIn(choose_read_database(request), ['replica_1', 'replica_2'])
+
+    def test_if_writes_and_sticky_clients_read_from_the_primary(self):
+        self.assertEqual(choose_read_database(self.factory.post('/post/1/upvote/create/')), 'default')
+        request = self.factory.get('/post/')
+        request.COOKIES[STICKY_COOKIE] = '1'
+        self.assertEqual(choose_read_database(request), 'default')
+
+    def test_if_routes_reads_to_the_chosen_database(self):
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Post))
+        token = read_database.set('replica_1')
+        try:
+            self.assertEqual(router.db_for_read(Post), 'replica_1')
+            self.assertEqual(router.db_for_write(Post), 'default')
+        finally:
+            read_database.reset(token)
+        self.assertFalse(router.allow_migrate('replica_1', 'main'))
+        self.assertTrue(router.allow_migrate('default', 'main'))
+
+    def test_if_writes_pin_the_client_to_the_primary(self):
+        test_user = User.objects.create_user(username='test', password='secret')
+        test_post = Post.objects.create(user=test_user, title='test', body='test')
+        self.client.login(username='test', password='secret')
+        response = self.client.post(f'/post/{test_post.id}/upvote/create/')
+        self.assertEqual(response.cookies[STICKY_COOKIE]['max-age'], settings.REPLICA_STICKY_SECONDS)
+
+
+class AsyncReadViewTest(TransactionTestCase):
+    # worker threads use their own connections, so data must be committed
+
+    def setUp(self):
+        self.factory = AsyncRequestFactory()
+        self.test_user = User.objects.create_user(username='test', password='secret')
+        self.test_post = Post.objects.create(user=self.test_user, title='test', body='test body')
+        Comment.objects.create(post=self.test_post, user=self.test_user, body='test comment')
+
+    def get(self, view, path, id):
+        request = self.factory.get(path)
+        request.user = AnonymousUser()
+        return async_to_sync(view)(request, id)
+
+    def test_if_loads_queries_concurrently(self):
+        queries = {
+            'posts': lambda: list(Post.objects.all()),
+            'comments': lambda: list(Comment.objects.all())
+        }
+        self.assertEqual(async_to_sync(aload)(queries), load(queries))
+
+    def test_if_renders_user_detail(self):
+        response = self.get(async_views.user_detail_view, f'/user/{self.test_user.id}/', self.test_user.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'test comment', response.content)
+        self.assertIn('ETag', response)
+
+    def test_if_renders_post_detail(self):
+        response = self.get(async_views.post_detail_view, f'/post/{self.test_post.id}/', self.test_post.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'test body', response.content)
+        self.assertIn(b'test comment', response.content)
+
+    def test_if_returns_not_found(self):
+        with self.assertRaises(Http404):
+            self.get(async_views.post_detail_view, '/post/0/', 0)
+
+
+class VoteMigrationTest(TransactionTestCase):
+    """
+    Migrates back to the separate upvote and downvote tables, seeds them and
+    migrates forward to the single vote table.
+    """
+
+    before = [('main', '0016_user_detail_indexes')]
+    after = [('main', '0017_vote')]
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate(self.before)
+        self.executor.loader.build_graph()
+
+    def tearDown(self):
+        self.executor.loader.build_graph()
+        self.executor.migrate(self.executor.loader.graph.leaf_nodes())
+
+    def test_if_merges_upvotes_and_downvotes(self):
+        apps = self.executor.loader.project_state(self.before).apps
+        HistoricalUser = apps.get_model('auth', 'User')
+        HistoricalPost = apps.get_model('main', 'Post')
+        HistoricalComment = apps.get_model('main', 'Comment')
+        Upvote = apps.get_model('main', 'Upvote')
+        Downvote = apps.get_model('main', 'Downvote')
+        author, voter, fickle = [HistoricalUser.objects.create(username=name) for name in ('author', 'voter', 'fickle')]
+        post = HistoricalPost.objects.create(user=author, title='test', body='test')
+        comment = HistoricalComment.objects.create(post=post, user=author, body='test')
+        Upvote.objects.create(post=post, user=voter)
+        Downvote.objects.create(comment=comment, user=voter)
+        # fickle voted up then down on the post, down then up on the comment
+        now = timezone.now()
+        Upvote.objects.create(post=post, user=fickle)
+        Downvote.objects.create(post=post, user=fickle)
+        Downvote.objects.create(comment=comment, user=fickle)
+        Upvote.objects.create(comment=comment, user=fickle)
+        Upvote.objects.filter(post=post, user=fickle).update(created_at=now - timedelta(minutes=2))
+        Downvote.objects.filter(post=post, user=fickle).update(created_at=now - timedelta(minutes=1))
+        Downvote.objects.filter(comment=comment, user=fickle).update(created_at=now - timedelta(minutes=2))
+        Upvote.objects.filter(comment=comment, user=fickle).update(created_at=now - timedelta(minutes=1))
+
+        self.executor.loader.build_graph()
+        self.executor.migrate(self.after)
+        apps = self.executor.loader.project_state(self.after).apps
+        HistoricalVote = apps.get_model('main', 'Vote')
+        votes = HistoricalVote.objects.values_list('post_id', 'comment_id', 'user_id', 'value')
+        self.assertCountEqual(votes, [
+            (post.id, None, voter.id, 1),
+            (None, comment.id, voter.id, -1),
+            (post.id, None, fickle.id, -1),
+            (None, comment.id, fickle.id, 1),
+        ])
+        post = apps.get_model('main', 'Post').objects.get(id=post.id)
+        comment = apps.get_model('main', 'Comment').objects.get(id=comment.id)
+        self.assertEqual((post.upvote_count, post.downvote_count), (1, 1))
+        self.assertEqual((comment.upvote_count, comment.downvote_count), (1, 1))
@@ -0,0 +1,98 @@
+from heapq import merge
+from django.conf import settings
+from django.db import connection, transaction
+from main.models import (
+    Post,
+    Follow,
+    TimelineEntry
+)
+from main.pagination import (
+    KeysetPage,
+    decode_cursor,
+    encode_cursor,
+    keyset_filter
+)
+
+
+def read_timeline(user, after=None, per_page=None):
+    """
+    Returns a page of the home timeline of user, newest first.
+
+    Fanned out posts are one range scan over the user's TimelineEntry index;
+    posts of each followed celebrity are read from their own post index and
+    merged in. Raises InvalidCursor if after can not be decoded.
+    """
+    per_page = per_page or settings.TIMELINE_PAGE_SIZE
+
+    entries = TimelineEntry.objects.filter(user=user)
+    if after is not None:
+        values = decode_cursor(after, TimelineEntry, ['created_at', 'post_id'])
+        entries = entries.filter(keyset_filter(['created_at', 'post_id'], values, 'lt'))
+    fanned_out = [
+        entry.post for entry in
+        entries.select_related('post', 'post__user')
+        .order_by('-created_at', '-post_id')[:per_page + 1]
+    ]
+
+    celebrity_ids = list(
+        Follow.objects.filter(
+            follower=user,
+            followed__stats__follower_count__gte=settings.TIMELINE_FANOUT_MAX_FOLLOWERS
+        ).values_list('followed_id', flat=True)
+    )
+    # one query per celebrity: with user_id IN (...) the newest posts of all
+    # of them would be sorted in a temporary B-tree, one range scan each is not
+    merged_in = []
+    for celebrity_id in celebrity_ids:
+        posts = Post.objects.filter(user_id=celebrity_id)
+        if after is not None:
+            posts = posts.filter(keyset_filter(['created_at', 'id'], values, 'lt'))
+        merged_in.append(
+            posts.select_related('user')
+            .order_by('-created_at', '-id')[:per_page + 1]
+        )
+
+    def newest_first(post):
+        return (post.created_at, post.id)
+
+    rows = []
+    seen = set()
+    for post in merge(fanned_out, *merged_in, key=newest_first, reverse=True):
+        # posts fanned out before their author became a celebrity show up twice
+        if post.id not in seen:
+            seen.add(post.id)
+            rows.append(post)
+
+    object_list = rows[:per_page]
+    next_cursor = None
+    if len(rows) > per_page:
+        next_cursor = encode_cursor(newest_first(object_list[-1]))
+    return KeysetPage(object_list, next_cursor, None)
+
+
+def fill_timelines(after_post_id, batch_size):
+    """
+    Fans out the posts with an id above after_post_id, inserted in bulk, as
+    Post.save would have: to their author and to the followers of authors
+    who are not celebrities. One INSERT ... SELECT per batch_size posts.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT MAX(id) FROM main_post')
+        last_post_id = cursor.fetchone()[0] or 0
+    for start in range(after_post_id, last_post_id, batch_size):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT OR IGNORE INTO main_timelineentry (user_id, post_id, created_at) '
+                'SELECT user_id, id, created_at FROM main_post WHERE id > %s AND id <= %s',
+                [start, start + batch_size]
+            )
+            cursor.execute(
+                'INSERT OR IGNORE INTO main_timelineentry (user_id, post_id, created_at) '
+                'SELECT main_follow.follower_id, main_post.id, main_post.created_at '
+                'FROM main_post '
+                'JOIN main_follow ON main_follow.followed_id = main_post.user_id '
+                'LEFT JOIN main_userstats ON main_userstats.user_id = main_post.user_id '
+                'WHERE main_post.id > %s AND main_post.id <= %s '
+                'AND COALESCE(main_userstats.follower_count, 0) < %s',
+                [start, start + batch_size, settings.TIMELINE_FANOUT_MAX_FOLLOWERS]
+            )
@@ -1,6 +1,9 @@
+from django.conf import settings
 from django.urls import path
+from main import api, async_views
 from main.views import (
     home_view,
+    search_view,
     post_comment_downvote_create_view,
     post_comment_upvote_create_view,
     post_upvote_create_view,
@@ -9,31 +12,55 @@ from main.views import (
     user_login_view,
     user_list_view,
     user_detail_view,
+    user_section_view,
     post_list_view,
+    post_hot_view,
     post_create_view,
     post_detail_view,
     post_comment_create_view,
+    post_comment_page_view,
     post_downvote_create_view,
     user_follow_delete_view,
+    vote_batch_create_view,
     user_logout_view
 )
 
 
+if settings.ASYNC_READ_VIEWS:
+    user_detail_view = async_views.user_detail_view
+    post_detail_view = async_views.post_detail_view
+
+
 urlpatterns = [
     path('', home_view),
+    path('search/', search_view),
     path('user/', user_list_view),
     path('user/create/', user_create_view),
     path('user/login/', user_login_view),
     path('user/logout/', user_logout_view),
     path('user/<id>/', user_detail_view), # paths with variables should be last
+    path('user/<id>/followers/', user_section_view, {'section': 'followers'}),
+    path('user/<id>/followeds/', user_section_view, {'section': 'followeds'}),
+    path('user/<id>/posts/', user_section_view, {'section': 'posts'}),
+    path('user/<id>/comments/', user_section_view, {'section': 'comments'}),
     path('user/<id>/follow/create/', user_follow_create_view),
     path('user/<id>/follow/delete/', user_follow_delete_view),
     path('post/', post_list_view),
     path('post/create/', post_create_view),
+    path('post/hot/', post_hot_view),
     path('post/<id>/', post_detail_view), # paths with variables should be last
     path('post/<id>/comment/create/', post_comment_create_view), # paths with variables should be last
+    path('post/<id>/comments/', post_comment_page_view),
     path('post/<id>/upvote/create/', post_upvote_create_view),
     path('post/<id>/downvote/create/', post_downvote_create_view),
     path('post/<post_id>/comment/<comment_id>/upvote/create/', post_comment_upvote_create_view),
     path('post/<post_id>/comment/<comment_id>/downvote/create/', post_comment_downvote_create_view),
+    path('vote/batch/create/', vote_batch_create_view),
+    path('api/posts/', api.post_list_view),
+    path('api/posts/<int:id>/', api.post_detail_view),
+    path('api/posts/<int:id>/comments/', api.post_comment_list_view),
+    path('api/users/', api.user_list_view),
+    path('api/users/<int:id>/', api.user_detail_view),
+    path('api/users/<int:id>/followers/', api.user_follow_list_view, {'relation': 'followers'}),
+    path('api/users/<int:id>/followeds/', api.user_follow_list_view, {'relation': 'followeds'}),
 ]
@@ -1,11 +1,17 @@
+import json
+from django.conf import settings
+from django.db import transaction
 from django.forms import ValidationError
-from django.http import Http404
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
+from django.views.decorators.http import require_POST
 from django.shortcuts import (
     get_object_or_404,
     render,
     redirect
 )
 from django.contrib.auth.models import User
+from django.db.models import F
+from django.db.models.functions import Coalesce
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import (
     authenticate,
@@ -18,32 +24,172 @@ from main.forms import (
     PostCreateForm,
     UserLoginForm
 )
+from main.pagination import (
+    InvalidCursor,
+    keyset_paginate
+)
+from main.conditional import (
+    conditional,
+    post_detail_validators,
+    post_list_validators,
+    user_detail_validators
+)
+from main.fragments import (
+    comment_body_fragment,
+    comment_votes_fragment,
+    post_body_fragment,
+    post_votes_fragment,
+    render_fragments
+)
+from main.graph import follow_changed, follow_graph
+from main.loading import load
+from main.routers import read_from_replica
+from main.search import search
+from main.timeline import read_timeline
+from main.votes import (
+    VoteBatchError,
+    ingest_votes,
+    save_vote
+)
 from main.models import (
     Post,
+    PostScore,
     Comment,
-    Upvote,
-    Downvote,
-    Follow
+    Vote,
+    Follow,
+    count_subquery
 )
 
 
+POST_LIST_PAGE_SIZE = 20
+USER_DETAIL_PAGE_SIZE = 10
+POST_COMMENTS_PAGE_SIZE = 50
+
+SEARCH_PAGE_SIZE = 20
+# results are ranked, so every page reads the matches of the pages before it
+SEARCH_MAX_PAGE = 50
+
+
 def home_view(request):
-    return render(request, 'main/home.html')
+    if not request.user.is_authenticated:
+        return render(request, 'main/home.html')
+    try:
+        page = read_timeline(request.user, after=request.GET.get('after'))
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor')
+    return render(request, 'main/home.html', {
+        'post_list': page.object_list,
+        'page': page
+    })
 
 
+def search_view(request):
+    query = request.GET.get('q', '')
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        return HttpResponseBadRequest('Invalid page')
+    if page > SEARCH_MAX_PAGE:
+        return HttpResponseBadRequest(f'Pages go up to {SEARCH_MAX_PAGE}')
+    results, has_next = search(query, page=page, per_page=SEARCH_PAGE_SIZE)
+    return render(request, 'main/search.html', {
+        'query': query,
+        'results': results,
+        'page': page,
+        'previous_page': page - 1 if page > 1 else None,
+        'next_page': page + 1 if has_next and page < SEARCH_MAX_PAGE else None
+    })
+
+
+@read_from_replica
 def user_list_view(request):
     user_list = User.objects.all()
     return render(request, 'main/user/list.html', {'user_list': user_list})
 
 
+# sections of the user detail, each capped to a page with its own "more"
+# endpoint; only the columns shown are loaded, with related rows joined
+USER_DETAIL_SECTIONS = {
+    'followers': lambda id: Follow.objects.filter(followed_id=id)
+        .select_related('follower')
+        .only('created_at', 'follower__username'),
+    'followeds': lambda id: Follow.objects.filter(follower_id=id)
+        .select_related('followed')
+        .only('created_at', 'followed__username'),
+    'posts': lambda id: Post.objects.filter(user_id=id)
+        .only('title', 'created_at'),
+    'comments': lambda id: Comment.objects.filter(user_id=id)
+        .select_related('post')
+        .only('body', 'created_at', 'upvote_count', 'downvote_count', 'post__title'),
+}
+
+
+def user_with_totals(id):
+    # one query for the user and the totals of every section
+    return get_object_or_404(
+        User.objects.annotate(
+            follower_total=Coalesce(F('stats__follower_count'), 0),
+            followed_total=Coalesce(F('stats__followed_count'), 0),
+            post_total=count_subquery(Post, 'user'),
+            comment_total=count_subquery(Comment, 'user')
+        ),
+        id=id
+    )
+
+
+def user_section_page(section, id, after=None, before=None):
+    return keyset_paginate(
+        USER_DETAIL_SECTIONS[section](id),
+        after=after,
+        before=before,
+        per_page=USER_DETAIL_PAGE_SIZE
+    )
+
+
+def follow_suggestions(user_id):
+    # ranked in memory by the follow graph, one query reads their usernames
+    ranked = follow_graph().suggestions(user_id, settings.FOLLOW_SUGGESTION_LIMIT)
+    users = User.objects.only('username').in_bulk([id for id, _ in ranked])
+    return [(users[id], count) for id, count in ranked if id in users]
+
+
+def user_detail_queries(id, viewer_id=None):
+    # independent of each other, so async views can run them concurrently
+    queries = {'user_model': lambda: user_with_totals(id)}
+    for section in USER_DETAIL_SECTIONS:
+        queries[f'{section}_page'] = lambda section=section: user_section_page(section, id)
+    # users see who to follow on their own page
+    if viewer_id is not None and str(viewer_id) == str(id):
+        queries['suggestions'] = lambda: follow_suggestions(viewer_id)
+    return queries
+
+
+@read_from_replica
+@conditional(user_detail_validators)
 def user_detail_view(request, id):
+    return render(request, 'main/user/detail.html', load(user_detail_queries(id, request.user.id)))
+
+
+@read_from_replica
+@conditional(user_detail_validators)
+def user_section_view(request, id, section):
+    user_model = get_object_or_404(User.objects.only('username'), id=id)
     try:
-        user = User.objects.get(id=id)
-        return render(request, 'main/user/detail.html', {
-            'user_model': user
-        })
-    except User.DoesNotExist:
-        raise Http404
+        page = user_section_page(
+            section,
+            id,
+            after=request.GET.get('after'),
+            before=request.GET.get('before')
+        )
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor')
+    return render(request, 'main/user/section.html', {
+        'user_model': user_model,
+        'section': section,
+        'section_template': f'main/user/sections/{section}.html',
+        'page': page,
+        'page_url': f'/user/{user_model.id}/{section}/'
+    })
 
 
 def user_create_view(request):
@@ -90,21 +236,121 @@ def user_logout_view(request):
     return redirect('/')
 
 
+@read_from_replica
+@conditional(post_list_validators)
 def post_list_view(request):
-    post_list = Post.objects.all()
-    return render(request, 'main/post/list.html', {'post_list': post_list})
+    try:
+        page = keyset_paginate(
+            Post.objects.all(),
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+            per_page=POST_LIST_PAGE_SIZE
+        )
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor')
+    return render(request, 'main/post/list.html', {
+        'post_list': page.object_list,
+        'page': page,
+        'page_url': '/post/'
+    })
+
+
+def post_hot_view(request):
+    try:
+        page = keyset_paginate(
+            PostScore.objects.select_related('post'),
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+            per_page=POST_LIST_PAGE_SIZE,
+            fields=('hot', 'post_id')
+        )
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor')
+    return render(request, 'main/post/list.html', {
+        'post_list': [score.post for score in page],
+        'page': page,
+        'page_url': '/post/hot/'
+    })
+
+
+def post_comments_page(id, after=None):
+    # a page of the thread, whatever its length: a range scan of the path index
+    return keyset_paginate(
+        Comment.objects.filter(post_id=id).select_related('user'),
+        after=after,
+        per_page=POST_COMMENTS_PAGE_SIZE,
+        fields=('path',),
+        ascending=True
+    )
+
+
+def comment_fragments(comments):
+    fragments = []
+    for comment in comments:
+        fragments += [comment_body_fragment(comment), comment_votes_fragment(comment)]
+    return fragments
+
+
+def comment_items(comments, rendered):
+    # (comment, body, votes) of every comment, from its rendered fragments
+    return [
+        (comment, rendered[2 * i], rendered[2 * i + 1])
+        for i, comment in enumerate(comments)
+    ]
+
+
+def post_detail_queries(id):
+    # two queries whatever the thread size: the post with its author, and the
+    # first page of comments with their authors (vote tallies are
+    # denormalized columns)
+    return {
+        'post': lambda: get_object_or_404(Post.objects.select_related('user'), id=id),
+        'page': lambda: post_comments_page(id),
+    }
 
 
+@read_from_replica
+@conditional(post_detail_validators)
 def post_detail_view(request, id):
-    post = get_object_or_404(Post, id=id)
+    return render_post_detail(request, **load(post_detail_queries(id)))
+
+
+def render_post_detail(request, post, page):
+    post_body, post_votes, *comments = render_fragments(
+        [post_body_fragment(post), post_votes_fragment(post)] + comment_fragments(page)
+    )
     comment_form = PostCommentCreateForm()
     context = {
         'post': post,
+        'post_body': post_body,
+        'post_votes': post_votes,
+        'comment_list': comment_items(page, comments),
+        'page': page,
         'comment_form': comment_form
     }
     return render(request, 'main/post/detail.html', context)
 
 
+@read_from_replica
+@conditional(post_detail_validators)
+def post_comment_page_view(request, id):
+    """
+    The comments following the cursor, as the list items the post detail
+    appends when "Load more comments" is clicked.
+    """
+    try:
+        page = post_comments_page(id, after=request.GET.get('after'))
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor')
+    if not page and not Post.objects.filter(id=id).exists():
+        raise Http404('Post does not exist')
+    return render(request, 'main/post/comments.html', {
+        'post_id': id,
+        'comment_list': comment_items(page, render_fragments(comment_fragments(page))),
+        'page': page
+    })
+
+
 @login_required(login_url='/user/login/', redirect_field_name=None)
 def post_create_view(request):
 
@@ -125,11 +371,13 @@ def post_create_view(request):
 def post_comment_create_view(request, id):
     
     if request.method == 'POST':
-        post_comment_create_form = PostCommentCreateForm(request.POST)
+        post = Post.objects.get(id=id)
+        # post set before validation, which checks replies are on their post
+        post_comment_create_form = PostCommentCreateForm(
+            request.POST,
+            instance=Comment(post=post, user=request.user)
+        )
         if post_comment_create_form.is_valid():
-            post = Post.objects.get(id=id)
-            post_comment_create_form.instance.post = post
-            post_comment_create_form.instance.user = request.user
             post_comment_create_form.save()
             return redirect(f'/post/{id}/')
         else:
@@ -141,9 +389,8 @@ def post_upvote_create_view(request, id):
     
     if request.method == 'POST':
         post = Post.objects.get(id=id)
-        upvote = Upvote(post=post, user=request.user)
-        upvote.full_clean()
-        upvote.save()
+        vote = Vote(post=post, user=request.user, value=Vote.UP)
+        save_vote(vote)
         return redirect(f'/post/{id}/')
 
 @login_required(login_url='/user/login/', redirect_field_name=None)
@@ -151,9 +398,8 @@ def post_downvote_create_view(request, id):
     
     if request.method == 'POST':
         post = Post.objects.get(id=id)
-        downvote = Downvote(post=post, user=request.user)
-        downvote.full_clean()
-        downvote.save()
+        vote = Vote(post=post, user=request.user, value=Vote.DOWN)
+        save_vote(vote)
         return redirect(f'/post/{id}/')
 
 @login_required(login_url='/user/login/', redirect_field_name=None)
@@ -161,9 +407,8 @@ def post_comment_upvote_create_view(request, post_id, comment_id):
     
     if request.method == 'POST':
         comment = Comment.objects.get(id=comment_id)
-        upvote = Upvote(comment=comment, user=request.user)
-        upvote.full_clean()
-        upvote.save()
+        vote = Vote(comment=comment, user=request.user, value=Vote.UP)
+        save_vote(vote)
         return redirect(f'/post/{post_id}/')
 
 
@@ -172,12 +417,30 @@ def post_comment_downvote_create_view(request, post_id, comment_id):
     
     if request.method == 'POST':
         comment = Comment.objects.get(id=comment_id)
-        downvote = Downvote(comment=comment, user=request.user)
-        downvote.full_clean()
-        downvote.save()
+        vote = Vote(comment=comment, user=request.user, value=Vote.DOWN)
+        save_vote(vote)
         return redirect(f'/post/{post_id}/')
 
 
+@login_required(login_url='/user/login/', redirect_field_name=None)
+@require_POST
+def vote_batch_create_view(request):
+    # {"votes": [{"direction": "up", "target": "post", "id": 1}, ...]}, staff
+    # members may also set "user" to import votes of other users
+    try:
+        payload = json.loads(request.body)
+        votes = payload['votes']
+        results = ingest_votes(votes, request.user, allow_other_users=request.user.is_staff)
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse({'error': 'Body must be a JSON object with a votes list'}, status=400)
+    except VoteBatchError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    return JsonResponse({
+        'created': sum(1 for result in results if result['status'] == 'created'),
+        'results': results
+    })
+
+
 @login_required(login_url='/user/login/', redirect_field_name=None)
 def user_follow_create_view(request, id):
     
@@ -186,6 +449,7 @@ def user_follow_create_view(request, id):
         follow = Follow(follower=request.user, followed=followed)
         follow.full_clean()
         follow.save()
+        transaction.on_commit(lambda: follow_changed(follow.follower_id, follow.followed_id, following=True))
         return redirect(f'/user/{id}/')
 
 
@@ -196,4 +460,5 @@ def user_follow_delete_view(request, id):
         followed = User.objects.get(id=id)
         follow = Follow.objects.get(follower=request.user, followed=followed)
         follow.delete()
+        transaction.on_commit(lambda: follow_changed(follow.follower_id, follow.followed_id, following=False))
         return redirect(f'/user/{id}/')
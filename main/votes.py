@@ -0,0 +1,210 @@
+from collections import defaultdict
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from main import journal
+from main.models import (
+    Post,
+    PostScore,
+    Comment,
+    Vote,
+    UserStats,
+    tally_field
+)
+
+
+VOTE_VALUES = {
+    'up': Vote.UP,
+    'down': Vote.DOWN
+}
+
+TARGET_MODELS = {
+    'post': Post,
+    'comment': Comment
+}
+
+
+class VoteBatchError(Exception):
+    pass
+
+
+def parse_vote(item, user, allow_other_users):
+    """
+    Returns (direction, target, target_id, user_id) of a batch item, or an
+    error result for it.
+    """
+    if not isinstance(item, dict):
+        return {'status': 'invalid', 'error': 'Vote must be an object'}
+    direction = item.get('direction')
+    target = item.get('target')
+    target_id = item.get('id')
+    user_id = item.get('user', user.id if user else None)
+    if direction not in VOTE_VALUES:
+        return {'status': 'invalid', 'error': 'Direction must be up or down'}
+    if target not in TARGET_MODELS:
+        return {'status': 'invalid', 'error': 'Target must be post or comment'}
+    if type(target_id) is not int or type(user_id) is not int:
+        return {'status': 'invalid', 'error': 'Ids must be integers'}
+    if not allow_other_users and user_id != user.id:
+        return {'status': 'forbidden', 'error': 'Can not vote as another user'}
+    return direction, target, target_id, user_id
+
+
+def ingest_votes(items, user, allow_other_users=False):
+    """
+    Validates and inserts a batch of votes, returning one result per item:
+    created, switched (the vote existed in the other direction), exists
+    (already voted), superseded (a later item of the batch votes on the same
+    target), not_found, invalid or forbidden.
+
+    Votes are written in chunks of VOTE_BATCH_CHUNK_SIZE, one transaction
+    each, and the counters of the voted posts and comments are updated once
+    per chunk, by the votes the chunk created or switched.
+    """
+    if not isinstance(items, list):
+        raise VoteBatchError('Votes must be a list')
+    if len(items) > settings.VOTE_BATCH_MAX_SIZE:
+        raise VoteBatchError(f'At most {settings.VOTE_BATCH_MAX_SIZE} votes per batch')
+
+    results = [None] * len(items)
+    parsed = []
+    for index, item in enumerate(items):
+        vote = parse_vote(item, user, allow_other_users)
+        if isinstance(vote, dict):
+            results[index] = vote
+        else:
+            parsed.append((index, vote))
+
+    chunk_size = settings.VOTE_BATCH_CHUNK_SIZE
+    for start in range(0, len(parsed), chunk_size):
+        with transaction.atomic():
+            ingest_chunk(parsed[start:start + chunk_size], results)
+    return results
+
+
+def lock_votes():
+    """
+    Takes the write lock of the database for the rest of the transaction, so
+    the votes read next are not changed by other writers before the chunk is
+    written. SQLite takes it on the first write, even one matching no row.
+    """
+    with transaction.get_connection().cursor() as cursor:
+        cursor.execute(f'UPDATE {Vote._meta.db_table} SET value = value WHERE id = 0')
+
+
+def ingest_chunk(chunk, results):
+    # the last vote of a user on a target wins, as if voted one by one
+    latest = {}
+    for index, (direction, target, target_id, user_id) in chunk:
+        key = (target, target_id, user_id)
+        if key in latest:
+            results[latest[key]] = {'status': 'superseded'}
+        latest[key] = index
+    chunk = [(index, vote) for index, vote in chunk if latest[vote[1:]] == index]
+
+    target_ids = {target: set() for target in TARGET_MODELS}
+    user_ids = set()
+    for index, (direction, target, target_id, user_id) in chunk:
+        target_ids[target].add(target_id)
+        user_ids.add(user_id)
+
+    posts = set(Post.objects.filter(id__in=target_ids['post']).values_list('id', flat=True))
+    comments = {
+        id: (post_id, author_id) for id, post_id, author_id in
+        Comment.objects.filter(id__in=target_ids['comment']).values_list('id', 'post_id', 'user_id')
+    }
+    existing_targets = {'post': posts, 'comment': comments}
+    users = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+
+    lock_votes()
+    existing_votes = {}
+    for target in TARGET_MODELS:
+        if not target_ids[target]:
+            continue
+        rows = Vote.objects.filter(**{
+            f'{target}_id__in': target_ids[target],
+            'user_id__in': user_ids
+        }).values_list(f'{target}_id', 'user_id', 'id', 'value')
+        for target_id, user_id, id, value in rows:
+            existing_votes[(target, target_id, user_id)] = (id, value)
+
+    new_votes = []
+    switched_votes = []
+    # target -> target id -> tally field -> amount
+    tallies = {target: defaultdict(lambda: defaultdict(int)) for target in TARGET_MODELS}
+    for index, (direction, target, target_id, user_id) in chunk:
+        key = (target, target_id, user_id)
+        value = VOTE_VALUES[direction]
+        if target_id not in existing_targets[target]:
+            results[index] = {'status': 'not_found', 'error': f'{target.capitalize()} does not exist'}
+        elif user_id not in users:
+            results[index] = {'status': 'not_found', 'error': 'User does not exist'}
+        elif key not in existing_votes:
+            new_votes.append(Vote(**{f'{target}_id': target_id, 'user_id': user_id, 'value': value}))
+            tallies[target][target_id][tally_field(value)] += 1
+            results[index] = {'status': 'created'}
+        elif existing_votes[key][1] != value:
+            switched_votes.append(Vote(id=existing_votes[key][0], value=value))
+            tallies[target][target_id][tally_field(value)] += 1
+            tallies[target][target_id][tally_field(existing_votes[key][1])] -= 1
+            results[index] = {'status': 'switched'}
+        else:
+            results[index] = {'status': 'exists'}
+
+    # the votes were read under the write lock, so these are the rows
+    # written and the tallies move by exactly what they change
+    Vote.objects.bulk_create(new_votes)
+    Vote.objects.bulk_update(switched_votes, ['value'])
+    voted = {target: set(tallies[target]) for target in TARGET_MODELS}
+    if not voted['post'] and not voted['comment']:
+        return
+
+    for target, model in TARGET_MODELS.items():
+        # one UPDATE per distinct change, which few targets of a chunk differ by
+        changes = defaultdict(list)
+        for target_id, amounts in tallies[target].items():
+            changes[tuple(sorted(amounts.items()))].append(target_id)
+        for amounts, ids in changes.items():
+            model.objects.filter(id__in=ids).update(**{
+                field: F(field) + amount for field, amount in amounts if amount
+            })
+
+    now = timezone.now()
+    if voted['post']:
+        PostScore.refresh_many(voted['post'], now)
+    if voted['comment']:
+        UserStats.touch_many({comments[id][1] for id in voted['comment']})
+    changed_posts = voted['post'] | {comments[id][0] for id in voted['comment']}
+    Post.objects.filter(id__in=changed_posts).update(changed_at=now)
+
+
+def save_vote(vote):
+    """
+    Saves a Vote built by a vote view, switching the existing vote of the
+    user on the target if any. In write-behind mode (VOTE_WRITE_BEHIND) the
+    vote is appended to the journal instead, and committed later by the
+    flush_votes command.
+    """
+    if not settings.VOTE_WRITE_BEHIND:
+        # an existing vote is switched by save, not a uniqueness error
+        vote.full_clean(validate_unique=False)
+        vote.save()
+        return
+    direction = 'up' if vote.value == Vote.UP else 'down'
+    if vote.post_id is not None:
+        journal.append_vote(direction, 'post', vote.post_id, vote.user_id)
+    else:
+        journal.append_vote(direction, 'comment', vote.comment_id, vote.user_id)
+
+
+def flush_votes(batch_size=None):
+    """
+    Commits the votes waiting in the journal, one transaction per batch, and
+    returns how many were read.
+    """
+    def ingest(batch):
+        with transaction.atomic():
+            ingest_votes(batch, None, allow_other_users=True)
+    return journal.flush(ingest, batch_size)